@@ -0,0 +1,184 @@
+import os
+import sys
+import json
+import time
+import random
+import argparse
+import threading
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from invoice_analysis import MODEL_ID, analyze_invoice, get_bedrock_client
+from invoice_extract import extract_invoice, summarize_invoice
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from aws_common.json_stream import iter_json_records
+from aws_common.runtime import call_stats, is_throttle, set_max_concurrency
+
+# Headless bulk invoice processing.
+#
+# Streams invoices from a JSON array or JSON Lines file and runs analyze_invoice on a
+# bounded pool of workers sharing one pooled client. Invoices the local extractor can
+# parse never reach Bedrock; each result records the tier that handled it. Request starts are paced by an
+# AIMD rate limiter: the rate grows additively while calls succeed and is cut
+# multiplicatively when Bedrock throttles. Each result is appended to a JSON Lines
+# output file as soon as it arrives; on restart, invoices that already have a result
+# there are skipped, so an interrupted run never pays for the same invoice twice.
+#
+#   python bulk_process.py invoices.jsonl results.jsonl --concurrency 16
+
+class AIMDRateLimiter:
+    def __init__(self, rate=5.0, min_rate=0.5, max_rate=100.0, increase=1.0, decrease=0.5, cooldown=1.0):
+        self.rate = rate  # requests per second
+        self.min_rate = min_rate
+        self.max_rate = max_rate
+        self.increase = increase  # requests/s added per second of successful calls
+        self.decrease = decrease  # factor applied on throttling
+        self.cooldown = cooldown  # one cut per cooldown, so a burst of throttles counts once
+        self.lock = threading.Lock()
+        self.next_start = time.monotonic()
+        self.last_cut = 0.0
+        self.throttles = 0
+
+    # Blocks until the caller may start a request
+    def acquire(self):
+        with self.lock:
+            now = time.monotonic()
+            start = max(now, self.next_start)
+            self.next_start = start + 1.0 / self.rate
+        delay = start - now
+        if delay > 0:
+            time.sleep(delay)
+
+    def on_success(self):
+        with self.lock:
+            self.rate = min(self.max_rate, self.rate + self.increase / self.rate)
+
+    def on_throttle(self):
+        with self.lock:
+            self.throttles += 1
+            now = time.monotonic()
+            if now - self.last_cut >= self.cooldown:
+                self.rate = max(self.min_rate, self.rate * self.decrease)
+                self.last_cut = now
+
+
+def invoice_key(record, index):
+    if isinstance(record, dict) and record.get("invoice_id"):
+        return str(record["invoice_id"])
+    return f"#{index}"
+
+
+# Keys of invoices that already have a successful result in the output file
+def load_completed(output_path):
+    completed = set()
+    if not os.path.exists(output_path):
+        return completed
+    with open(output_path, "r", encoding="utf-8") as f:
+        for line in f:
+            try:
+                result = json.loads(line)
+            except json.JSONDecodeError:
+                continue  # torn last line from an interrupted run
+            if "analysis" in result:
+                completed.add(result["key"])
+    return completed
+
+
+def process_invoice(key, record, client, limiter, max_attempts=8):
+    start = time.perf_counter()
+    fields, tier = extract_invoice(record)
+    if fields is not None:
+        return {"key": key, "analysis": summarize_invoice(fields), "tier": tier, "attempts": 0,
+                "latency_ms": round((time.perf_counter() - start) * 1000, 3)}
+
+    for attempt in range(1, max_attempts + 1):
+        limiter.acquire()
+        start = time.perf_counter()
+        try:
+            analysis, tier = analyze_invoice(record, client=client, local=False)
+        except Exception as e:
+            if is_throttle(e) and attempt < max_attempts:
+                limiter.on_throttle()
+                time.sleep(random.uniform(0, min(20.0, 0.5 * 2 ** attempt)))  # full jitter
+                continue
+            return {"key": key, "error": str(e), "attempts": attempt}
+        limiter.on_success()
+        return {"key": key, "analysis": analysis, "tier": tier, "attempts": attempt,
+                "latency_ms": round((time.perf_counter() - start) * 1000, 1)}
+
+
+def run_bulk(input_path, output_path, concurrency=8, rate=5.0, max_rate=100.0, progress_every=100):
+    completed = load_completed(output_path)
+    limiter = AIMDRateLimiter(rate=rate, max_rate=max_rate)
+    # Throttles are handled by the limiter, so the client does not retry at all: every
+    # throttle reaches process_invoice at once and cuts the rate. Other failures are
+    # recorded and retried on the next run.
+    client = get_bedrock_client(max_pool_connections=concurrency, max_attempts=0, retry_mode="standard")
+    set_max_concurrency(MODEL_ID, concurrency)
+    counts = {"done": 0, "failed": 0, "skipped": 0}
+    tiers = {"structured": 0, "semi-structured": 0, "llm": 0}
+    start = time.perf_counter()
+
+    def report():
+        elapsed = time.perf_counter() - start
+        print(
+            f"{counts['done']} done, {counts['failed']} failed, {counts['skipped']} skipped | "
+            f"{counts['done'] / elapsed if elapsed else 0:.1f} invoices/s | "
+            f"{tiers['structured'] + tiers['semi-structured']} local, {tiers['llm']} LLM | "
+            f"rate limit {limiter.rate:.1f}/s, {limiter.throttles} throttles",
+            file=sys.stderr, flush=True
+        )
+
+    with open(output_path, "a+b") as f:
+        if f.tell():
+            f.seek(-1, os.SEEK_END)
+            if f.read(1) != b"\n":
+                f.write(b"\n")  # end a line torn by an interrupted run before appending
+
+    with open(output_path, "a", encoding="utf-8") as out, ThreadPoolExecutor(max_workers=concurrency) as pool:
+        in_flight = set()
+
+        def collect(futures):
+            for future in futures:
+                result = future.result()
+                out.write(json.dumps(result) + "\n")
+                out.flush()  # the output file is the checkpoint
+                counts["done" if "analysis" in result else "failed"] += 1
+                if "tier" in result:
+                    tiers[result["tier"]] += 1
+                if (counts["done"] + counts["failed"]) % progress_every == 0:
+                    report()
+
+        for index, (record, _) in enumerate(iter_json_records(input_path)):
+            key = invoice_key(record, index)
+            if key in completed:
+                counts["skipped"] += 1
+                continue
+            # Keep a bounded number of invoices queued so memory stays flat
+            if len(in_flight) >= concurrency * 2:
+                finished, in_flight = wait(in_flight, return_when=FIRST_COMPLETED)
+                collect(finished)
+            in_flight.add(pool.submit(process_invoice, key, record, client, limiter))
+        collect(wait(in_flight).done)
+
+    report()
+    for stats in call_stats():
+        print(f"{stats['key']}: {stats['calls']} calls, {stats['errors']} errors, {stats['throttles']} throttled attempts, "
+              f"p50 {stats['p50_ms']} ms, p95 {stats['p95_ms']} ms", file=sys.stderr, flush=True)
+    return dict(counts, tiers=tiers)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Analyze a file of invoices with Bedrock in bulk")
+    parser.add_argument("input", help="JSON array or JSON Lines file of invoices")
+    parser.add_argument("output", help="JSON Lines results file; existing results are skipped")
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--rate", type=float, default=5.0, help="initial requests per second")
+    parser.add_argument("--max-rate", type=float, default=100.0)
+    args = parser.parse_args()
+
+    counts = run_bulk(args.input, args.output, args.concurrency, args.rate, args.max_rate)
+    sys.exit(1 if counts["failed"] else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,68 @@
+import os
+import sys
+import json
+from invoice_extract import extract_invoice, summarize_invoice
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from aws_common.runtime import get_bedrock_runtime
+
+# Invoice analysis, shared by the Streamlit app and the bulk processor. Invoices the
+# local extractor can parse are summarized without Bedrock; the rest go to the LLM.
+
+MODEL_ID = "ai21.j2-ultra-v1"
+
+
+# Returns the process-wide bedrock-runtime client of the aws_common runtime. boto3 clients
+# are thread-safe, so one client with a connection pool sized for the workers serves
+# every concurrent call; the defaults come from the runtime.
+def get_bedrock_client(max_pool_connections=None, max_attempts=None, retry_mode=None):
+    return get_bedrock_runtime(
+        max_pool_connections=max_pool_connections, max_attempts=max_attempts, retry_mode=retry_mode
+    )
+
+
+# Returns (analysis, tier), where tier is "structured" or "semi-structured" when the
+# invoice was summarized locally and "llm" when Bedrock was called
+def analyze_invoice(invoice, client=None, local=True):
+    if local:
+        fields, tier = extract_invoice(invoice)
+        if fields is not None:
+            return summarize_invoice(fields), tier
+
+    if not isinstance(invoice, str):
+        invoice = json.dumps(invoice)
+
+    # Prepare the prompt
+    prompt = f"Invoice Details:\n{invoice}\n\nExtract key information and provide a summary."
+
+    # Reuse the shared Bedrock runtime client
+    if client is None:
+        client = get_bedrock_client()
+
+    # Define the model parameters
+    payload = {
+        "prompt": prompt,
+        "maxTokens": 1024,
+        "temperature": 0,
+        "topP": 0.5,
+        "stopSequences": [],
+        "countPenalty": {"scale": 0},
+        "presencePenalty": {"scale": 0},
+        "frequencyPenalty": {"scale": 0}
+    }
+
+    # Invoke the model
+    response = client.invoke_model(
+        modelId=MODEL_ID,
+        contentType="application/json",
+        accept="application/json",
+        body=json.dumps(payload)
+    )
+
+    # Read and parse the response
+    response_body = response["body"].read().decode("utf-8")
+    result = json.loads(response_body)
+
+    # Extract the model's completion text
+    completion_text = result.get("completion", "")
+    return completion_text, "llm"
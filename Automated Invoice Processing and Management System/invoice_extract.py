@@ -0,0 +1,251 @@
+import os
+import re
+import json
+from datetime import date
+
+# Deterministic local invoice extraction.
+#
+# Structured records (JSON objects such as the ones in invoices.json) and semi-structured
+# text ("Invoice No: INV-0042", "Total: $1,200.00" on separate lines or comma separated)
+# are mapped onto a fixed schema with field aliases and per-field parsers, then
+# summarized from a template. Only invoices missing the required fields, or with values
+# the parsers cannot read, are left for the LLM.
+#
+# Aliases are limited to names that clearly mean an invoice field: generic keys such as
+# "id", "number" or "from" are left unmapped rather than guessed.
+
+FIELD_ALIASES = {
+    "invoice_id": ["invoice_id", "invoice", "invoice_no", "invoice_number", "invoice_num", "inv_no",
+                   "inv_number", "invoice_ref", "invoice_reference"],
+    "date": ["date", "invoice_date", "issue_date", "issued", "issued_on", "dated", "billing_date"],
+    "due_date": ["due_date", "due", "due_on", "payment_due", "pay_by"],
+    "amount": ["amount", "total", "total_amount", "amount_due", "total_due", "balance_due",
+               "grand_total", "invoice_total"],
+    "currency": ["currency", "currency_code", "ccy"],
+    "vendor": ["vendor", "vendor_name", "supplier", "supplier_name", "seller", "billed_by", "payee"],
+    "status": ["status", "payment_status", "invoice_status"],
+}
+ALIASES = {alias: field for field, aliases in FIELD_ALIASES.items() for alias in aliases}
+
+# An invoice needs an amount and at least two of these to be summarized locally
+IDENTIFYING_FIELDS = ("invoice_id", "vendor", "date")
+
+STATUSES = {
+    "paid": "Paid", "settled": "Paid", "closed": "Paid",
+    "unpaid": "Unpaid", "open": "Unpaid", "outstanding": "Unpaid", "due": "Unpaid", "pending": "Pending",
+    "overdue": "Overdue", "late": "Overdue", "partially paid": "Partially paid", "partial": "Partially paid",
+    "void": "Void", "cancelled": "Cancelled", "canceled": "Cancelled", "draft": "Draft",
+}
+CURRENCY_SYMBOLS = {"$": "USD", "€": "EUR", "£": "GBP", "¥": "JPY", "₹": "INR"}
+CURRENCY_CODES = {"USD", "EUR", "GBP", "JPY", "INR", "CAD", "AUD", "CHF", "CNY", "SEK", "NOK", "DKK", "NZD", "SGD"}
+MONTHS = {
+    name: number
+    for number, names in enumerate([
+        ("jan", "january"), ("feb", "february"), ("mar", "march"), ("apr", "april"), ("may",),
+        ("jun", "june"), ("jul", "july"), ("aug", "august"), ("sep", "sept", "september"),
+        ("oct", "october"), ("nov", "november"), ("dec", "december"),
+    ], start=1)
+    for name in names
+}
+
+# How to read numeric dates such as 09/10/2024 where either number could be the month:
+# "MDY" or "DMY". Left empty, such dates are not guessed and the invoice goes to the LLM.
+DATE_ORDER = os.getenv("INVOICE_DATE_ORDER", "").upper()
+
+ISO_DATE = re.compile(r"^(\d{4})[-/.](\d{1,2})[-/.](\d{1,2})(?:[T ].*)?$", re.IGNORECASE)
+NUMERIC_DATE = re.compile(r"^(\d{1,2})[-/.](\d{1,2})[-/.](\d{2,4})$")
+DAY_MONTH_YEAR = re.compile(r"^(\d{1,2})(?:st|nd|rd|th)?\s+([a-z]+)\.?,?\s+(\d{4})$")
+MONTH_DAY_YEAR = re.compile(r"^([a-z]+)\.?\s+(\d{1,2})(?:st|nd|rd|th)?,?\s+(\d{4})$")
+AMOUNT = re.compile(r"^([A-Z]{3}|[$€£¥₹])?\s*(-?[\d.,' ]*\d)\s*([A-Z]{3}|[$€£¥₹])?$")
+INVOICE_ID = re.compile(r"^#?\s*([A-Za-z0-9][A-Za-z0-9_/-]{0,39})$")
+# 1,234,567.89 / 1.234.567,89 / 1 234 567 / 1'234.5: the same thousands separator between
+# groups of exactly three digits, then at most one decimal mark and one or two decimals
+GROUPED_NUMBER = re.compile(r"^([1-9]\d{0,2})(?:([.,' ])\d{3})(?:\2\d{3})*(?:([.,])(\d{1,2}))?$")
+PLAIN_NUMBER = re.compile(r"^\d+(?:[.,]\d+)?$")
+KEY_VALUE = re.compile(r"^\s*([A-Za-z][A-Za-z0-9 _.#/-]{0,39}?)\s*[:=]\s*(.+?)\s*$")
+
+
+def normalize_key(key):
+    return re.sub(r"[^a-z0-9]+", "_", str(key).strip().lower()).strip("_")
+
+
+def parse_date(value, order=None):
+    order = DATE_ORDER if order is None else order.upper()
+    if value is None:
+        return None
+    text = str(value).strip().lower()
+    match = ISO_DATE.match(text)
+    if match:
+        year, month, day = map(int, match.groups())
+    elif NUMERIC_DATE.match(text):
+        first, second, year = map(int, NUMERIC_DATE.match(text).groups())
+        year += 2000 if year < 100 else 0
+        if first == second or second > 12:
+            month, day = first, second  # e.g. 09/15/2024
+        elif first > 12:
+            day, month = first, second  # e.g. 15/09/2024
+        elif order == "MDY":
+            month, day = first, second
+        elif order == "DMY":
+            day, month = first, second
+        else:
+            return None  # ambiguous, e.g. 09/10/2024
+    elif DAY_MONTH_YEAR.match(text):
+        day, month_name, year = DAY_MONTH_YEAR.match(text).groups()
+        day, month, year = int(day), MONTHS.get(month_name), int(year)
+    elif MONTH_DAY_YEAR.match(text):
+        month_name, day, year = MONTH_DAY_YEAR.match(text).groups()
+        day, month, year = int(day), MONTHS.get(month_name), int(year)
+    else:
+        return None
+    try:
+        return date(year, month, day).isoformat()
+    except (TypeError, ValueError):
+        return None
+
+
+# Returns (amount, currency); currency is None when the value does not name one
+def parse_amount(value):
+    if isinstance(value, bool) or value is None:
+        return None, None
+    if isinstance(value, (int, float)):
+        return float(value), None
+    match = AMOUNT.match(str(value).strip().upper())
+    if not match:
+        return None, None
+    prefix, number, suffix = match.groups()
+    sign, number = ("-", number[1:]) if number.startswith("-") else ("", number)
+    grouped = GROUPED_NUMBER.match(number)
+    if grouped and grouped.group(2) != grouped.group(3):
+        decimal_mark = grouped.group(3)
+        whole = number[:-len(grouped.group(4)) - 1] if decimal_mark else number
+        number = re.sub(r"[.,' ]", "", whole) + ("." + grouped.group(4) if decimal_mark else "")
+    elif PLAIN_NUMBER.match(number):
+        number = number.replace(",", ".")
+    else:
+        return None, None  # e.g. 1,2,3 or 12,345.678.9: left for the LLM
+    amount = float(sign + number)
+    currency = None
+    for marker in (prefix, suffix):
+        if marker:
+            currency = CURRENCY_SYMBOLS.get(marker, marker if marker in CURRENCY_CODES else None)
+    return amount, currency
+
+
+def parse_invoice_id(value):
+    if value is None or isinstance(value, bool):
+        return None
+    match = INVOICE_ID.match(str(value).strip())
+    return match.group(1) if match else None
+
+
+def parse_status(value):
+    if value is None:
+        return None
+    return STATUSES.get(" ".join(str(value).strip().lower().replace("_", " ").split()))
+
+
+def parse_text(value):
+    if value is None or isinstance(value, (dict, list)):
+        return None
+    return " ".join(str(value).split()) or None
+
+
+PARSERS = {
+    "invoice_id": parse_invoice_id,
+    "date": parse_date,
+    "due_date": parse_date,
+    "vendor": parse_text,
+    "status": parse_status,
+    "currency": lambda value: str(value).strip().upper() if str(value).strip().upper() in CURRENCY_CODES else None,
+}
+
+
+# Maps raw (key, value) pairs onto the schema. Returns None when a recognized field
+# holds a value its parser cannot read, so the LLM sees the invoice instead.
+def map_fields(pairs):
+    fields = {}
+    for key, value in pairs:
+        field = ALIASES.get(normalize_key(key))
+        if field is None or field in fields or value in (None, ""):
+            continue
+        if field == "amount":
+            amount, currency = parse_amount(value)
+            if amount is None:
+                return None
+            fields["amount"] = amount
+            if currency and "currency" not in fields:
+                fields["currency"] = currency
+            continue
+        parsed = PARSERS[field](value)
+        if parsed is None:
+            return None
+        fields[field] = parsed
+    if "amount" not in fields or sum(field in fields for field in IDENTIFYING_FIELDS) < 2:
+        return None
+    return fields
+
+
+def _key_value_pairs(text):
+    lines = text.splitlines()
+    if len(lines) == 1:
+        lines = re.split(r"[,;|]\s*(?=[A-Za-z][A-Za-z0-9 _.#/-]{0,39}?\s*[:=])", text)
+    pairs = []
+    for line in lines:
+        if not line.strip():
+            continue
+        match = KEY_VALUE.match(line)
+        if match is None:
+            return None  # free text around the fields, let the LLM read it
+        pairs.append(match.groups())
+    return pairs
+
+
+# Returns (fields, tier) where tier is "structured" or "semi-structured", or (None, None)
+# when the invoice has to go to the LLM
+def extract_invoice(invoice):
+    if isinstance(invoice, dict):
+        fields = map_fields(invoice.items())
+        return (fields, "structured") if fields else (None, None)
+
+    text = str(invoice).strip()
+    if text.startswith("{"):
+        try:
+            record = json.loads(text)
+        except ValueError:
+            record = None
+        if isinstance(record, dict):
+            fields = map_fields(record.items())
+            return (fields, "structured") if fields else (None, None)
+
+    pairs = _key_value_pairs(text)
+    fields = map_fields(pairs) if pairs else None
+    return (fields, "semi-structured") if fields else (None, None)
+
+
+def format_amount(amount, currency=None):
+    text = f"{amount:,.2f}"
+    return f"{text} {currency}" if currency else text
+
+
+def summarize_invoice(fields):
+    amount = format_amount(fields["amount"], fields.get("currency"))
+    labels = [
+        ("invoice_id", "Invoice ID"), ("vendor", "Vendor"), ("date", "Invoice date"),
+        ("amount", "Amount"), ("due_date", "Due date"), ("status", "Status"),
+    ]
+    lines = ["Key information:"] + [
+        f"- {label}: {amount if field == 'amount' else fields[field]}"
+        for field, label in labels if field in fields
+    ]
+
+    summary = f"Invoice {fields['invoice_id']}" if "invoice_id" in fields else "An invoice"
+    if "vendor" in fields:
+        summary += f" from {fields['vendor']}"
+    if "date" in fields:
+        summary += f" dated {fields['date']}"
+    summary += f" for {amount}"
+    if "due_date" in fields:
+        summary += f", due {fields['due_date']}"
+    summary += f". Status: {fields['status']}." if "status" in fields else "."
+    return "\n".join(lines) + "\n\nSummary: " + summary
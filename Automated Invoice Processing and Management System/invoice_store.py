@@ -0,0 +1,196 @@
+import os
+import sys
+import numpy as np
+from invoice_extract import parse_amount, parse_date
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from aws_common.json_stream import iter_json_records
+
+# Columnar, in-memory invoice store with exact indexes.
+#
+# Each field is a NumPy column: vendor and status are dictionary-encoded integer codes,
+# dates are datetime64[D] and amounts float64. Vendor and status get hash indexes
+# (code -> sorted row ids, stored CSR-style), date and amount get sorted indexes
+# (argsort order + sorted values, searched with np.searchsorted). A query starts from
+# the smallest candidate set any index gives and filters it with vectorized column
+# comparisons, so lookups and aggregates stay well under a millisecond on millions of
+# invoices without calling Bedrock.
+#
+# Amounts ("$1,200.00") and dates ("Sep 1, 2024") are normalized with the local
+# extractor's parsers; records whose amount or date cannot be read are skipped and
+# counted. Statuses are matched case-insensitively, the first spelling seen is shown.
+
+
+class _HashIndex:
+    def __init__(self, codes, size):
+        self.order = np.argsort(codes, kind="stable").astype(np.int64)
+        self.starts = np.searchsorted(codes[self.order], np.arange(size + 1))
+
+    def rows(self, code):
+        return self.order[self.starts[code]:self.starts[code + 1]]
+
+
+class _SortedIndex:
+    def __init__(self, values):
+        self.order = np.argsort(values, kind="stable").astype(np.int64)
+        self.sorted = values[self.order]
+
+    def rows(self, low=None, high=None):
+        start = 0 if low is None else np.searchsorted(self.sorted, low, side="left")
+        end = len(self.sorted) if high is None else np.searchsorted(self.sorted, high, side="right")
+        return self.order[start:end]
+
+
+def _as_list(value):
+    if value is None:
+        return None
+    return list(value) if isinstance(value, (list, tuple, set)) else [value]
+
+
+class InvoiceStore:
+    def __init__(self, invoice_ids, vendor_codes, vendors, status_codes, statuses, dates, amounts, skipped=0):
+        self.invoice_ids = invoice_ids
+        self.vendor_codes = vendor_codes
+        self.vendors = vendors  # code -> vendor name
+        self.status_codes = status_codes
+        self.statuses = statuses  # code -> status
+        self.dates = dates
+        self.amounts = amounts
+        self.skipped = skipped  # records left out because their amount or date was unreadable
+
+        self.vendor_lookup = {name: code for code, name in enumerate(vendors)}
+        self.status_lookup = {status.casefold(): code for code, status in enumerate(statuses)}
+        self.id_index = {invoice_id: row for row, invoice_id in enumerate(invoice_ids)}
+        self.vendor_index = _HashIndex(vendor_codes, len(vendors))
+        self.status_index = _HashIndex(status_codes, len(statuses))
+        self.date_index = _SortedIndex(dates)
+        self.amount_index = _SortedIndex(amounts)
+
+    def __len__(self):
+        return len(self.invoice_ids)
+
+    @classmethod
+    def from_records(cls, records):
+        invoice_ids, vendor_codes, status_codes, dates, amounts = [], [], [], [], []
+        vendors, statuses, status_names = {}, {}, []
+        skipped = 0
+        for record in records:
+            raw_amount, raw_date = record.get("amount"), record.get("date")
+            amount = parse_amount(raw_amount)[0] if raw_amount not in (None, "") else 0.0
+            date = parse_date(raw_date) if raw_date not in (None, "") else "NaT"
+            if amount is None or date is None:
+                skipped += 1
+                continue
+            status = str(record.get("status", ""))
+            if status.casefold() not in statuses:
+                statuses[status.casefold()] = len(statuses)
+                status_names.append(status)
+            invoice_ids.append(str(record.get("invoice_id", "")))
+            vendor_codes.append(vendors.setdefault(str(record.get("vendor", "")), len(vendors)))
+            status_codes.append(statuses[status.casefold()])
+            dates.append(date)
+            amounts.append(amount)
+        return cls(
+            np.array(invoice_ids, dtype=object),
+            np.array(vendor_codes, dtype=np.int32), list(vendors),
+            np.array(status_codes, dtype=np.int16), status_names,
+            np.array(dates, dtype="datetime64[D]"),
+            np.array(amounts, dtype=np.float64),
+            skipped=skipped,
+        )
+
+    # Loads a JSON array or JSON Lines file without holding the parsed records in memory
+    @classmethod
+    def from_file(cls, path):
+        return cls.from_records(record for record, _ in iter_json_records(path))
+
+    def get(self, invoice_id):
+        row = self.id_index.get(invoice_id)
+        return None if row is None else self.record(row)
+
+    def _code_rows(self, index, lookup, values, normalize=lambda v: v):
+        codes = [lookup[normalize(v)] for v in values if normalize(v) in lookup]
+        if not codes:
+            return np.zeros(0, dtype=np.int64)
+        if len(codes) == 1:
+            return index.rows(codes[0])
+        return np.sort(np.concatenate([index.rows(code) for code in codes]))
+
+    # Returns the row ids matching every given filter. vendor and status take one value or
+    # a list; dates are inclusive "YYYY-MM-DD" bounds, amounts inclusive numeric bounds.
+    def query(self, vendor=None, status=None, date_from=None, date_to=None, amount_min=None, amount_max=None):
+        vendor, status = _as_list(vendor), _as_list(status)
+        date_from = None if date_from is None else np.datetime64(date_from, "D")
+        date_to = None if date_to is None else np.datetime64(date_to, "D")
+
+        candidates = []
+        if vendor is not None:
+            candidates.append(("vendor", self._code_rows(self.vendor_index, self.vendor_lookup, vendor)))
+        if status is not None:
+            candidates.append(("status", self._code_rows(
+                self.status_index, self.status_lookup, status, normalize=lambda v: str(v).casefold()
+            )))
+        if date_from is not None or date_to is not None:
+            candidates.append(("date", self.date_index.rows(date_from, date_to)))
+        if amount_min is not None or amount_max is not None:
+            candidates.append(("amount", self.amount_index.rows(amount_min, amount_max)))
+        if not candidates:
+            return np.arange(len(self), dtype=np.int64)
+
+        # Start from the most selective index and check the other filters on its rows only
+        used, rows = min(candidates, key=lambda item: len(item[1]))
+        if len(rows) == 0:
+            return rows
+        mask = np.ones(len(rows), dtype=bool)
+        if vendor is not None and used != "vendor":
+            codes = [self.vendor_lookup[v] for v in vendor if v in self.vendor_lookup]
+            mask &= np.isin(self.vendor_codes[rows], codes)
+        if status is not None and used != "status":
+            codes = [self.status_lookup[str(s).casefold()] for s in status if str(s).casefold() in self.status_lookup]
+            mask &= np.isin(self.status_codes[rows], codes)
+        if used != "date":
+            if date_from is not None:
+                mask &= self.dates[rows] >= date_from
+            if date_to is not None:
+                mask &= self.dates[rows] <= date_to
+        if used != "amount":
+            if amount_min is not None:
+                mask &= self.amounts[rows] >= amount_min
+            if amount_max is not None:
+                mask &= self.amounts[rows] <= amount_max
+        return np.sort(rows[mask]) if used in ("date", "amount") else rows[mask]
+
+    def aggregate(self, rows):
+        amounts = self.amounts[rows]
+        if len(amounts) == 0:
+            return {"count": 0, "total": 0.0, "mean": 0.0, "min": None, "max": None}
+        return {
+            "count": int(len(amounts)),
+            "total": float(amounts.sum()),
+            "mean": float(amounts.mean()),
+            "min": float(amounts.min()),
+            "max": float(amounts.max()),
+        }
+
+    # Returns {group: {"count", "total"}} for rows grouped by "vendor" or "status"
+    def group_by(self, rows, field="vendor"):
+        codes, names = (self.vendor_codes, self.vendors) if field == "vendor" else (self.status_codes, self.statuses)
+        counts = np.bincount(codes[rows], minlength=len(names))
+        totals = np.bincount(codes[rows], weights=self.amounts[rows], minlength=len(names))
+        return {
+            names[code]: {"count": int(counts[code]), "total": float(totals[code])}
+            for code in np.flatnonzero(counts)
+        }
+
+    def record(self, row):
+        date = self.dates[row]
+        return {
+            "invoice_id": self.invoice_ids[row],
+            "date": None if np.isnat(date) else str(date),
+            "amount": float(self.amounts[row]),
+            "vendor": self.vendors[self.vendor_codes[row]],
+            "status": self.statuses[self.status_codes[row]],
+        }
+
+    def records(self, rows, limit=100):
+        return [self.record(row) for row in rows[:limit]]
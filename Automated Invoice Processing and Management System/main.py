@@ -1,13 +1,12 @@
 import os
-import json
+import sys
+import time
 import streamlit as st
-from langchain_community.llms import Bedrock
-from langchain_community.embeddings import BedrockEmbeddings
-from langchain.indexes import VectorstoreIndexCreator
-from langchain_community.vectorstores import FAISS
-from langchain_text_splitters import RecursiveCharacterTextSplitter
-from langchain_community.document_loaders import JSONLoader
-import boto3
+from invoice_store import InvoiceStore
+from invoice_analysis import analyze_invoice
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from aws_common.runtime import call_stats
 
 os.environ["AWS_ACCESS_KEY_ID"] = "xxx"
 os.environ["AWS_SECRET_ACCESS_KEY"] = "xxx"
@@ -15,65 +14,13 @@ os.environ["AWS_DEFAULT_REGION"] = "us-east-1"
 
 
 
-def get_index():
-    embeddings = BedrockEmbeddings()
-    loader = JSONLoader(
-        file_path="invoices.json",
-        jq_schema='.[]',
-        content_key='invoice_id',
-        metadata_func=lambda record, metadata: metadata.update(record) or metadata
-    )
-
-    text_splitter = RecursiveCharacterTextSplitter(
-        separators=["\n\n", "\n", ".", " "],
-        chunk_size=8000,
-        chunk_overlap=0
-    )
-
-    index_creator = VectorstoreIndexCreator(
-        vectorstore_cls=FAISS,
-        embedding=embeddings,
-        text_splitter=text_splitter
-    )
-
-    index_from_loader = index_creator.from_loaders([loader])
-
-    return index_from_loader
-
-def analyze_invoice(invoice):
-    # Prepare the prompt
-    prompt = f"Invoice Details:\n{invoice}\n\nExtract key information and provide a summary."
+INVOICE_SOURCE = os.getenv("INVOICE_SOURCE", "invoices.json")  # JSON array or JSON Lines file
 
-    # Create a Bedrock runtime client
-    client = boto3.client("bedrock-runtime", region_name=os.environ["AWS_DEFAULT_REGION"])
-
-    # Define the model parameters
-    payload = {
-        "prompt": prompt,
-        "maxTokens": 1024,
-        "temperature": 0,
-        "topP": 0.5,
-        "stopSequences": [],
-        "countPenalty": {"scale": 0},
-        "presencePenalty": {"scale": 0},
-        "frequencyPenalty": {"scale": 0}
-    }
-
-    # Invoke the model
-    response = client.invoke_model(
-        modelId="ai21.j2-ultra-v1",
-        contentType="application/json",
-        accept="application/json",
-        body=json.dumps(payload)
-    )
-
-    # Read and parse the response
-    response_body = response["body"].read().decode("utf-8")
-    result = json.loads(response_body)
-
-    # Extract the model's completion text
-    completion_text = result.get("completion", "")
-    return completion_text
+# Loads the invoices into a columnar store with exact indexes, once per process.
+# Filters and aggregates are answered locally, without Bedrock.
+@st.cache_resource(show_spinner=False)
+def get_invoice_store():
+    return InvoiceStore.from_file(INVOICE_SOURCE)
 
 st.set_page_config(layout="wide")
 
@@ -99,14 +46,54 @@ footer {
 
 st.title("Automated Invoice Processing and Management System")
 
-if 'vector_index' not in st.session_state:
+with st.sidebar.expander("AWS calls"):
+    st.table(call_stats())
+
+if 'invoice_store' not in st.session_state:
     with st.spinner("Indexing invoices..."):
-        st.session_state.vector_index = get_index()
+        st.session_state.invoice_store = get_invoice_store()
+
+store = st.session_state.invoice_store
+with st.expander(f"Search invoices ({len(store)} indexed)", expanded=True):
+    if store.skipped:
+        st.warning(f"{store.skipped} invoices were not indexed because their amount or date could not be read.")
+    filter_col_1, filter_col_2, filter_col_3 = st.columns(3)
+    with filter_col_1:
+        vendor_filter = st.multiselect("Vendor", sorted(store.vendors))
+        status_filter = st.multiselect("Status", sorted(store.statuses))
+    with filter_col_2:
+        date_from = st.date_input("From date", value=None)
+        date_to = st.date_input("To date", value=None)
+    with filter_col_3:
+        amount_min = st.number_input("Minimum amount", value=None)
+        amount_max = st.number_input("Maximum amount", value=None)
+
+    start = time.perf_counter()
+    rows = store.query(
+        vendor=vendor_filter or None,
+        status=status_filter or None,
+        date_from=date_from.isoformat() if date_from else None,
+        date_to=date_to.isoformat() if date_to else None,
+        amount_min=amount_min,
+        amount_max=amount_max
+    )
+    summary = store.aggregate(rows)
+    query_ms = (time.perf_counter() - start) * 1000
+
+    st.write(
+        f"{summary['count']} invoices, total {summary['total']:,.2f}, "
+        f"average {summary['mean']:,.2f} ({query_ms:.3f} ms)"
+    )
+    st.table(store.records(rows, limit=50))
 
 input_invoice = st.text_area("Enter an invoice entry:")
 analyze_button = st.button("Analyze", type="primary")
 if analyze_button:
     with st.spinner("Analyzing..."):
-        analysis = analyze_invoice(invoice=input_invoice)
+        start = time.perf_counter()
+        analysis, tier = analyze_invoice(invoice=input_invoice)
+        elapsed_ms = (time.perf_counter() - start) * 1000
         st.markdown(f"### Invoice Entry: {input_invoice}")
         st.write(f"Analysis: {analysis}")
+        handled_by = "Bedrock" if tier == "llm" else f"local {tier} extraction"
+        st.caption(f"Handled by {handled_by} in {elapsed_ms:.2f} ms")
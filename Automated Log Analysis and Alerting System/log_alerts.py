@@ -0,0 +1,165 @@
+import time
+from array import array
+from collections import deque
+from datetime import datetime
+
+# Streaming alert engine over log levels and mined templates.
+#
+# Every (rule, key) pair owns a ring buffer of per-bucket counts covering two windows:
+# the current one and the one before it. Adding an event only touches the head bucket
+# and two running sums, so the cost per event is O(1) whatever the window length, and
+# threshold and rate-of-change checks read the sums directly.
+#
+# Only alerting windows are meant to reach the LLM: each alert carries a bounded sample
+# of the messages that triggered it.
+
+SAMPLE_SIZE = 20
+
+
+class RingCounter:
+    def __init__(self, window_buckets, bucket_seconds=1.0):
+        self.window = window_buckets
+        self.size = 2 * window_buckets
+        self.bucket_seconds = bucket_seconds
+        self.counts = array("q", [0] * self.size)
+        self.head = None  # index of the newest bucket
+        self.current = 0  # events in the newest `window` buckets
+        self.previous = 0  # events in the `window` buckets before those
+
+    def _advance(self, bucket):
+        if self.head is None or bucket - self.head >= self.size:
+            # Everything we hold is older than both windows
+            for i in range(self.size):
+                self.counts[i] = 0
+            self.current = self.previous = 0
+            self.head = bucket
+            return
+        while self.head < bucket:
+            self.head += 1
+            leaving = self.counts[(self.head - self.window) % self.size]  # current -> previous
+            self.current -= leaving
+            self.previous += leaving
+            self.previous -= self.counts[self.head % self.size]  # falls out of both windows
+            self.counts[self.head % self.size] = 0
+
+    def add(self, timestamp, count=1):
+        bucket = int(timestamp // self.bucket_seconds)
+        if self.head is not None and bucket <= self.head - self.size:
+            return  # too old for either window
+        if self.head is None or bucket > self.head:
+            self._advance(bucket)
+        self.counts[bucket % self.size] += count
+        if bucket > self.head - self.window:
+            self.current += count
+        else:
+            self.previous += count
+
+    def totals(self, now=None):
+        if now is not None:
+            bucket = int(now // self.bucket_seconds)
+            if self.head is not None and bucket > self.head:
+                self._advance(bucket)
+        return self.current, self.previous
+
+
+class AlertRule:
+    # scope is "level" or "template"; value "*" watches every level or template separately.
+    # threshold fires when the window holds at least that many events; rate_factor fires
+    # when the window holds at least min_count events and rate_factor times the previous one.
+    def __init__(self, name, scope="level", value="*", window_seconds=60, threshold=None,
+                 rate_factor=None, min_count=10):
+        self.name = name
+        self.scope = scope
+        self.value = value
+        self.window_seconds = window_seconds
+        self.threshold = threshold
+        self.rate_factor = rate_factor
+        self.min_count = min_count
+
+    def key_for(self, level, template_id):
+        key = level if self.scope == "level" else template_id
+        if key is None or (self.value != "*" and str(self.value) != str(key)):
+            return None
+        return key
+
+
+class Alert:
+    def __init__(self, rule, key, kind, count, previous, window_start, window_end, samples, latency_ms):
+        self.rule = rule
+        self.key = key
+        self.kind = kind  # "threshold" or "rate"
+        self.count = count
+        self.previous = previous
+        self.window_start = window_start
+        self.window_end = window_end
+        self.samples = samples
+        self.latency_ms = latency_ms
+
+    def describe(self):
+        what = f"{self.rule.scope} {self.key}"
+        if self.kind == "rate":
+            return (f"{self.rule.name}: {what} rose to {self.count} events in {self.rule.window_seconds}s "
+                    f"from {self.previous} in the window before")
+        return f"{self.rule.name}: {what} reached {self.count} events in {self.rule.window_seconds}s"
+
+
+def parse_timestamp(value):
+    if isinstance(value, (int, float)):
+        return float(value)
+    if isinstance(value, str):
+        try:
+            return datetime.fromisoformat(value.replace("Z", "+00:00")).timestamp()
+        except ValueError:
+            pass
+    return time.time()
+
+
+class AlertEngine:
+    def __init__(self, rules, bucket_seconds=1.0, cooldown_seconds=300, max_alerts=100):
+        self.rules = rules
+        self.bucket_seconds = bucket_seconds
+        self.cooldown_seconds = cooldown_seconds
+        self.counters = {}  # (rule index, key) -> RingCounter
+        self.samples = {}  # (rule index, key) -> recent messages
+        self.last_fired = {}  # (rule index, key, kind) -> event time
+        self.alerts = deque(maxlen=max_alerts)
+
+    # Records one event and returns the alerts it triggered
+    def observe(self, timestamp, level=None, template_id=None, message=None):
+        started = time.perf_counter()
+        timestamp = parse_timestamp(timestamp)
+        fired = []
+        for i, rule in enumerate(self.rules):
+            key = rule.key_for(level, template_id)
+            if key is None:
+                continue
+            counter = self.counters.get((i, key))
+            if counter is None:
+                window_buckets = max(1, int(round(rule.window_seconds / self.bucket_seconds)))
+                counter = self.counters[(i, key)] = RingCounter(window_buckets, self.bucket_seconds)
+                self.samples[(i, key)] = deque(maxlen=SAMPLE_SIZE)
+            counter.add(timestamp)
+            if message is not None:
+                self.samples[(i, key)].append(message)
+
+            current, previous = counter.current, counter.previous
+            if rule.threshold is not None and current >= rule.threshold:
+                fired.append(self._fire(i, rule, key, "threshold", current, previous, timestamp, started))
+            if (rule.rate_factor is not None and current >= rule.min_count
+                    and current >= rule.rate_factor * max(previous, 1)):
+                fired.append(self._fire(i, rule, key, "rate", current, previous, timestamp, started))
+        return [alert for alert in fired if alert is not None]
+
+    def _fire(self, i, rule, key, kind, current, previous, timestamp, started):
+        last = self.last_fired.get((i, key, kind))
+        if last is not None and timestamp - last < self.cooldown_seconds:
+            return None
+        self.last_fired[(i, key, kind)] = timestamp
+        alert = Alert(
+            rule, key, kind, current, previous,
+            window_start=timestamp - rule.window_seconds, window_end=timestamp,
+            samples=list(self.samples[(i, key)]),
+            latency_ms=(time.perf_counter() - started) * 1000
+        )
+        self.alerts.append(alert)
+        return alert
@@ -0,0 +1,275 @@
+import os
+import sys
+import json
+import time
+import logging
+import argparse
+import threading
+from langchain_community.vectorstores import FAISS
+from log_templates import TemplateMiner
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from aws_common.json_stream import iter_json_records
+
+logger = logging.getLogger(__name__)
+
+# Streaming, incremental ingestion of log records into a FAISS index.
+#
+# Records are read from a JSON Lines file (one object per line) or a JSON array file
+# such as logs.json, a bounded batch at a time, so memory stays flat however large the
+# file is. Only records past the checkpoint are embedded and appended to the index.
+# Saving writes the whole index, so it happens every save_every records or save_interval
+# seconds and at the end of an ingest, not after every batch. The checkpoint is written
+# after the index: a crash loses only the records since the last save, which are read
+# again on restart, and can at worst re-append one batch, never skip one.
+#
+# With a TemplateMiner, records are reduced to templates first and the index holds one
+# document per template ("template-<id>"), re-embedded only when the template changes.
+
+CHECKPOINT_FILE = "checkpoint.json"
+TEMPLATES_FILE = "templates.json"
+SAVE_EVERY = 50_000  # records appended between saves of the index
+SAVE_INTERVAL = 60.0  # seconds between saves while records keep arriving
+
+
+class LogIndex:
+    def __init__(self, source_path, index_dir, embeddings, text_splitter=None, batch_size=256,
+                 content_key="log", miner=None, alert_engine=None, save_every=SAVE_EVERY,
+                 save_interval=SAVE_INTERVAL):
+        self.source_path = source_path
+        self.index_dir = index_dir
+        self.embeddings = embeddings
+        self.text_splitter = text_splitter
+        self.batch_size = batch_size
+        self.content_key = content_key
+        self.miner = miner
+        self.alert_engine = alert_engine  # fed every new record, before embedding
+        self.save_every = save_every
+        self.save_interval = save_interval
+        self.unsaved = 0  # records appended since the last save
+        self.dirty = False  # checkpoint moved since the last save
+        self.last_save = time.monotonic()
+        self.checkpoint_path = os.path.join(index_dir, CHECKPOINT_FILE)
+        self.templates_path = os.path.join(index_dir, TEMPLATES_FILE)
+        self.checkpoint = {"inode": None, "offset": 0, "records": 0}
+        self.vectorstore = None
+        self.lock = threading.RLock()  # guards the vector store against a concurrent follow()
+        self._load()
+
+    def _load(self):
+        if not os.path.exists(self.checkpoint_path):
+            return
+        with open(self.checkpoint_path, "r") as f:
+            checkpoint = json.load(f)
+        if checkpoint.get("source_path") != os.path.abspath(self.source_path):
+            return  # a different log source, start over
+        if checkpoint.get("templates", False) != (self.miner is not None):
+            return  # indexed in the other mode, start over
+        if self.miner is not None:
+            if not os.path.exists(self.templates_path):
+                return  # saved before its templates, start over
+            with open(self.templates_path, "r") as f:
+                self.miner = TemplateMiner.from_dict(json.load(f))
+        self.vectorstore = FAISS.load_local(
+            self.index_dir, self.embeddings, allow_dangerous_deserialization=True
+        )
+        self.checkpoint = checkpoint
+
+    def save_templates(self):
+        if self.miner is None:
+            return
+        os.makedirs(self.index_dir, exist_ok=True)
+        with self.lock:
+            data = self.miner.to_dict()
+        tmp_path = self.templates_path + ".tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(data, f)
+        os.replace(tmp_path, self.templates_path)
+
+    def _save(self):
+        os.makedirs(self.index_dir, exist_ok=True)
+        self.vectorstore.save_local(self.index_dir)
+        self.save_templates()
+        self.checkpoint["source_path"] = os.path.abspath(self.source_path)
+        self.checkpoint["templates"] = self.miner is not None
+        tmp_path = self.checkpoint_path + ".tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(self.checkpoint, f)
+        os.replace(tmp_path, self.checkpoint_path)
+        self.unsaved = 0
+        self.dirty = False
+        self.last_save = time.monotonic()
+
+    # Saves the index if anything changed since the last save; with due_only, only once
+    # save_every records or save_interval seconds have gone by
+    def flush(self, due_only=False):
+        with self.lock:
+            if self.vectorstore is None or not self.dirty:
+                return
+            due = self.unsaved >= self.save_every or time.monotonic() - self.last_save >= self.save_interval
+            if due or not due_only:
+                self._save()
+
+    # Starts again from the top when the file was rotated or truncated
+    def _start_offset(self):
+        stat = os.stat(self.source_path)
+        if self.checkpoint["inode"] != stat.st_ino or stat.st_size < self.checkpoint["offset"]:
+            self.checkpoint["inode"] = stat.st_ino
+            self.checkpoint["offset"] = 0
+        return self.checkpoint["offset"]
+
+    def _content(self, record):
+        return str(record.get(self.content_key, "")) if isinstance(record, dict) else json.dumps(record)
+
+    def _to_texts(self, record):
+        metadata = record if isinstance(record, dict) else {}
+        text = self._content(record)
+        chunks = self.text_splitter.split_text(text) if self.text_splitter else [text]
+        return [(chunk, dict(metadata), None) for chunk in chunks if chunk]
+
+    def _template_doc(self, cluster):
+        metadata = {
+            "template_id": cluster.cluster_id, "count": cluster.size,
+            "level": cluster.level, "example": cluster.example,
+        }
+        return cluster.template, metadata, f"template-{cluster.cluster_id}"
+
+    def _append(self, batch, end_offset, records):
+        texts = [text for text, _, _ in batch]
+        metadatas = [metadata for _, metadata, _ in batch]
+        ids = [doc_id for _, _, doc_id in batch]
+        ids = ids if all(ids) else None
+        # Embed before taking the lock so searches are not held up by Bedrock calls
+        vectors = self.embeddings.embed_documents(texts) if texts else []
+        with self.lock:
+            if texts:
+                text_embeddings = list(zip(texts, vectors))
+                if self.vectorstore is None:
+                    self.vectorstore = FAISS.from_embeddings(
+                        text_embeddings, self.embeddings, metadatas=metadatas, ids=ids
+                    )
+                else:
+                    if ids:
+                        # Templates that gained a parameter slot replace their old document
+                        existing = set(self.vectorstore.index_to_docstore_id.values())
+                        stale = [doc_id for doc_id in ids if doc_id in existing]
+                        if stale:
+                            self.vectorstore.delete(stale)
+                    self.vectorstore.add_embeddings(text_embeddings, metadatas=metadatas, ids=ids)
+            self.checkpoint["offset"] = end_offset
+            self.checkpoint["records"] += records
+            self.unsaved += records
+            self.dirty = True
+        self.flush(due_only=True)
+
+    # Embeds and appends every record after the checkpoint; returns how many were added.
+    # In template mode only new or changed templates are embedded. The index is saved at
+    # the end unless flush is False. A last JSON Lines record without a newline is read
+    # too unless complete is False, i.e. the file may still be being written.
+    def ingest(self, max_records=None, on_batch=None, flush=True, complete=True):
+        if not os.path.exists(self.source_path):
+            return 0
+        added = 0
+        pending = 0
+        batch = []
+        changed = {}  # cluster id -> cluster, for templates created or updated in this batch
+        end_offset = self._start_offset()
+        for record, end_offset in iter_json_records(self.source_path, end_offset, complete=complete):
+            level = record.get("level") if isinstance(record, dict) else None
+            cluster = None
+            if self.miner is None:
+                batch.extend(self._to_texts(record))
+            else:
+                with self.lock:
+                    cluster, change = self.miner.add(self._content(record), level=level)
+                if change:
+                    changed[cluster.cluster_id] = cluster
+            if self.alert_engine is not None:
+                self.alert_engine.observe(
+                    record.get("timestamp") if isinstance(record, dict) else None,
+                    level=level,
+                    template_id=cluster.cluster_id if cluster is not None else None,
+                    message=self._content(record)
+                )
+            added += 1
+            pending += 1
+            if pending >= self.batch_size:
+                batch.extend(self._template_doc(cluster) for cluster in changed.values())
+                self._append(batch, end_offset, pending)
+                batch, changed, pending = [], {}, 0
+                if on_batch:
+                    on_batch(added)
+            if max_records and added >= max_records:
+                break
+        if pending or end_offset != self.checkpoint["offset"]:
+            batch.extend(self._template_doc(cluster) for cluster in changed.values())
+            self._append(batch, end_offset, pending)
+            if on_batch:
+                on_batch(added)
+        if flush:
+            self.flush()
+        return added
+
+    # Returns the mined template a message belongs to, or None
+    def match_template(self, message):
+        if self.miner is None:
+            return None
+        with self.lock:
+            return self.miner.match(message)
+
+    # Tails the source file, ingesting new records as they are written. The index is
+    # saved on the save_every / save_interval schedule rather than after every poll. A
+    # failed poll (e.g. Bedrock retries exhausted) is logged and retried after
+    # poll_interval; records are only checkpointed once appended, so none are lost.
+    def follow(self, poll_interval=2.0, stop_event=None):
+        stop_event = stop_event or threading.Event()
+        try:
+            while not stop_event.is_set():
+                try:
+                    added = self.ingest(flush=False, complete=False)
+                    self.flush(due_only=True)
+                except Exception:
+                    logger.exception("Log ingestion failed, retrying in %gs", poll_interval)
+                    added = 0
+                if added == 0:
+                    stop_event.wait(poll_interval)
+        finally:
+            self.flush()
+
+    # embedding, when given, is the query already embedded by the caller
+    def similarity_search(self, query, k=4, embedding=None):
+        with self.lock:
+            if self.vectorstore is None:
+                return []
+            if embedding is not None:
+                return self.vectorstore.similarity_search_by_vector(list(embedding), k=k)
+            return self.vectorstore.similarity_search(query, k=k)
+
+
+def main():
+    from langchain_community.embeddings import BedrockEmbeddings
+    from aws_common.runtime import get_bedrock_runtime
+
+    parser = argparse.ArgumentParser(description="Stream log records into the log analysis FAISS index")
+    parser.add_argument("source", help="JSON Lines or JSON array log file")
+    parser.add_argument("--index-dir", default="./.log_index")
+    parser.add_argument("--batch-size", type=int, default=256)
+    parser.add_argument("--follow", action="store_true", help="keep tailing the file for new records")
+    parser.add_argument("--poll-interval", type=float, default=2.0)
+    parser.add_argument("--no-templates", action="store_true", help="embed every record instead of templates")
+    args = parser.parse_args()
+
+    miner = None if args.no_templates else TemplateMiner()
+    log_index = LogIndex(args.source, args.index_dir, BedrockEmbeddings(client=get_bedrock_runtime()), batch_size=args.batch_size, miner=miner)
+    start = time.perf_counter()
+    added = log_index.ingest(on_batch=lambda n: print(f"{n} records ingested", flush=True), complete=not args.follow)
+    print(f"Ingested {added} new records in {time.perf_counter() - start:.1f}s "
+          f"({log_index.checkpoint['records']} total)")
+    if log_index.miner is not None:
+        print(f"{len(log_index.miner.clusters)} templates")
+    if args.follow:
+        log_index.follow(args.poll_interval)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,153 @@
+import re
+
+# Online log template mining (a Drain-style fixed-depth parse tree).
+#
+# Variable parts of a message (timestamps, IDs, addresses, numbers) are masked first,
+# then the message is routed through the tree by token count and its leading tokens to
+# a small list of candidate clusters. It joins the most similar cluster, turning the
+# positions that differ into <*> slots, or starts a new one. Each cluster counts its
+# records, so repeated messages are embedded and analyzed once per template.
+#
+# See He et al., "Drain: An Online Log Parsing Approach with Fixed Depth Tree", ICWS 2017.
+
+PARAM = "<*>"
+
+DEFAULT_MASKS = [
+    (re.compile(r"\d{4}-\d{2}-\d{2}[T ]\d{2}:\d{2}:\d{2}(?:\.\d+)?(?:Z|[+-]\d{2}:?\d{2})?"), PARAM),
+    (re.compile(r"\b[0-9a-fA-F]{8}-[0-9a-fA-F]{4}-[0-9a-fA-F]{4}-[0-9a-fA-F]{4}-[0-9a-fA-F]{12}\b"), PARAM),
+    (re.compile(r"\b\d{1,3}(?:\.\d{1,3}){3}(?::\d+)?\b"), PARAM),
+    (re.compile(r"\b0x[0-9a-fA-F]+\b"), PARAM),
+    (re.compile(r"\b(?=[0-9a-fA-F]*\d)[0-9a-fA-F]{12,}\b"), PARAM),
+    (re.compile(r"(?<![\w.])[-+]?\d+(?:\.\d+)?(?:ms|s|%|[KMG]i?B)?(?![\w.])"), PARAM),
+]
+
+
+class LogCluster:
+    def __init__(self, cluster_id, tokens, size=1, level=None, example=None, analysis=None):
+        self.cluster_id = cluster_id
+        self.tokens = tokens
+        self.size = size
+        self.level = level
+        self.example = example
+        self.analysis = analysis  # LLM analysis of the template, shared by all its records
+
+    @property
+    def template(self):
+        return " ".join(self.tokens)
+
+    def to_dict(self):
+        return {
+            "cluster_id": self.cluster_id, "tokens": self.tokens, "size": self.size,
+            "level": self.level, "example": self.example, "analysis": self.analysis,
+        }
+
+
+class TemplateMiner:
+    def __init__(self, depth=4, sim_threshold=0.4, max_children=100, masks=None):
+        self.depth = max(depth, 3)
+        self.sim_threshold = sim_threshold
+        self.max_children = max_children
+        self.masks = DEFAULT_MASKS if masks is None else masks
+        self.clusters = {}
+        self.root = {}  # token count -> nested {token: node}, leaves are lists of cluster ids
+        self.total = 0
+
+    def tokenize(self, message):
+        for pattern, replacement in self.masks:
+            message = pattern.sub(replacement, message)
+        return message.split()
+
+    def _leaf(self, tokens, create):
+        node = self.root
+        key = str(len(tokens))
+        path = [key] + [
+            PARAM if any(c.isdigit() for c in token) else token
+            for token in tokens[:self.depth - 2]
+        ]
+        for i, key in enumerate(path):
+            is_last = i == len(path) - 1
+            if key not in node:
+                if not create:
+                    key = PARAM
+                    if key not in node:
+                        return None
+                elif i > 0 and len(node) >= self.max_children:
+                    key = PARAM
+                node.setdefault(key, [] if is_last else {})
+            node = node[key]
+        return node
+
+    def _similarity(self, template, tokens):
+        same = params = 0
+        for a, b in zip(template, tokens):
+            if a == PARAM:
+                params += 1
+            elif a == b:
+                same += 1
+        return same / len(tokens) if tokens else 1.0, params
+
+    def _best_match(self, leaf, tokens):
+        best, best_key = None, (-1.0, -1)
+        for cluster_id in leaf:
+            cluster = self.clusters[cluster_id]
+            key = self._similarity(cluster.tokens, tokens)
+            if key > best_key:
+                best, best_key = cluster, key
+        if best is not None and best_key[0] >= self.sim_threshold:
+            return best
+        return None
+
+    # Finds the template for a message without changing the miner
+    def match(self, message):
+        tokens = self.tokenize(message)
+        leaf = self._leaf(tokens, create=False)
+        if leaf is None:
+            return None
+        cluster = self._best_match(leaf, tokens)
+        if cluster is None:
+            return None
+        if all(a == PARAM or a == b for a, b in zip(cluster.tokens, tokens)):
+            return cluster
+        return None
+
+    # Adds a message and returns (cluster, change), where change is "created" for a new
+    # template, "updated" when the template gained a parameter slot and None otherwise
+    def add(self, message, level=None):
+        self.total += 1
+        tokens = self.tokenize(message)
+        leaf = self._leaf(tokens, create=True)
+        cluster = self._best_match(leaf, tokens)
+
+        if cluster is None:
+            cluster = LogCluster(len(self.clusters) + 1, tokens, level=level, example=message)
+            self.clusters[cluster.cluster_id] = cluster
+            leaf.append(cluster.cluster_id)
+            return cluster, "created"
+
+        cluster.size += 1
+        merged = [a if a == b else PARAM for a, b in zip(cluster.tokens, tokens)]
+        if merged != cluster.tokens:
+            cluster.tokens = merged
+            cluster.analysis = None  # the template changed, analyze it again
+            return cluster, "updated"
+        return cluster, None
+
+    def top(self, n=20):
+        return sorted(self.clusters.values(), key=lambda c: c.size, reverse=True)[:n]
+
+    def to_dict(self):
+        return {
+            "depth": self.depth, "sim_threshold": self.sim_threshold, "max_children": self.max_children,
+            "total": self.total, "root": self.root,
+            "clusters": [cluster.to_dict() for cluster in self.clusters.values()],
+        }
+
+    @classmethod
+    def from_dict(cls, data):
+        miner = cls(data["depth"], data["sim_threshold"], data["max_children"])
+        miner.total = data["total"]
+        miner.root = data["root"]
+        for item in data["clusters"]:
+            cluster = LogCluster(**item)
+            miner.clusters[cluster.cluster_id] = cluster
+        return miner
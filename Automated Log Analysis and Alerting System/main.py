@@ -1,44 +1,84 @@
 import os
+import sys
+import time
+import threading
 import streamlit as st
 from langchain_community.llms import Bedrock
 from langchain_community.embeddings import BedrockEmbeddings
-from langchain.indexes import VectorstoreIndexCreator
-from langchain_community.vectorstores import FAISS
 from langchain_text_splitters import RecursiveCharacterTextSplitter
-from langchain_community.document_loaders import JSONLoader
+from log_ingest import LogIndex
+from log_templates import TemplateMiner
+from log_alerts import AlertEngine, AlertRule
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from aws_common.response_cache import ResponseCache, make_key
+from aws_common.semantic_cache import SemanticCache
+from aws_common.runtime import call_stats, get_bedrock_runtime
 
 os.environ["AWS_ACCESS_KEY_ID"] = "xxx"
 os.environ["AWS_SECRET_ACCESS_KEY"] = "xxx"
 os.environ["AWS_DEFAULT_REGION"] = "us-east-1"
 
-def get_llm():
-    model_kwargs = {
-        "maxTokens": 1024,
-        "temperature": 0,
-        "topP": 0.5,
-        "stopSequences": [],
-        "countPenalty": {"scale":0},
-        "presencePenalty": {"scale":0},
-        "frequencyPenalty": {"scale":0}
+LOG_SOURCE = os.getenv("LOG_SOURCE", "logs.json")  # JSON array or JSON Lines file
+LOG_INDEX_DIR = "./.log_index"
+LOG_BATCH_SIZE = int(os.getenv("LOG_BATCH_SIZE", "256"))
+LOG_FOLLOW = os.getenv("LOG_FOLLOW", "false").lower() == "true"  # keep tailing LOG_SOURCE in the background
+LOG_TEMPLATES = os.getenv("LOG_TEMPLATES", "true").lower() == "true"  # embed and analyze mined templates, not raw records
+LOG_CONTEXT_K = int(os.getenv("LOG_CONTEXT_K", "8"))  # similar historical records retrieved per analysis
+LOG_CONTEXT_TOKENS = int(os.getenv("LOG_CONTEXT_TOKENS", "1500"))  # prompt budget for those records
 
-    }
+LLM_MODEL_ID = "ai21.j2-ultra-v1"
+LLM_MODEL_KWARGS = {
+    "maxTokens": 1024,
+    "temperature": 0,
+    "topP": 0.5,
+    "stopSequences": [],
+    "countPenalty": {"scale":0},
+    "presencePenalty": {"scale":0},
+    "frequencyPenalty": {"scale":0}
+
+}
+LLM_CACHE_SIZE = int(os.getenv("LLM_CACHE_SIZE", "4096"))
+LLM_CACHE_TTL = float(os.getenv("LLM_CACHE_TTL", "86400"))  # seconds
+LLM_CACHE_PATH = os.getenv("LLM_CACHE_PATH")  # optional SQLite file to keep responses across restarts
+# Entries at least this similar (cosine) to an analyzed one reuse its analysis; above 1 disables
+SEMANTIC_CACHE_THRESHOLD = float(os.getenv("SEMANTIC_CACHE_THRESHOLD", "0.95"))
+SEMANTIC_CACHE_SIZE = int(os.getenv("SEMANTIC_CACHE_SIZE", "10000"))
 
+# Sliding-window alert rules, evaluated on every ingested record
+ALERT_RULES = [
+    AlertRule("Error burst", scope="level", value="ERROR", window_seconds=60, threshold=10),
+    AlertRule("Warning burst", scope="level", value="WARNING", window_seconds=60, threshold=50),
+    AlertRule("Error rate spike", scope="level", value="ERROR", window_seconds=300, rate_factor=3, min_count=10),
+    AlertRule("Template spike", scope="template", value="*", window_seconds=300, rate_factor=5, min_count=50),
+]
+
+# One LLM wrapper (and underlying Bedrock client) per process, shared by all sessions
+@st.cache_resource
+def get_llm():
     llm = Bedrock(
-        model_id="ai21.j2-ultra-v1",
-        region_name="us-east-1",
-        model_kwargs=model_kwargs
+        model_id=LLM_MODEL_ID,
+        model_kwargs=LLM_MODEL_KWARGS,
+        client=get_bedrock_runtime(region="us-east-1")
     )
 
     return llm
 
+# Responses keyed by model, parameters and normalized input, shared by all sessions
+@st.cache_resource
+def get_response_cache():
+    return ResponseCache(max_entries=LLM_CACHE_SIZE, ttl_seconds=LLM_CACHE_TTL, path=LLM_CACHE_PATH)
+
+# Analyses of paraphrased log entries, found by embedding similarity
+@st.cache_resource
+def get_semantic_cache():
+    return SemanticCache(BedrockEmbeddings(client=get_bedrock_runtime()).embed_query, threshold=SEMANTIC_CACHE_THRESHOLD, max_entries=SEMANTIC_CACHE_SIZE)
+
+# Loads the saved log index and appends only the records written since the last run.
+# The index is shared by every session of the process.
+@st.cache_resource(show_spinner=False)
 def get_index():
-    embeddings = BedrockEmbeddings()
-    loader = JSONLoader(
-        file_path="logs.json",
-        jq_schema='.[]',
-        content_key='log',
-        metadata_func=lambda record, metadata: metadata.update(record) or metadata
-    )
+    embeddings = BedrockEmbeddings(client=get_bedrock_runtime())
 
     text_splitter = RecursiveCharacterTextSplitter(
         separators=["\n\n", "\n", ".", " "],
@@ -46,21 +86,122 @@ def get_index():
         chunk_overlap=0
     )
 
-    index_creator = VectorstoreIndexCreator(
-        vectorstore_cls=FAISS,
-        embedding=embeddings,
-        text_splitter=text_splitter
+    log_index = LogIndex(
+        LOG_SOURCE,
+        LOG_INDEX_DIR,
+        embeddings,
+        text_splitter=text_splitter,
+        batch_size=LOG_BATCH_SIZE,
+        miner=TemplateMiner() if LOG_TEMPLATES else None,
+        alert_engine=AlertEngine(ALERT_RULES)
     )
+    log_index.ingest(complete=not LOG_FOLLOW)  # while tailing, a last line without a newline is still being written
+
+    if LOG_FOLLOW:
+        threading.Thread(target=log_index.follow, name="log-follower", daemon=True).start()
+
+    return log_index
+
+# Rough token count for prompt budgeting (about 4 characters per token for English text)
+def estimate_tokens(text):
+    return len(text) // 4 + 1
+
+def format_context_doc(doc):
+    metadata = doc.metadata
+    if "template_id" in metadata:
+        return f"[{metadata.get('level')}] {doc.page_content} (seen {metadata.get('count')} times)"
+    return f"[{metadata.get('timestamp', '')} {metadata.get('level', '')}] {doc.page_content}"
 
-    index_from_loader = index_creator.from_loaders([loader])
+# Retrieves the k most similar historical records and keeps as many as fit the token budget,
+# most similar first. Returns (context lines, retrieval latency in ms).
+def get_log_context(log_index, log, k=LOG_CONTEXT_K, token_budget=LOG_CONTEXT_TOKENS, embedding=None):
+    start = time.perf_counter()
+    docs = log_index.similarity_search(log, k=k, embedding=embedding) if log and k > 0 else []
+    retrieval_ms = (time.perf_counter() - start) * 1000
 
-    return index_from_loader
+    lines = []
+    used = 0
+    for doc in docs:
+        line = format_context_doc(doc)
+        cost = estimate_tokens(line)
+        if used + cost > token_budget:
+            break
+        lines.append(line)
+        used += cost
+    return lines, retrieval_ms
+
+# Analyzes a log entry with the most similar historical records as context. Entries that
+# match a mined template reuse the analysis of that template, so each template is sent to
+# the LLM only once for all of its records, and entries close enough to an analyzed one
+# reuse its analysis through the semantic cache. Returns (analysis, per-call stats).
+def analyze_log(log, log_index=None):
+    stats = {"cached": False, "retrieval_ms": 0.0, "context_records": 0, "prompt_tokens": 0, "llm_ms": 0.0,
+             "similarity": None}
+    cluster = log_index.match_template(log) if log_index is not None else None
+    if cluster is not None and cluster.analysis:
+        stats["cached"] = True
+        return cluster.analysis, stats
+
+    response_cache = get_response_cache()
+    cache_key = make_key(LLM_MODEL_ID, LLM_MODEL_KWARGS, log)
+    analysis = response_cache.get(cache_key)
+    if analysis is not None:
+        stats["cached"] = True
+        return analysis, stats
+
+    # One embedding call serves both the semantic cache lookup and the context retrieval
+    semantic_cache = get_semantic_cache()
+    embedding = vector = None
+    if semantic_cache.threshold <= 1 and log:
+        embedding = semantic_cache.embed_normalized(log)
+        vector = semantic_cache.to_vector(embedding)
+        analysis, stats["similarity"] = semantic_cache.lookup(vector=vector)
+        if analysis is not None:
+            stats["cached"] = True
+            response_cache.put(cache_key, analysis)
+            return analysis, stats
+
+    context, stats["retrieval_ms"] = (
+        get_log_context(log_index, log, embedding=embedding) if log_index is not None else ([], 0.0)
+    )
+    stats["context_records"] = len(context)
+
+    if cluster is not None:
+        entry = (
+            f"Log template (<*> marks variable values): {cluster.template}\n"
+            f"Seen {cluster.size} times. Example: {cluster.example}"
+        )
+    else:
+        entry = log
+    history = "\n".join(context)
+    prompt = f"Similar historical log records:\n{history}\n\n" if context else ""
+    prompt += f"{entry}\n\nAnalyze the log and determine if there are any issues. If so, provide a summary and suggest actions."
+    stats["prompt_tokens"] = estimate_tokens(prompt)
 
-def analyze_log(log):
     llm = get_llm()
-    prompt = f"{log}\n\nAnalyze the log and determine if there are any issues. If so, provide a summary and suggest actions."
+    start = time.perf_counter()
     analysis = llm.invoke(prompt)
-    return analysis
+    stats["llm_ms"] = (time.perf_counter() - start) * 1000
+    response_cache.put(cache_key, analysis)
+    if vector is not None:
+        semantic_cache.put(log, analysis, vector=vector)
+
+    if cluster is not None:
+        cluster.analysis = analysis
+        log_index.save_templates()
+    return analysis, stats
+
+# Summarizes an alert from the sample of messages in its window; only alerting
+# windows are sent to the LLM
+def summarize_alert(alert):
+    llm = get_llm()
+    samples = "\n".join(alert.samples)
+    prompt = (
+        f"Alert: {alert.describe()}\n"
+        f"Recent log messages from the alerting window:\n{samples}\n\n"
+        "Summarize what is happening, the likely cause and suggested actions."
+    )
+    return get_response_cache().get_or_call(LLM_MODEL_ID, LLM_MODEL_KWARGS, prompt, lambda: llm.invoke(prompt))
 
 st.set_page_config(layout="wide")
 
@@ -86,14 +227,52 @@ footer {
 
 st.title("Automated Log Analysis and Alerting System")
 
+with st.sidebar.expander("AWS calls"):
+    st.table(call_stats())
+
 if 'vector_index' not in st.session_state:
     with st.spinner("Indexing logs..."):
         st.session_state.vector_index = get_index()
 
+log_index = st.session_state.vector_index
+if log_index.miner is not None:
+    with st.expander(f"Log templates ({len(log_index.miner.clusters)} from {log_index.miner.total} records)"):
+        st.table([
+            {"Template": cluster.template, "Count": cluster.size, "Level": cluster.level}
+            for cluster in log_index.miner.top(20)
+        ])
+
+alerts = list(log_index.alert_engine.alerts)[::-1] if log_index.alert_engine is not None else []
+if alerts:
+    st.subheader(f"Alerts ({len(alerts)})")
+    for alert in alerts[:10]:
+        st.warning(f"{alert.describe()} (detected in {alert.latency_ms:.2f} ms)")
+    alert_choice = st.selectbox("Alert to summarize:", range(min(len(alerts), 10)), format_func=lambda i: alerts[i].describe())
+    if st.button("Summarize alert"):
+        with st.spinner("Summarizing..."):
+            st.write(summarize_alert(alerts[alert_choice]))
+
 input_log = st.text_area("Enter a log entry:")
 analyze_button = st.button("Analyze", type="primary")
 if analyze_button:
     with st.spinner("Analyzing..."):
-        analysis = analyze_log(log=input_log)
+        analysis, stats = analyze_log(log=input_log, log_index=log_index)
         st.markdown(f"### Log Entry: {input_log}")
+        cluster = log_index.match_template(input_log)
+        if cluster is not None:
+            st.caption(f"Template: {cluster.template} (seen {cluster.size} times)")
         st.write(f"Analysis: {analysis}")
+        if stats["cached"] and stats["similarity"] is not None:
+            st.caption(f"Reused the analysis of a similar entry (similarity {stats['similarity']:.3f}).")
+        elif stats["cached"]:
+            st.caption("Reused a previous analysis of this entry or its template.")
+        else:
+            st.caption(
+                f"Retrieval: {stats['retrieval_ms']:.0f} ms, {stats['context_records']} records | "
+                f"Prompt: ~{stats['prompt_tokens']} tokens | LLM: {stats['llm_ms']:.0f} ms"
+            )
+        semantic_stats = get_semantic_cache().stats()
+        st.caption(
+            f"Semantic cache: {semantic_stats['hits']} hits, {semantic_stats['misses']} misses "
+            f"({semantic_stats['hit_rate']:.0%}), {semantic_stats['entries']} entries"
+        )
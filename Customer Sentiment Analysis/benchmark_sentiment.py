@@ -0,0 +1,154 @@
+import os
+import sys
+import json
+import time
+import argparse
+import statistics
+from sentiment_batch import parse_label, review_text
+from sentiment_local import LexiconClassifier
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from aws_common.json_stream import iter_json_records
+from aws_common.runtime import get_bedrock_runtime
+
+# Accuracy and latency of each sentiment tier on labelled reviews, and of the cascade
+# at several confidence thresholds.
+#
+# The ground truth has to be independent of the lexicon for the threshold to mean
+# anything, so by default the reviews (e.g. a sample of REVIEWS_SOURCE) are labelled by
+# a different, stronger model than the production one (--label-model-id). Its labels are
+# kept in <file>.labels.jsonl and reused on later runs; records that already carry a
+# "label" use it. labelled_reviews.json was written together with the lexicon and only
+# shows that the script runs, not which threshold to pick.
+#
+# The local tier always runs. With --llm every review is also sent to the production
+# model once, so the cascade numbers use real LLM answers for escalated reviews; without
+# it only the local tier and the escalation rate are reported.
+#
+#   python benchmark_sentiment.py reviews.json
+#   python benchmark_sentiment.py reviews.json --thresholds 0.4 0.5 0.6 0.7 --llm
+
+
+def percentiles(latencies):
+    latencies = sorted(latencies)
+    p95 = latencies[min(len(latencies) - 1, int(0.95 * len(latencies)))]
+    return statistics.median(latencies), p95
+
+
+def run_local(classifier, reviews, repeat):
+    predictions, latencies = [], []
+    for review in reviews:
+        start = time.perf_counter()
+        for _ in range(repeat):
+            prediction = classifier.predict(review)
+        latencies.append((time.perf_counter() - start) * 1000 / repeat)
+        predictions.append(prediction)
+    return predictions, latencies
+
+
+def run_llm(reviews, model_id):
+    from langchain_community.llms import Bedrock
+
+    llm = Bedrock(model_id=model_id, model_kwargs={"maxTokens": 1024, "temperature": 0, "topP": 0.5},
+                  client=get_bedrock_runtime())
+    labels, latencies = [], []
+    for review in reviews:
+        start = time.perf_counter()
+        # Same prompt as get_sentiment_analysis in main.py
+        answer = llm.invoke(f"{review}\n\nAnalyze the sentiment of the above review.")
+        latencies.append((time.perf_counter() - start) * 1000)
+        labels.append(parse_label(answer))
+    return labels, latencies
+
+
+LABEL_PROMPT = (
+    "Classify the sentiment of the customer review below as positive, negative, neutral or mixed. "
+    "Answer with that one word.\n\n<review>\n{review}\n</review>"
+)
+
+
+# Reference labels for the reviews, from the labels file next to path where model_id was
+# already asked and from model_id otherwise
+def label_reviews(path, reviews, model_id):
+    labels_path = os.path.splitext(path)[0] + ".labels.jsonl"
+    labels = {}
+    if os.path.exists(labels_path):
+        labels = {
+            record["review"]: record["label"] for record, _ in iter_json_records(labels_path, complete=True)
+            if record.get("model_id") == model_id
+        }
+    client = get_bedrock_runtime()
+    with open(labels_path, "a") as f:
+        for review in reviews:
+            if review in labels:
+                continue
+            body = {
+                "anthropic_version": "bedrock-2023-05-31", "max_tokens": 5, "temperature": 0,
+                "messages": [{"role": "user", "content": LABEL_PROMPT.format(review=review)}],
+            }
+            response = client.invoke_model(body=json.dumps(body), modelId=model_id)
+            content = json.loads(response["body"].read())["content"]
+            labels[review] = parse_label(content[0]["text"] if content else "")
+            f.write(json.dumps({"review": review, "label": labels[review], "model_id": model_id}) + "\n")
+    return [labels[review] for review in reviews]
+
+
+def accuracy(predicted, truth):
+    return sum(p == t for p, t in zip(predicted, truth)) / len(truth) if truth else 0.0
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the local and LLM sentiment tiers on labelled reviews")
+    parser.add_argument("path", nargs="?", default="reviews.json",
+                        help="JSON array or JSON Lines file of {\"review\"} records, optionally with a \"label\"")
+    parser.add_argument("--thresholds", type=float, nargs="+", default=[0.4, 0.5, 0.6, 0.7, 0.8])
+    parser.add_argument("--repeat", type=int, default=100, help="local predictions per review when timing")
+    parser.add_argument("--llm", action="store_true", help="also query Bedrock for every review")
+    parser.add_argument("--model-id", default="ai21.j2-ultra-v1")
+    parser.add_argument("--label-model-id", default="anthropic.claude-3-sonnet-20240229-v1:0",
+                        help="model that labels reviews without a \"label\"")
+    args = parser.parse_args()
+
+    records = [record for record, _ in iter_json_records(args.path, complete=True)]
+    reviews = [review_text(record) for record in records]
+    truth = [str(record.get("label", "")).lower() if isinstance(record, dict) else "" for record in records]
+    unlabelled = [i for i, label in enumerate(truth) if not label]
+    if unlabelled:
+        labels = label_reviews(args.path, [reviews[i] for i in unlabelled], args.label_model_id)
+        for i, label in zip(unlabelled, labels):
+            truth[i] = label
+    kept = [i for i, label in enumerate(truth) if label != "unknown"]
+    reviews, truth = [reviews[i] for i in kept], [truth[i] for i in kept]
+    print(f"{len(reviews)} labelled reviews ({len(unlabelled)} labelled by {args.label_model_id}, "
+          f"{len(records) - len(kept)} without a usable label skipped)\n")
+    if not reviews:
+        sys.exit(f"No review in {args.path} has a usable label, nothing to benchmark")
+
+    local, local_latencies = run_local(LexiconClassifier(), reviews, args.repeat)
+    local_labels = [label for label, _ in local]
+    print(f"{'tier':<12}{'accuracy':>10}{'p50 ms':>12}{'p95 ms':>12}")
+    p50, p95 = percentiles(local_latencies)
+    print(f"{'local':<12}{accuracy(local_labels, truth):>10.3f}{p50:>12.4f}{p95:>12.4f}")
+
+    llm_labels = None
+    if args.llm:
+        llm_labels, llm_latencies = run_llm(reviews, args.model_id)
+        p50, p95 = percentiles(llm_latencies)
+        print(f"{'llm':<12}{accuracy(llm_labels, truth):>10.3f}{p50:>12.1f}{p95:>12.1f}")
+
+    print(f"\n{'threshold':<12}{'escalated':>10}{'local acc':>12}{'cascade acc':>14}")
+    for threshold in args.thresholds:
+        kept = [i for i, (_, confidence) in enumerate(local) if confidence >= threshold]
+        escalated = 1 - len(kept) / len(reviews)
+        local_accuracy = accuracy([local_labels[i] for i in kept], [truth[i] for i in kept])
+        if llm_labels is None:
+            cascade = "-"
+        else:
+            kept_set = set(kept)
+            answers = [local_labels[i] if i in kept_set else llm_labels[i] for i in range(len(reviews))]
+            cascade = f"{accuracy(answers, truth):.3f}"
+        print(f"{threshold:<12}{escalated:>10.1%}{local_accuracy:>12.3f}{cascade:>14}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,4 +1,7 @@
 import os
+import sys
+import json
+import time
 import streamlit as st
 from langchain_community.llms import Bedrock
 from langchain_community.embeddings import BedrockEmbeddings
@@ -7,33 +10,149 @@ from langchain_community.vectorstores import FAISS
 from langchain_text_splitters import RecursiveCharacterTextSplitter
 from langchain_community.document_loaders import JSONLoader
 
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from aws_common.response_cache import ResponseCache
+from aws_common.runtime import call_stats, get_bedrock_runtime
+from aws_common.semantic_cache import SemanticCache
+from sentiment_batch import LABELS, BatchStats, score_reviews
+from sentiment_local import LexiconClassifier
+
 os.environ["AWS_ACCESS_KEY_ID"] = "xxx"
 os.environ["AWS_SECRET_ACCESS_KEY"] = "xxx"
 os.environ["AWS_DEFAULT_REGION"] = "us-east-1"
 
-def get_llm():
-    model_kwargs = {
-        "maxTokens": 1024,
-        "temperature": 0,
-        "topP": 0.5,
-        "stopSequences": [],
-        "countPenalty": {"scale": 0},
-        "presencePenalty": {"scale": 0},
-        "frequencyPenalty": {"scale": 0}
-    }
+LLM_MODEL_ID = "ai21.j2-ultra-v1"
+LLM_MODEL_KWARGS = {
+    "maxTokens": 1024,
+    "temperature": 0,
+    "topP": 0.5,
+    "stopSequences": [],
+    "countPenalty": {"scale": 0},
+    "presencePenalty": {"scale": 0},
+    "frequencyPenalty": {"scale": 0}
+}
+LLM_CACHE_SIZE = int(os.getenv("LLM_CACHE_SIZE", "4096"))
+LLM_CACHE_TTL = float(os.getenv("LLM_CACHE_TTL", "86400"))  # seconds
+LLM_CACHE_PATH = os.getenv("LLM_CACHE_PATH")  # optional SQLite file to keep responses across restarts
+REVIEWS_SOURCE = os.getenv("REVIEWS_SOURCE", "reviews.json")  # JSON array or JSON Lines file
+BATCH_CONCURRENCY = int(os.getenv("BATCH_CONCURRENCY", "8"))
+BATCH_REFRESH_SECONDS = 0.25  # how often the batch view is redrawn
+# Reviews the local classifier labels with at least this confidence skip Bedrock; above 1
+# sends every review to the LLM
+SENTIMENT_LOCAL_THRESHOLD = float(os.getenv("SENTIMENT_LOCAL_THRESHOLD", "0.6"))
+# Reviews at least this similar (cosine) to an answered one reuse its answer; above 1 disables
+SEMANTIC_CACHE_THRESHOLD = float(os.getenv("SEMANTIC_CACHE_THRESHOLD", "0.95"))
+SEMANTIC_CACHE_SIZE = int(os.getenv("SEMANTIC_CACHE_SIZE", "10000"))
 
+# One LLM wrapper (and underlying Bedrock client) per process, shared by all sessions
+@st.cache_resource
+def get_llm():
     llm = Bedrock(
-        model_id="ai21.j2-ultra-v1",
-        model_kwargs=model_kwargs
+        model_id=LLM_MODEL_ID,
+        model_kwargs=LLM_MODEL_KWARGS,
+        client=get_bedrock_runtime()
     )
 
     return llm
 
-def get_sentiment_analysis(review):
-    llm = get_llm()
-    prompt = f"{review}\n\nAnalyze the sentiment of the above review."
-    sentiment = llm.invoke(prompt)
-    return sentiment
+# Responses keyed by model, parameters and normalized review, shared by all sessions
+@st.cache_resource
+def get_response_cache():
+    return ResponseCache(max_entries=LLM_CACHE_SIZE, ttl_seconds=LLM_CACHE_TTL, path=LLM_CACHE_PATH)
+
+# Answers to paraphrases of earlier reviews, found by embedding similarity
+@st.cache_resource
+def get_semantic_cache():
+    return SemanticCache(BedrockEmbeddings(client=get_bedrock_runtime()).embed_query, threshold=SEMANTIC_CACHE_THRESHOLD, max_entries=SEMANTIC_CACHE_SIZE)
+
+@st.cache_resource
+def get_local_classifier():
+    return LexiconClassifier()
+
+# Returns (sentiment, tier): tier is "local" when the lexicon classifier was confident
+# enough, "cache" when the same review had already been answered, "semantic" when a
+# near-duplicate had and "llm" when the review was escalated to Bedrock. llm, cache, semantic_cache and classifier can
+# be passed in by worker threads, which have no Streamlit context.
+def get_sentiment_analysis(review, llm=None, cache=None, semantic_cache=None, classifier=None,
+                           threshold=SENTIMENT_LOCAL_THRESHOLD):
+    label, confidence = (classifier or get_local_classifier()).predict(review)
+    if confidence >= threshold:
+        return f"{label.capitalize()} (local classifier, confidence {confidence:.2f})", "local"
+
+    semantic_cache = semantic_cache or get_semantic_cache()
+    tier = "cache"  # unless invoke() runs
+
+    def invoke():
+        nonlocal tier
+        tier = "llm"
+        prompt = f"{review}\n\nAnalyze the sentiment of the above review."
+        if semantic_cache.threshold > 1:
+            return (llm or get_llm()).invoke(prompt)
+        sentiment, hit = semantic_cache.get_or_call(review, lambda: (llm or get_llm()).invoke(prompt))
+        if hit:
+            tier = "semantic"
+        return sentiment
+
+    # Exact repeats are answered by the response cache before anything is embedded
+    sentiment = (cache or get_response_cache()).get_or_call(LLM_MODEL_ID, LLM_MODEL_KWARGS, review, invoke)
+    return sentiment, tier
+
+def show_semantic_cache_stats():
+    stats = get_semantic_cache().stats()
+    similarity = stats["mean_hit_similarity"]
+    st.caption(
+        f"Semantic cache: {stats['hits']} hits, {stats['misses']} misses ({stats['hit_rate']:.0%}), "
+        f"{stats['entries']} entries"
+        + (f", mean hit similarity {similarity:.3f}" if similarity is not None else "")
+    )
+
+def show_batch_stats(stats, placeholder):
+    snapshot = stats.snapshot()
+    with placeholder.container():
+        columns = st.columns(len(LABELS) + 4)
+        for column, label in zip(columns, LABELS):
+            column.metric(label.capitalize(), snapshot["labels"][label])
+        columns[-4].metric("Escalated to LLM", f"{snapshot['escalation_rate']:.0%}")
+        columns[-3].metric("Throughput", f"{snapshot['throughput']:.1f}/s")
+        columns[-2].metric("p50 latency", f"{snapshot['p50_ms'] or 0:.0f} ms")
+        columns[-1].metric("p95 latency", f"{snapshot['p95_ms'] or 0:.0f} ms")
+        st.caption(
+            f"{snapshot['done']} scored, {snapshot['failed']} failed, "
+            f"{snapshot['labels']['unknown']} without a clear label"
+        )
+        st.table([
+            {"review": result["review"], "label": result["label"] or "error", "tier": result["tier"],
+             "latency (ms)": round(result["latency_ms"], 2)}
+            for result in reversed(stats.recent)
+        ])
+
+def run_batch(path, output_path, concurrency):
+    llm, cache, semantic_cache, classifier = get_llm(), get_response_cache(), get_semantic_cache(), get_local_classifier()
+    analyze = lambda review: get_sentiment_analysis(
+        review, llm=llm, cache=cache, semantic_cache=semantic_cache, classifier=classifier
+    )
+    size = os.path.getsize(path) or 1
+    stats = BatchStats()
+    progress_bar = st.progress(0.0, text="Scoring reviews...")
+    placeholder = st.empty()
+    output = open(output_path, "a", encoding="utf-8") if output_path else None
+    last_refresh = 0.0
+    try:
+        for result, end_offset in score_reviews(path, analyze, concurrency=concurrency):
+            stats.add(result)
+            if output:
+                output.write(json.dumps(result) + "\n")
+            # Redraw on a timer rather than per result, so the UI keeps up with fast batches
+            if time.perf_counter() - last_refresh >= BATCH_REFRESH_SECONDS:
+                progress_bar.progress(min(end_offset / size, 1.0), text=f"Scored {stats.done + stats.failed} reviews")
+                show_batch_stats(stats, placeholder)
+                last_refresh = time.perf_counter()
+    finally:
+        if output:
+            output.close()
+    progress_bar.progress(1.0, text=f"Scored {stats.done + stats.failed} reviews")
+    show_batch_stats(stats, placeholder)
+    show_semantic_cache_stats()
 
 st.set_page_config(layout="wide")
 
@@ -59,10 +178,32 @@ footer {
 
 st.title("Customer Review Sentiment Analysis")
 
+with st.sidebar.expander("AWS calls"):
+    st.table(call_stats())
+
 input_text = st.text_input("Enter a customer review:")
 go_button = st.button("Analyze", type="primary")
 if go_button:
     with st.spinner("Analyzing..."):
-        sentiment = get_sentiment_analysis(review=input_text)
+        start = time.perf_counter()
+        sentiment, tier = get_sentiment_analysis(review=input_text)
+        elapsed_ms = (time.perf_counter() - start) * 1000
         st.markdown(f"### Review: {input_text}")
         st.write(f"Sentiment: {sentiment}")
+        handled_by = {
+            "local": "the local classifier", "cache": "the response cache", "semantic": "the semantic cache",
+            "llm": "Bedrock",
+        }[tier]
+        st.caption(f"Handled by {handled_by} in {elapsed_ms:.2f} ms")
+        if tier != "local":
+            show_semantic_cache_stats()
+
+with st.expander("Batch scoring"):
+    batch_source = st.text_input("Review file (JSON array or JSON Lines)", value=REVIEWS_SOURCE)
+    batch_output = st.text_input("Write results to (JSON Lines, optional)")
+    batch_concurrency = st.number_input("Concurrent requests", min_value=1, max_value=64, value=BATCH_CONCURRENCY)
+    if st.button("Score file"):
+        if not os.path.exists(batch_source):
+            st.error(f"File not found: {batch_source}")
+        else:
+            run_batch(batch_source, batch_output or None, int(batch_concurrency))
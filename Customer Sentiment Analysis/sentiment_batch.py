@@ -0,0 +1,126 @@
+import os
+import re
+import sys
+import math
+import time
+from array import array
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from aws_common.json_stream import iter_json_records
+
+# Batch sentiment scoring of review files.
+#
+# Reviews are streamed from a JSON array or JSON Lines file and scored on a bounded pool
+# of workers, with at most a few times the worker count in flight. Results are handed
+# back as they complete and folded into running aggregates (label counts, throughput,
+# latency percentiles from a fixed log-bucket histogram), so memory stays constant
+# whatever the size of the file.
+
+LABELS = ("positive", "negative", "neutral", "mixed")
+LABEL_PATTERN = re.compile(r"\b(positive|negative|neutral|mixed)\b", re.IGNORECASE)
+
+
+# Maps a free-text LLM answer to a label, "unknown" when none is named
+def parse_label(sentiment):
+    match = LABEL_PATTERN.search(str(sentiment))
+    return match.group(1).lower() if match else "unknown"
+
+
+def review_text(record, review_key="review"):
+    if isinstance(record, dict):
+        return str(record.get(review_key, ""))
+    return str(record)
+
+
+class LatencyHistogram:
+    # Log-spaced buckets: each is `growth` times wider than the one before, so any
+    # percentile is within (growth - 1) of the true value using a fixed number of counters
+    def __init__(self, min_ms=0.01, max_ms=600000.0, growth=1.02):
+        self.min_ms = min_ms
+        self.log_growth = math.log(growth)
+        self.counts = array("q", [0] * (int(math.log(max_ms / min_ms) / self.log_growth) + 2))
+        self.total = 0
+
+    def add(self, latency_ms):
+        bucket = 0
+        if latency_ms > self.min_ms:
+            bucket = min(len(self.counts) - 1, int(math.log(latency_ms / self.min_ms) / self.log_growth) + 1)
+        self.counts[bucket] += 1
+        self.total += 1
+
+    def percentile(self, q):
+        if not self.total:
+            return None
+        rank = max(1, math.ceil(q / 100 * self.total))
+        seen = 0
+        for bucket, count in enumerate(self.counts):
+            seen += count
+            if seen >= rank:
+                return self.min_ms * math.exp(self.log_growth * bucket)
+        return None
+
+
+class BatchStats:
+    def __init__(self, recent=20):
+        self.labels = dict.fromkeys(LABELS + ("unknown",), 0)
+        self.tiers = {"local": 0, "cache": 0, "semantic": 0, "llm": 0}
+        self.done = 0
+        self.failed = 0
+        self.latency = LatencyHistogram()
+        self.recent = deque(maxlen=recent)  # last results, for display
+        self.started = time.perf_counter()
+
+    def add(self, result):
+        if result["error"] is None:
+            self.done += 1
+            self.labels[result["label"]] += 1
+            self.tiers[result["tier"]] += 1
+            self.latency.add(result["latency_ms"])
+        else:
+            self.failed += 1
+        self.recent.append(result)
+
+    def snapshot(self):
+        elapsed = time.perf_counter() - self.started
+        return {
+            "done": self.done,
+            "failed": self.failed,
+            "labels": dict(self.labels),
+            "tiers": dict(self.tiers),
+            "escalation_rate": self.tiers["llm"] / self.done if self.done else 0.0,  # answered by Bedrock
+            "throughput": self.done / elapsed if elapsed else 0.0,  # reviews per second
+            "p50_ms": self.latency.percentile(50),
+            "p95_ms": self.latency.percentile(95),
+        }
+
+
+# analyze(review) returns (sentiment, tier)
+def _score(analyze, index, review):
+    start = time.perf_counter()
+    try:
+        sentiment, tier = analyze(review)
+    except Exception as e:
+        return {"index": index, "review": review, "sentiment": None, "label": None, "tier": None,
+                "error": str(e), "latency_ms": (time.perf_counter() - start) * 1000}
+    return {"index": index, "review": review, "sentiment": sentiment, "label": parse_label(sentiment),
+            "tier": tier, "error": None, "latency_ms": (time.perf_counter() - start) * 1000}
+
+
+# Yields (result, end_offset) for every review in path as soon as it has been scored,
+# in completion order. end_offset is the byte position read so far, for progress.
+def score_reviews(path, analyze, concurrency=8, review_key="review"):
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        in_flight = set()
+        end_offset = 0
+        for index, (record, end_offset) in enumerate(iter_json_records(path, complete=True)):
+            if len(in_flight) >= concurrency * 2:
+                finished, in_flight = wait(in_flight, return_when=FIRST_COMPLETED)
+                for future in finished:
+                    yield future.result(), end_offset
+            in_flight.add(pool.submit(_score, analyze, index, review_text(record, review_key)))
+        while in_flight:
+            finished, in_flight = wait(in_flight, return_when=FIRST_COMPLETED)
+            for future in finished:
+                yield future.result(), end_offset
@@ -0,0 +1,94 @@
+import re
+
+# Local lexicon sentiment classifier, the first tier of the sentiment cascade.
+#
+# Each review is tokenized once and scored against weighted positive and negative word
+# lists. Negators ("not", "never", "n't") flip the next few words, intensifiers scale
+# them, and the clause after "but" counts more than the one before. Confidence is the
+# share of the evidence that agrees with the winning side, discounted when there is
+# little evidence, so short or mixed reviews fall below the threshold and go to the LLM.
+
+POSITIVE = {
+    "excellent": 3, "amazing": 3, "outstanding": 3, "fantastic": 3, "perfect": 3, "love": 3, "loved": 3,
+    "awesome": 3, "superb": 3, "wonderful": 3, "best": 2.5, "great": 2, "recommend": 2, "recommended": 2,
+    "helpful": 2, "happy": 2, "pleased": 2, "satisfied": 2, "impressed": 2, "reliable": 2, "fast": 1.5,
+    "quick": 1.5, "easy": 1.5, "good": 1.5, "nice": 1.5, "friendly": 1.5, "comfortable": 1.5, "works": 1,
+    "worth": 1.5, "value": 1, "beautiful": 2, "smooth": 1.5, "durable": 1.5, "enjoy": 2,
+    "enjoyed": 2, "responsive": 1.5, "thanks": 1, "thank": 1, "fine": 0.5, "solid": 1.5, "glad": 1.5,
+}
+NEGATIVE = {
+    "terrible": 3, "awful": 3, "horrible": 3, "worst": 3, "hate": 3, "hated": 3, "useless": 3,
+    "broken": 2.5, "damaged": 2.5, "defective": 2.5, "scam": 3, "refund": 1.5, "disappointed": 2.5,
+    "disappointing": 2.5, "poor": 2, "bad": 2, "rude": 2, "unhelpful": 2, "unsatisfied": 2,
+    "dissatisfied": 2.5, "slow": 1.5, "delayed": 1.5, "late": 1.5, "missing": 1.5, "wrong": 1.5,
+    "cheap": 1, "flimsy": 2, "overpriced": 2, "expensive": 1, "problem": 1.5, "problems": 1.5,
+    "issue": 1, "issues": 1, "fail": 2, "failed": 2, "fails": 2, "waste": 2.5, "return": 1,
+    "returned": 1.5, "difficult": 1.5, "confusing": 1.5, "annoying": 2, "avoid": 2.5,
+}
+NEGATORS = {"not", "no", "never", "nothing", "hardly", "barely", "without", "cannot", "cant", "dont",
+            "doesnt", "didnt", "isnt", "wasnt", "wont", "arent", "werent", "couldnt", "wouldnt",
+            "shouldnt", "hasnt", "havent", "nor"}
+INTENSIFIERS = {"very": 1.5, "really": 1.5, "extremely": 2, "highly": 1.5, "so": 1.3, "super": 1.5,
+                "totally": 1.5, "absolutely": 1.8, "quite": 1.2, "incredibly": 2, "slightly": 0.6,
+                "somewhat": 0.7, "bit": 0.7}
+CONTRASTS = {"but", "however", "although", "though", "yet"}
+NEGATION_SCOPE = 3  # words after a negator that it flips
+TOKEN = re.compile(r"[a-z]+(?:'[a-z]+)?|[!]")
+
+
+class LexiconClassifier:
+    def __init__(self, positive=None, negative=None, contrast_weight=1.5, evidence_prior=1.0):
+        self.weights = {word: weight for word, weight in (positive or POSITIVE).items()}
+        self.weights.update({word: -weight for word, weight in (negative or NEGATIVE).items()})
+        self.contrast_weight = contrast_weight  # weight of a clause after "but" relative to before it
+        self.evidence_prior = evidence_prior  # pseudo-evidence that pulls confidence down on short reviews
+
+    def scores(self, text):
+        positive = negative = 0.0
+        negate_left = 0
+        boost = 1.0
+        exclaim = 0
+        for token in TOKEN.findall(str(text).lower()):
+            if token == "!":
+                exclaim += 1
+                continue
+            token = token.replace("'", "")  # "don't" -> "dont"
+            if token in CONTRASTS:
+                # Whatever came before "but" matters less than what follows
+                positive, negative = positive / self.contrast_weight, negative / self.contrast_weight
+                negate_left, boost = 0, 1.0
+                continue
+            if token in NEGATORS:
+                negate_left = NEGATION_SCOPE
+                continue
+            if token in INTENSIFIERS:
+                boost *= INTENSIFIERS[token]
+                continue
+            weight = self.weights.get(token)
+            if weight:
+                weight *= boost
+                if negate_left:
+                    weight = -0.75 * weight  # "not great" is weaker than "bad"
+                if weight > 0:
+                    positive += weight
+                else:
+                    negative -= weight
+                boost = 1.0
+            if negate_left:
+                negate_left -= 1
+        # Exclamation marks amplify whichever side is ahead
+        amplify = 1.0 + 0.1 * min(exclaim, 3)
+        if positive >= negative:
+            positive *= amplify
+        else:
+            negative *= amplify
+        return positive, negative
+
+    # Returns (label, confidence) with label "positive", "negative" or "neutral"
+    def predict(self, text):
+        positive, negative = self.scores(text)
+        if positive == negative:
+            return "neutral", 0.0
+        label = "positive" if positive > negative else "negative"
+        confidence = abs(positive - negative) / (positive + negative + self.evidence_prior)
+        return label, confidence
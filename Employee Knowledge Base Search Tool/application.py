@@ -1,17 +1,26 @@
 import os
+import sys
+import time
 import streamlit as st
 from langchain_community.embeddings import BedrockEmbeddings
-from langchain.indexes import VectorstoreIndexCreator
-from langchain_community.vectorstores import FAISS
-from langchain_text_splitters import CharacterTextSplitter
-from langchain_community.document_loaders.csv_loader import CSVLoader
 from botocore.exceptions import NoCredentialsError, PartialCredentialsError
+from kb_index import KnowledgeBaseIndex, SEARCH_MODES
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from aws_common.runtime import call_stats, get_bedrock_runtime
 
 # Set AWS credentials and region
 os.environ["AWS_ACCESS_KEY_ID"] = "your_access_key_id"
 os.environ["AWS_SECRET_ACCESS_KEY"] = "your_secret_access_key"
 os.environ["AWS_REGION"] = "us-east-1"
 
+KNOWLEDGE_BASE_CSV = os.getenv("KNOWLEDGE_BASE_CSV", "knowledge_base.csv")
+KB_INDEX_DIR = os.getenv("KB_INDEX_DIR", "./.kb_index")
+QUERY_CACHE_SIZE = int(os.getenv("QUERY_CACHE_SIZE", "1024"))  # question embeddings kept across sessions
+QUERY_CACHE_TTL = int(os.getenv("QUERY_CACHE_TTL", "86400"))  # seconds
+# Hybrid queries of at most this many terms, all found in the knowledge base, are answered by BM25 alone
+KB_LEXICAL_MAX_TERMS = int(os.getenv("KB_LEXICAL_MAX_TERMS", "2"))
+
 # Streamlit page configuration
 st.set_page_config(page_title="Employee Knowledge Base Search", layout="wide")
 
@@ -30,18 +39,23 @@ div[data-testid="stDecoration"] {
 """
 st.markdown(hide_streamlit_style, unsafe_allow_html=True)
 
+@st.cache_resource(show_spinner=False)
 def get_index():
-    """Creates and returns an in-memory vector store to be used in the application"""
+    """Loads the saved knowledge-base index once per process; every session shares it"""
     try:
-        embeddings = BedrockEmbeddings(region_name=os.getenv("AWS_REGION"))
-        loader = CSVLoader(file_path="knowledge_base.csv")
-        index_creator = VectorstoreIndexCreator(
-            vectorstore_cls=FAISS,
-            embedding=embeddings,
-            text_splitter=CharacterTextSplitter(chunk_size=300, chunk_overlap=0),
-        )
-        index_from_loader = index_creator.from_loaders([loader])
-        return index_from_loader
+        embeddings = BedrockEmbeddings(client=get_bedrock_runtime(region=os.getenv("AWS_REGION")))
+        return KnowledgeBaseIndex(KNOWLEDGE_BASE_CSV, KB_INDEX_DIR, embeddings)
+    except (NoCredentialsError, PartialCredentialsError) as e:
+        st.error("Could not load credentials to authenticate with AWS client. Please check that credentials in the specified profile name are valid.")
+        raise e
+    except Exception as e:
+        st.error(f"An error occurred: {e}")
+        raise e
+
+def refresh_index(index):
+    """Re-embeds only the CSV rows that changed since the index was saved"""
+    try:
+        return index.refresh()
     except (NoCredentialsError, PartialCredentialsError) as e:
         st.error("Could not load credentials to authenticate with AWS client. Please check that credentials in the specified profile name are valid.")
         raise e
@@ -49,15 +63,17 @@ def get_index():
         st.error(f"An error occurred: {e}")
         raise e
 
-def get_similarity_search_results(index, question):
-    results = index.vectorstore.similarity_search_with_score(question)
-    flattened_results = [{"content": res[0].page_content, "score": res[1]} for res in results]
-    return flattened_results
+def get_similarity_search_results(index, question, mode="hybrid", categories=None):
+    """Returns (results, mode used, question embedding or None if Bedrock was not needed)"""
+    return index.search(
+        question, embed=get_embedding, mode=mode, categories=categories, lexical_max_terms=KB_LEXICAL_MAX_TERMS
+    )
 
+@st.cache_data(max_entries=QUERY_CACHE_SIZE, ttl=QUERY_CACHE_TTL, show_spinner=False)
 def get_embedding(text):
+    """Embeds a question with the index's client; popular questions are served from an LRU cache shared by all sessions"""
     try:
-        embeddings = BedrockEmbeddings(region_name=os.getenv("AWS_REGION"))
-        return embeddings.embed_query(text)
+        return get_index().embeddings.embed_query(text)
     except (NoCredentialsError, PartialCredentialsError) as e:
         st.error("Could not load credentials to authenticate with AWS client. Please check that credentials in the specified profile name are valid.")
         raise e
@@ -67,17 +83,39 @@ def get_embedding(text):
 
 st.title("Employee Knowledge Base Search")
 
+with st.sidebar.expander("AWS calls"):
+    st.table(call_stats())
+
 if 'vector_index' not in st.session_state:
-    with st.spinner("Indexing document..."):
-        st.session_state.vector_index = get_index()
+    st.session_state.vector_index = get_index()
+
+# A stat of the CSV when nothing changed, so new sessions can search right away
+with st.spinner("Indexing document..."):
+    if refresh_index(st.session_state.vector_index):
+        update = st.session_state.vector_index.last_update
+        st.caption(f"Knowledge base updated: {update['added']} rows embedded, {update['removed']} removed.")
 
 input_text = st.text_input("Ask a question about the company:")
+filter_col, mode_col = st.columns([2, 1])
+with filter_col:
+    category_filter = st.multiselect("Categories", st.session_state.vector_index.categories())
+with mode_col:
+    search_mode = st.radio("Search mode", SEARCH_MODES, horizontal=True, format_func=str.capitalize)
 go_button = st.button("Go", type="primary")
 
 if go_button:
     with st.spinner("Working..."):
-        response_content = get_similarity_search_results(index=st.session_state.vector_index, question=input_text)
+        # The question is embedded at most once and the vector reused for the expander
+        question = " ".join(input_text.split())
+        start = time.perf_counter()
+        response_content, used_mode, raw_embedding = get_similarity_search_results(
+            index=st.session_state.vector_index, question=question, mode=search_mode, categories=category_filter
+        )
+        search_ms = (time.perf_counter() - start) * 1000
         st.table(response_content)
-        raw_embedding = get_embedding(input_text)
-        with st.expander("View question embedding"):
-            st.json(raw_embedding)
+        if raw_embedding is None:
+            st.caption(f"Keyword search in {search_ms:.1f} ms, no Bedrock call")
+        else:
+            st.caption(f"{used_mode.capitalize()} search in {search_ms:.1f} ms")
+            with st.expander("View question embedding"):
+                st.json(raw_embedding)
@@ -0,0 +1,229 @@
+import os
+import csv
+import json
+import hashlib
+import threading
+import faiss
+import numpy as np
+from langchain_community.vectorstores import FAISS
+from kb_search import BM25Index, reciprocal_rank_fusion, tokenize
+
+# Persisted FAISS index of the knowledge-base CSV, shared by every session of the app.
+#
+# Each CSV row becomes one document ("Question: ...\nAnswer: ...\nCategory: ..." like
+# CSVLoader produces) whose id is derived from a hash of its content. The saved index
+# records a fingerprint of the CSV and the embedding model: when it matches, the index
+# is loaded from disk without a single Bedrock call. When the CSV changes, only rows
+# whose content is new are embedded and rows that disappeared are deleted.
+#
+# A BM25 inverted index over the same rows sits next to the vector store. Searches can
+# be keyword-only (no Bedrock call), semantic or hybrid (both rankings fused), and a
+# category filter is applied inside both searches rather than to their results.
+
+MANIFEST_FILE = "manifest.json"
+SEARCH_MODES = ("hybrid", "keyword", "semantic")
+
+
+def row_text(row):
+    return "\n".join(f"{key.strip()}: {(value or '').strip()}" for key, value in row.items() if key is not None)
+
+
+def file_fingerprint(path, model_id):
+    digest = hashlib.sha256(str(model_id).encode("utf-8"))
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+# Reads the CSV into {doc id: (text, metadata)}; identical rows get distinct ids
+def read_rows(path):
+    rows = {}
+    seen = {}
+    with open(path, "r", encoding="utf-8-sig", newline="") as f:
+        for row in csv.DictReader(f):
+            text = row_text(row)
+            content_hash = hashlib.sha256(text.encode("utf-8")).hexdigest()[:32]
+            seen[content_hash] = seen.get(content_hash, 0) + 1
+            doc_id = f"{content_hash}-{seen[content_hash]}"
+            rows[doc_id] = (text, {"source": path, "category": row.get("Category")})
+    return rows
+
+
+class KnowledgeBaseIndex:
+    def __init__(self, csv_path, index_dir, embeddings):
+        self.csv_path = csv_path
+        self.index_dir = index_dir
+        self.embeddings = embeddings
+        self.model_id = getattr(embeddings, "model_id", type(embeddings).__name__)
+        self.manifest_path = os.path.join(index_dir, MANIFEST_FILE)
+        self.vectorstore = None
+        self.fingerprint = None
+        self.doc_ids = set()
+        self.bm25 = BM25Index()
+        self.doc_categories = {}  # doc id -> Category column
+        self.selectors = {}  # category set -> faiss IDSelector over index positions
+        self.file_stat = None  # (mtime, size) of the CSV when it was last checked
+        self.last_update = {"added": 0, "removed": 0}  # rows re-embedded / dropped by the last refresh
+        self.lock = threading.RLock()  # guards the vector store during searches and updates
+        self.refresh_lock = threading.Lock()  # one refresh at a time, so rows are embedded once
+        self._load()
+
+    def __len__(self):
+        return len(self.doc_ids)
+
+    def _load(self):
+        if not os.path.exists(self.manifest_path):
+            return
+        with open(self.manifest_path, "r") as f:
+            manifest = json.load(f)
+        if manifest.get("model_id") != self.model_id:
+            return  # embedded with another model, start over
+        self.vectorstore = FAISS.load_local(
+            self.index_dir, self.embeddings, allow_dangerous_deserialization=True
+        )
+        self.fingerprint = manifest["fingerprint"]
+        self.doc_ids = set(manifest["doc_ids"])
+        for doc_id in self.doc_ids:
+            self._index_text(doc_id, self.vectorstore.docstore.search(doc_id))
+
+    def _index_text(self, doc_id, doc):
+        self.bm25.add(doc_id, doc.page_content)
+        self.doc_categories[doc_id] = doc.metadata.get("category")
+
+    def categories(self):
+        return sorted({category for category in self.doc_categories.values() if category})
+
+    def _save(self):
+        os.makedirs(self.index_dir, exist_ok=True)
+        self.vectorstore.save_local(self.index_dir)
+        manifest = {"fingerprint": self.fingerprint, "model_id": self.model_id, "doc_ids": sorted(self.doc_ids)}
+        tmp_path = self.manifest_path + ".tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(manifest, f)
+        os.replace(tmp_path, self.manifest_path)
+
+    # Brings the index in line with the CSV. A stat call is all it costs when the file
+    # has not been touched; returns True when the index changed.
+    def refresh(self):
+        with self.refresh_lock:
+            return self._refresh()
+
+    def _refresh(self):
+        stat = os.stat(self.csv_path)
+        file_stat = (stat.st_mtime_ns, stat.st_size)
+        if file_stat == self.file_stat:
+            return False
+        fingerprint = file_fingerprint(self.csv_path, self.model_id)
+        if fingerprint == self.fingerprint:
+            self.file_stat = file_stat
+            return False
+
+        rows = read_rows(self.csv_path)
+        added = [doc_id for doc_id in rows if doc_id not in self.doc_ids]
+        removed = [doc_id for doc_id in self.doc_ids if doc_id not in rows]
+        texts = [rows[doc_id][0] for doc_id in added]
+        metadatas = [rows[doc_id][1] for doc_id in added]
+        # Embed before taking the lock so searches are not held up by Bedrock calls
+        vectors = self.embeddings.embed_documents(texts) if texts else []
+        with self.lock:
+            if removed and self.vectorstore is not None:
+                self.vectorstore.delete(removed)
+            for doc_id in removed:
+                self.bm25.remove(doc_id)
+                self.doc_categories.pop(doc_id, None)
+            for doc_id in added:
+                self.bm25.add(doc_id, rows[doc_id][0])
+                self.doc_categories[doc_id] = rows[doc_id][1]["category"]
+            self.selectors = {}  # index positions moved
+            if added:
+                text_embeddings = list(zip(texts, vectors))
+                if self.vectorstore is None:
+                    self.vectorstore = FAISS.from_embeddings(
+                        text_embeddings, self.embeddings, metadatas=metadatas, ids=added
+                    )
+                else:
+                    self.vectorstore.add_embeddings(text_embeddings, metadatas=metadatas, ids=added)
+            self.doc_ids = set(rows)
+            self.fingerprint = fingerprint
+            self.file_stat = file_stat
+            self.last_update = {"added": len(added), "removed": len(removed)}
+            if self.vectorstore is not None:
+                self._save()
+        return True
+
+    # embedding, when given, is the query already embedded by the caller
+    def similarity_search_with_score(self, query, k=4, embedding=None):
+        with self.lock:
+            if self.vectorstore is None:
+                return []
+            if embedding is not None:
+                return self.vectorstore.similarity_search_with_score_by_vector(list(embedding), k=k)
+            return self.vectorstore.similarity_search_with_score(query, k=k)
+
+    # Returns (doc id, L2 distance) pairs for the k nearest documents, considering only the
+    # allowed ones: FAISS skips every other vector through an IDSelector.
+    def _vector_search(self, embedding, k, categories=None):
+        params = None
+        if categories:
+            key = frozenset(categories)
+            if key not in self.selectors:
+                positions = [
+                    position for position, doc_id in self.vectorstore.index_to_docstore_id.items()
+                    if self.doc_categories.get(doc_id) in key
+                ]
+                self.selectors[key] = faiss.IDSelectorBatch(np.array(positions, dtype=np.int64))
+            params = faiss.SearchParameters(sel=self.selectors[key])
+        query = np.array([embedding], dtype=np.float32)
+        distances, positions = self.vectorstore.index.search(query, k, params=params)
+        return [
+            (self.vectorstore.index_to_docstore_id[position], float(distance))
+            for distance, position in zip(distances[0], positions[0]) if position != -1
+        ]
+
+    # Searches the knowledge base and returns (results, mode used, query embedding or None).
+    # embed(query) is only called when the vector side runs: in "keyword" mode, or in
+    # "hybrid" mode for a query of at most lexical_max_terms terms that all occur in the
+    # knowledge base, the answer comes from BM25 alone, unless the category filter leaves
+    # BM25 without a hit, in which case the query goes through the vector search after all.
+    def search(self, query, embed, k=4, mode="hybrid", categories=None, lexical_max_terms=2):
+        fetch_k = max(4 * k, 20)
+        with self.lock:
+            if self.vectorstore is None:
+                return [], mode, None
+            allowed = None
+            if categories:
+                allowed = {doc_id for doc_id, category in self.doc_categories.items() if category in categories}
+            requested = mode
+            if mode == "hybrid" and len(tokenize(query)) <= lexical_max_terms and self.bm25.covers(query):
+                mode = "keyword"
+            lexical = self.bm25.search(query, k=fetch_k, allowed=allowed) if mode != "semantic" else []
+            if mode != requested and not lexical:
+                mode = requested
+
+        embedding = None
+        if mode == "keyword":
+            ranked = [(doc_id, score, {"bm25": score}) for doc_id, score in lexical[:k]]
+        else:
+            embedding = embed(query)  # outside the lock, it may be a Bedrock call
+            with self.lock:
+                vector = self._vector_search(embedding, fetch_k, categories)
+            if mode == "semantic":
+                ranked = [(doc_id, distance, {"distance": distance}) for doc_id, distance in vector[:k]]
+            else:
+                bm25_scores, distances = dict(lexical), dict(vector)
+                fused = reciprocal_rank_fusion([doc_id for doc_id, _ in lexical], [doc_id for doc_id, _ in vector], k=k)
+                ranked = [
+                    (doc_id, score, {"bm25": bm25_scores.get(doc_id), "distance": distances.get(doc_id)})
+                    for doc_id, score in fused
+                ]
+
+        results = []
+        with self.lock:
+            for doc_id, score, details in ranked:
+                doc = self.vectorstore.docstore.search(doc_id)
+                if isinstance(doc, str):
+                    continue  # removed by a concurrent refresh
+                results.append(dict(content=doc.page_content, category=doc.metadata.get("category"),
+                                    score=score, **details))
+        return results, mode, embedding
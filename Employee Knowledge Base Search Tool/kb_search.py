@@ -0,0 +1,86 @@
+import re
+import math
+import heapq
+from collections import Counter
+
+# Lexical side of the knowledge-base search: an in-memory inverted index scored with
+# Okapi BM25, updated row by row alongside the FAISS store, and reciprocal rank fusion
+# to merge its ranking with the vector one.
+
+TOKEN = re.compile(r"[a-z0-9]+")
+STOPWORDS = {
+    "a", "an", "and", "are", "as", "at", "be", "by", "can", "do", "does", "for", "from", "how", "i",
+    "in", "is", "it", "my", "of", "on", "or", "our", "the", "to", "what", "when", "where", "which",
+    "who", "why", "with", "you", "your", "question", "answer", "category",
+}
+RRF_K = 60  # damping constant from Cormack et al., "Reciprocal Rank Fusion outperforms Condorcet", SIGIR 2009
+
+
+def tokenize(text):
+    return [token for token in TOKEN.findall(str(text).lower()) if token not in STOPWORDS]
+
+
+class BM25Index:
+    def __init__(self, k1=1.5, b=0.75):
+        self.k1 = k1
+        self.b = b
+        self.postings = {}  # term -> {doc id: term frequency}
+        self.lengths = {}  # doc id -> number of tokens
+        self.doc_terms = {}  # doc id -> its distinct terms, for removal
+        self.total_length = 0
+
+    def __len__(self):
+        return len(self.lengths)
+
+    def add(self, doc_id, text):
+        if doc_id in self.lengths:
+            self.remove(doc_id)
+        counts = Counter(tokenize(text))
+        for term, count in counts.items():
+            self.postings.setdefault(term, {})[doc_id] = count
+        self.lengths[doc_id] = sum(counts.values())
+        self.doc_terms[doc_id] = list(counts)
+        self.total_length += self.lengths[doc_id]
+
+    def remove(self, doc_id):
+        length = self.lengths.pop(doc_id, None)
+        if length is None:
+            return
+        self.total_length -= length
+        for term in self.doc_terms.pop(doc_id):
+            del self.postings[term][doc_id]
+            if not self.postings[term]:
+                del self.postings[term]
+
+    # True when every query term occurs somewhere in the collection
+    def covers(self, query):
+        terms = tokenize(query)
+        return bool(terms) and all(term in self.postings for term in terms)
+
+    # Returns up to k (doc id, score) pairs, best first, among the allowed doc ids if given
+    def search(self, query, k=4, allowed=None):
+        if not self.lengths:
+            return []
+        count = len(self.lengths)
+        average_length = self.total_length / count
+        scores = {}
+        for term in set(tokenize(query)):
+            docs = self.postings.get(term)
+            if not docs:
+                continue
+            idf = math.log(1 + (count - len(docs) + 0.5) / (len(docs) + 0.5))
+            for doc_id, frequency in docs.items():
+                if allowed is not None and doc_id not in allowed:
+                    continue
+                norm = self.k1 * (1 - self.b + self.b * self.lengths[doc_id] / average_length)
+                scores[doc_id] = scores.get(doc_id, 0.0) + idf * frequency * (self.k1 + 1) / (frequency + norm)
+        return heapq.nlargest(k, scores.items(), key=lambda item: item[1])
+
+
+# Merges ranked lists of doc ids into one ranking by summed 1 / (RRF_K + rank)
+def reciprocal_rank_fusion(*rankings, k=4):
+    scores = {}
+    for ranking in rankings:
+        for rank, doc_id in enumerate(ranking, start=1):
+            scores[doc_id] = scores.get(doc_id, 0.0) + 1.0 / (RRF_K + rank)
+    return heapq.nlargest(k, scores.items(), key=lambda item: item[1])
@@ -1,28 +1,103 @@
 import streamlit as st
 import os
-import boto3
+import sys
 import json
 import base64
 import io
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
 from PIL import Image
-from pathlib import Path
 from langchain_core.prompts import PromptTemplate
+from face_index import FaceIndex, crop_face, embed_face
+from llm_stream import StreamStats, stream_claude, stream_titan
+from face_summary import compact_results, estimate_tokens
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", ".."))
+from aws_common.runtime import call_stats, get_bedrock_runtime, get_rekognition
 
 # Set AWS credentials and region
 os.environ["AWS_ACCESS_KEY_ID"] = "xxx"
 os.environ["AWS_SECRET_ACCESS_KEY"] = "xxx"
 os.environ["AWS_DEFAULT_REGION"] = "us-east-1"
 
-# Instantiate the Bedrock and Rekognition clients
-
-bedrock_client = boto3.client(
-    service_name='bedrock-runtime',  
-    region_name="us-east-1"
-)
-
-rek_client = boto3.client('rekognition', region_name="us-east-1")
-
-def interactWithLLM(prompt, llm_type):
+DETECTION_CACHE_SIZE = int(os.getenv("DETECTION_CACHE_SIZE", "256"))  # images whose detect_faces result is kept
+FACE_INDEX_DIR = os.getenv("FACE_INDEX_DIR", "./.face_index")
+LLM_STREAMING = os.getenv("LLM_STREAMING", "true").lower() == "true"  # render model output token by token
+# Rekognition results go into the summary prompt compacted to about this many tokens;
+# set FACE_SUMMARY_COMPACT=false to send the full JSON and compare prompt size and latency
+FACE_SUMMARY_COMPACT = os.getenv("FACE_SUMMARY_COMPACT", "true").lower() == "true"
+FACE_SUMMARY_TOKEN_BUDGET = int(os.getenv("FACE_SUMMARY_TOKEN_BUDGET", "600"))
+
+# Claude 3 image limits: larger images are rejected, and images with a longer edge than
+# this are resized by the service anyway, so downscaling them here only saves bandwidth
+MAX_IMAGE_BYTES = 3_750_000  # 5 MB once base64-encoded
+MAX_IMAGE_EDGE = 1568
+IMAGE_SIGNATURES = [
+    (b"\xff\xd8\xff", "jpeg"),
+    (b"\x89PNG\r\n\x1a\n", "png"),
+    (b"GIF87a", "gif"),
+    (b"GIF89a", "gif"),
+]
+
+# Bedrock and Rekognition clients from the shared runtime: pooled, retried with adaptive
+# backoff and metered per model. Every session and worker thread shares them; set
+# BEDROCK_ENDPOINT_URL (e.g. http://localhost:8089 for stub_server.py) to work offline.
+@st.cache_resource
+def get_clients():
+    return get_bedrock_runtime(), get_rekognition()
+
+bedrock_client, rek_client = get_clients()
+
+class DetectionCache:
+    """detect_faces results keyed by the SHA-256 of the image bytes, least recently used evicted first"""
+
+    def __init__(self, max_entries=256):
+        self.max_entries = max_entries
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, image_hash):
+        with self.lock:
+            face_details = self.entries.get(image_hash)
+            if face_details is None:
+                self.misses += 1
+                return None
+            self.entries.move_to_end(image_hash)
+            self.hits += 1
+            return face_details
+
+    def put(self, image_hash, face_details):
+        with self.lock:
+            self.entries[image_hash] = face_details
+            self.entries.move_to_end(image_hash)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+
+# Shared by every session, so comparing one source against many targets detects it once
+@st.cache_resource
+def get_detection_cache():
+    return DetectionCache(DETECTION_CACHE_SIZE)
+
+def render_stream(chunks, stats):
+    """Writes streamed text into one placeholder as it arrives, then the latency; returns the full text"""
+    placeholder = st.empty()
+    text = ""
+    try:
+        for chunk in chunks:
+            text += chunk
+            placeholder.markdown(text + "▌")
+    finally:
+        placeholder.markdown(text)
+        st.caption(stats.describe())
+    return text
+
+# With stream=True the answer is rendered on the page as it is generated, and also returned
+def interactWithLLM(prompt, llm_type, stream=False):
     try:
         if llm_type == 'titan':
             parameters = {
@@ -31,8 +106,13 @@ def interactWithLLM(prompt, llm_type):
                 "temperature": 0,
                 "topP": 0.9
             }
-            body = json.dumps({"inputText": prompt, "textGenerationConfig": parameters})
             modelId = "amazon.titan-text-premier-v1:0"
+            if stream:
+                stats = StreamStats()
+                body = {"inputText": prompt, "textGenerationConfig": parameters}
+                return render_stream(stream_titan(bedrock_client, modelId, body, stats), stats)
+
+            body = json.dumps({"inputText": prompt, "textGenerationConfig": parameters})
             accept = "application/json"
             contentType = "application/json"
 
@@ -46,39 +126,119 @@ def interactWithLLM(prompt, llm_type):
         st.error(f"Error during LLM interaction: {e}")
         return None
 
-def image_base64_encoder(image_path):
-    with Image.open(image_path) as open_image:
-        image_bytes = io.BytesIO()
-        open_image.save(image_bytes, format=open_image.format)
-        image_bytes = image_bytes.getvalue()
-        image_base64 = base64.b64encode(image_bytes).decode('utf-8')
-        file_type = f"image/{open_image.format.lower()}"
-    return file_type, image_base64
+def sniff_image_format(image_data):
+    """Returns "jpeg", "png", "gif" or "webp" from the file signature, without decoding the image"""
+    header = bytes(image_data[:12])
+    if header[:4] == b"RIFF" and header[8:12] == b"WEBP":
+        return "webp"
+    for signature, image_format in IMAGE_SIGNATURES:
+        if header.startswith(signature):
+            return image_format
+    return None
+
+def downscale_image(image_data, max_edge=MAX_IMAGE_EDGE):
+    """Re-encodes an image as JPEG with its longer edge at most max_edge pixels"""
+    with Image.open(io.BytesIO(image_data)) as image:
+        image.draft("RGB", (max_edge, max_edge))  # JPEGs are decoded at a reduced scale directly
+        image = image.convert("RGB")
+        image.thumbnail((max_edge, max_edge))
+        buffer = io.BytesIO()
+        image.save(buffer, format="JPEG", quality=85)
+    return buffer.getvalue()
+
+def image_base64_encoder(image_data):
+    """Returns (media type, base64) for uploaded image bytes. Supported images within the
+    model's limits are sent as they are; only oversized or unknown ones are decoded."""
+    image_format = sniff_image_format(image_data)
+    within_limits = image_format is not None and len(image_data) <= MAX_IMAGE_BYTES
+    if within_limits:
+        # Reads the header only, the pixels are not decoded
+        with Image.open(io.BytesIO(image_data)) as image:
+            within_limits = max(image.size) <= MAX_IMAGE_EDGE
+    if not within_limits:
+        image_data, image_format = downscale_image(image_data), "jpeg"
+    return f"image/{image_format}", base64.b64encode(image_data).decode('utf-8')
+
+def detect_faces(image_data, cache=None):
+    image_hash = hashlib.sha256(image_data).hexdigest()
+    face_details = cache.get(image_hash) if cache is not None else None
+    if face_details is None:
+        response = rek_client.detect_faces(Image={'Bytes': image_data}, Attributes=['ALL'])
+        face_details = response['FaceDetails']
+        if cache is not None:
+            cache.put(image_hash, face_details)
+    return face_details
 
 def analyze_faces(image_data):
     try:
-        response = rek_client.detect_faces(Image={'Bytes': image_data}, Attributes=['ALL'])
-        face_details = response['FaceDetails']
-        return face_details
+        return detect_faces(image_data, get_detection_cache())
     except Exception as e:
         st.error(f"Error during face analysis: {e}")
         return []
 
-def compare_faces(source_data, target_data):
+# The enrolled gallery, loaded once and shared by every session
+@st.cache_resource(show_spinner=False)
+def get_face_index():
+    return FaceIndex(FACE_INDEX_DIR)
+
+def embed_faces(image_data, face_details):
+    """Crops every detected face and embeds the crops concurrently; returns [(face, crop, vector)]"""
+    crops = [crop_face(image_data, face['BoundingBox']) for face in face_details]
+    with ThreadPoolExecutor(max_workers=8) as pool:
+        vectors = list(pool.map(lambda crop: embed_face(crop, bedrock_client), crops))
+    return list(zip(face_details, crops, vectors))
+
+def enroll_faces(name, source, image_data):
+    """Returns the new face ids, or None when detection or embedding failed (the error is shown)"""
     try:
-        response = rek_client.compare_faces(
+        face_details = detect_faces(image_data, get_detection_cache())
+    except Exception as e:
+        st.error(f"Error during face analysis: {e}")
+        return None
+    try:
+        embedded = embed_faces(image_data, face_details)
+    except Exception as e:
+        st.error(f"Error during face embedding: {e}")
+        return None
+    items = [(name, source, face['BoundingBox'], crop, vector) for face, crop, vector in embedded]
+    return get_face_index().add(items)
+
+def search_faces(image_data, k=5):
+    """Returns [(probe crop, matches)] for every face in the image, one index query per face"""
+    face_details = analyze_faces(image_data)
+    try:
+        embedded = embed_faces(image_data, face_details)
+    except Exception as e:
+        st.error(f"Error during face embedding: {e}")
+        return []
+    face_index = get_face_index()
+    return [(crop, face_index.search(vector, k)) for _, crop, vector in embedded]
+
+def analyze_and_compare(source_data, target_data):
+    """Runs detect_faces on the source and compare_faces concurrently; errors are reported here, in the script thread"""
+    cache = get_detection_cache()
+    with ThreadPoolExecutor(max_workers=2) as pool:
+        detection = pool.submit(detect_faces, source_data, cache)
+        comparison = pool.submit(
+            rek_client.compare_faces,
             SourceImage={'Bytes': source_data},
             TargetImage={'Bytes': target_data},
             SimilarityThreshold=90
         )
-        face_matches = response['FaceMatches']
-        return face_matches
+    try:
+        face_details = detection.result()
+    except Exception as e:
+        st.error(f"Error during face analysis: {e}")
+        face_details = []
+    try:
+        face_matches = comparison.result()['FaceMatches']
     except Exception as e:
         st.error(f"Error during face comparison: {e}")
-        return []
+        face_matches = []
+    return face_details, face_matches
 
-def analyze_image(image_path, text) -> str:
-    file_type, image_base64 = image_base64_encoder(image_path)
+def analyze_image(image_data, text, stream=False) -> str:
+    file_type, image_base64 = image_base64_encoder(image_data)
 
     system_prompt = """Identify and describe any faces present in this image. Provide detailed descriptions including apparent age, gender, emotional expressions, and any other notable features."""
 
@@ -111,17 +271,20 @@ def analyze_image(image_path, text) -> str:
         ]
     }
 
+    model_id = "anthropic.claude-3-sonnet-20240229-v1:0"
     try:
+        if stream:
+            stats = StreamStats()
+            return render_stream(stream_claude(bedrock_client, model_id, prompt, stats), stats)
+
         response = bedrock_client.invoke_model(
             body=json.dumps(prompt),
-            modelId="anthropic.claude-3-sonnet-20240229-v1:0",
+            modelId=model_id,
             accept="application/json",
             contentType="application/json"
         )
 
         response_body = response.get('body').read().decode('utf-8')
-        st.write(f"Raw response: {response_body}")  # Log the raw response for debugging
-
         response_json = json.loads(response_body)
         llm_output = response_json['content'][0]['text']
         return llm_output
@@ -132,8 +295,14 @@ def analyze_image(image_path, text) -> str:
 
 st.title(":rainbow[Face Analysis and Comparison]")
 
+with st.sidebar.expander("AWS calls"):
+    st.table(call_stats())
+
 # Option selection
-option = st.radio("Choose an analysis option:", ('Face Comparison using Rekognition', 'Face Description using Claude 3'))
+option = st.radio(
+    "Choose an analysis option:",
+    ('Face Comparison using Rekognition', 'Face Search in Enrolled Gallery', 'Face Description using Claude 3')
+)
 
 if option == 'Face Comparison using Rekognition':
     st.header("Face Comparison using Rekognition")
@@ -155,11 +324,8 @@ if option == 'Face Comparison using Rekognition':
         with col2:
             st.image(target_img_data, caption='Target Image', use_column_width=True)
 
-        # Analyze faces in the source image
-        face_details = analyze_faces(source_img_data)
-
-        # Compare faces between source and target images
-        face_matches = compare_faces(source_img_data, target_img_data)
+        # Analyze faces in the source image and compare it with the target at the same time
+        face_details, face_matches = analyze_and_compare(source_img_data, target_img_data)
 
         # Display face analysis and comparison results
         st.subheader("Face Analysis Results")
@@ -188,8 +354,13 @@ if option == 'Face Comparison using Rekognition':
         Assistant:
         """
 
-        source_faces_summary = json.dumps(face_details, indent=2)
-        target_faces_summary = json.dumps(face_matches, indent=2)
+        if FACE_SUMMARY_COMPACT:
+            source_faces_summary, target_faces_summary, prompt_stats = compact_results(
+                face_details, face_matches, FACE_SUMMARY_TOKEN_BUDGET
+            )
+        else:
+            source_faces_summary = json.dumps(face_details, indent=2)
+            target_faces_summary = json.dumps(face_matches, indent=2)
         prompt_template_for_summary_generate = PromptTemplate.from_template(prompt_titan)
         prompt_data_for_summary_generate = prompt_template_for_summary_generate.format(
             source_faces=source_faces_summary,
@@ -197,13 +368,62 @@ if option == 'Face Comparison using Rekognition':
         )
 
         llm_type = 'titan'  # Set your desired LLM type here
-        response_text = interactWithLLM(prompt_data_for_summary_generate, llm_type)
-
-        if response_text:
-            st.subheader("Generated Summary")
-            st.write(response_text)
+        st.subheader("Generated Summary")
+        started = time.perf_counter()
+        response_text = interactWithLLM(prompt_data_for_summary_generate, llm_type, stream=LLM_STREAMING)
+        elapsed_ms = (time.perf_counter() - started) * 1000
+
+        prompt_tokens = estimate_tokens(prompt_data_for_summary_generate)
+        if FACE_SUMMARY_COMPACT:
+            st.caption(
+                f"Summary prompt: ~{prompt_tokens} tokens, face data compacted from ~{prompt_stats['full_tokens']} "
+                f"to ~{prompt_stats['compact_tokens']} ({prompt_stats['listed_faces']} of {len(face_details)} faces listed) "
+                f"| LLM call: {elapsed_ms:.0f} ms"
+            )
         else:
+            st.caption(f"Summary prompt: ~{prompt_tokens} tokens, full face data | LLM call: {elapsed_ms:.0f} ms")
+
+        if not response_text:
             st.write("Failed to get a response from the LLM.")
+        elif not LLM_STREAMING:
+            st.write(response_text)
+
+elif option == 'Face Search in Enrolled Gallery':
+    st.header("Face Search in Enrolled Gallery")
+    face_index = get_face_index()
+    st.write(f"{len(face_index)} faces enrolled.")
+
+    with st.expander("Enroll faces"):
+        enroll_name = st.text_input("Name")
+        enroll_file = st.file_uploader("Upload an image of this person", type=["jpg", "jpeg", "png"], key="enroll")
+        if st.button("Enroll") and enroll_name and enroll_file:
+            with st.spinner("Enrolling..."):
+                face_ids = enroll_faces(enroll_name, enroll_file.name, enroll_file.getvalue())
+            if face_ids:
+                st.success(f"Enrolled {len(face_ids)} faces for {enroll_name}.")
+                st.image([face_index.crop_path(face_id) for face_id in face_ids], width=120)
+            elif face_ids is not None:
+                st.warning("No faces found in this image.")
+
+    probe_file = st.file_uploader("Upload a probe image", type=["jpg", "jpeg", "png"], key="probe")
+    top_k = st.slider("Matches per face", min_value=1, max_value=20, value=5)
+    if probe_file and st.button("Search", type="primary"):
+        with st.spinner("Searching..."):
+            results = search_faces(probe_file.getvalue(), k=top_k)
+        if not results:
+            st.write("No faces found in the probe image.")
+        for probe_crop, matches in results:
+            probe_col, matches_col = st.columns([1, 4])
+            with probe_col:
+                st.image(probe_crop, caption="Probe face", width=120)
+            with matches_col:
+                if not matches:
+                    st.write("No enrolled faces yet.")
+                # Ranked by cosine similarity of general-purpose image embeddings; no
+                # threshold has been calibrated for these, so no match verdict is given
+                for face_id, face, similarity in matches:
+                    st.image(face_index.crop_path(face_id), width=80)
+                    st.write(f"{face['name']} (similarity {similarity:.3f}) from {face['source']}")
 
 elif option == 'Face Description using Claude 3':
     st.header("Face Description using Claude 3")
@@ -217,13 +437,8 @@ elif option == 'Face Description using Claude 3':
         if analyze_button:
             if uploaded_file is not None:
                 st.image(uploaded_file)
-                save_folder = "./images"
-                save_path = Path(save_folder, uploaded_file.name)
-                save_path.parent.mkdir(parents=True, exist_ok=True)
-                with open(save_path, mode='wb') as w:
-                    w.write(uploaded_file.getvalue())
-                if save_path.exists():
-                    st.success(f'Image {uploaded_file.name} is successfully saved!')
-                    result = analyze_image(save_path, json_spec)
+                # Analyze the upload straight from memory; no temporary file, so
+                # concurrent uploads with the same name cannot collide
+                result = analyze_image(uploaded_file.getvalue(), json_spec, stream=LLM_STREAMING)
+                if not LLM_STREAMING:
                     st.write(result)
-                    os.remove(save_path)
@@ -0,0 +1,169 @@
+import os
+import io
+import json
+import atexit
+import base64
+import logging
+import threading
+import faiss
+import numpy as np
+from PIL import Image
+
+logger = logging.getLogger(__name__)
+
+# Local 1:N face gallery.
+#
+# Faces found by Rekognition detect_faces are cropped from their bounding boxes, the
+# crops embedded with Titan Multimodal Embeddings and the unit vectors added to an HNSW
+# graph (inner product, i.e. cosine similarity). Searching a probe face is one embedding
+# call plus one graph query, whose cost grows roughly with log N, so it stays flat from
+# a handful of enrolled faces to hundreds of thousands. Crops are kept next to the index
+# so matches can be shown.
+#
+# Writing the index and its metadata costs O(N), so enrolments are saved in batches:
+# every SAVE_EVERY faces, and by a background thread every SAVE_INTERVAL seconds while
+# any are pending, so a process that is killed (e.g. SIGTERM from docker stop, which
+# skips atexit) loses at most SAVE_INTERVAL seconds of them. The thread is stopped and
+# pending faces saved once more by close(), which also runs at interpreter exit.
+
+EMBEDDING_MODEL_ID = "amazon.titan-embed-image-v1"
+EMBEDDING_DIM = 256  # Titan supports 256, 384 and 1024; smaller vectors keep a large gallery in memory
+CROP_SIZE = 224
+CROP_MARGIN = 0.2  # extra border around the bounding box, as a share of its size
+INDEX_FILE = "faces.faiss"
+META_FILE = "faces.json"
+SAVE_EVERY = 100  # faces enrolled between saves
+SAVE_INTERVAL = 30.0  # seconds
+
+
+# Crops one face out of an image, given a Rekognition BoundingBox (ratios of the image size)
+def crop_face(image_data, bounding_box, margin=CROP_MARGIN, size=CROP_SIZE):
+    with Image.open(io.BytesIO(image_data)) as image:
+        image = image.convert("RGB")
+        width, height = image.size
+        left = bounding_box["Left"] * width
+        top = bounding_box["Top"] * height
+        box_width = bounding_box["Width"] * width
+        box_height = bounding_box["Height"] * height
+        crop = image.crop((
+            max(0, int(left - margin * box_width)),
+            max(0, int(top - margin * box_height)),
+            min(width, int(left + (1 + margin) * box_width)),
+            min(height, int(top + (1 + margin) * box_height)),
+        ))
+        crop.thumbnail((size, size))
+        buffer = io.BytesIO()
+        crop.save(buffer, format="JPEG", quality=90)
+    return buffer.getvalue()
+
+
+def embed_face(crop_data, bedrock_client, model_id=EMBEDDING_MODEL_ID, dim=EMBEDDING_DIM):
+    body = json.dumps({
+        "inputImage": base64.b64encode(crop_data).decode("utf-8"),
+        "embeddingConfig": {"outputEmbeddingLength": dim}
+    })
+    response = bedrock_client.invoke_model(
+        body=body, modelId=model_id, accept="application/json", contentType="application/json"
+    )
+    vector = np.array(json.loads(response.get("body").read())["embedding"], dtype=np.float32)
+    return vector / max(np.linalg.norm(vector), 1e-12)
+
+
+class FaceIndex:
+    def __init__(self, index_dir, dim=EMBEDDING_DIM, hnsw_m=32, ef_construction=200, ef_search=64,
+                 save_every=SAVE_EVERY, save_interval=SAVE_INTERVAL):
+        self.index_dir = index_dir
+        self.crops_dir = os.path.join(index_dir, "crops")
+        self.dim = dim
+        self.ef_search = ef_search
+        self.faces = {}  # id -> {"name", "source", "bounding_box"}
+        self.next_id = 0
+        self.save_every = save_every
+        self.save_interval = save_interval
+        self.unsaved = 0  # faces added since the last save
+        self.lock = threading.RLock()
+        self.stop_event = threading.Event()
+
+        index_path = os.path.join(index_dir, INDEX_FILE)
+        meta_path = os.path.join(index_dir, META_FILE)
+        if os.path.exists(index_path) and os.path.exists(meta_path):
+            self.index = faiss.read_index(index_path)
+            with open(meta_path, "r") as f:
+                meta = json.load(f)
+            self.faces = {int(face_id): face for face_id, face in meta["faces"].items()}
+            self.next_id = meta["next_id"]
+        else:
+            hnsw = faiss.IndexHNSWFlat(dim, hnsw_m, faiss.METRIC_INNER_PRODUCT)
+            hnsw.hnsw.efConstruction = ef_construction
+            self.index = faiss.IndexIDMap2(hnsw)
+        faiss.downcast_index(self.index.index).hnsw.efSearch = ef_search
+        self.flusher = threading.Thread(target=self._flush_periodically, name="face-index-flusher", daemon=True)
+        self.flusher.start()
+        atexit.register(self.close)
+
+    def __len__(self):
+        return len(self.faces)
+
+    def crop_path(self, face_id):
+        return os.path.join(self.crops_dir, f"{face_id}.jpg")
+
+    # Adds embedded faces; each item is (name, source, bounding_box, crop_data, vector).
+    # Returns the new face ids.
+    def add(self, items):
+        if not items:
+            return []
+        os.makedirs(self.crops_dir, exist_ok=True)
+        with self.lock:
+            ids = list(range(self.next_id, self.next_id + len(items)))
+            self.next_id += len(items)
+            vectors = np.stack([vector for *_, vector in items]).astype(np.float32)
+            self.index.add_with_ids(vectors, np.array(ids, dtype=np.int64))
+            for face_id, (name, source, bounding_box, crop_data, _) in zip(ids, items):
+                self.faces[face_id] = {"name": name, "source": source, "bounding_box": bounding_box}
+                with open(self.crop_path(face_id), "wb") as f:
+                    f.write(crop_data)
+            self.unsaved += len(items)
+            if self.unsaved >= self.save_every:
+                self.save()
+        return ids
+
+    # Returns up to k (face id, face, similarity) tuples for a unit probe vector, best first
+    def search(self, vector, k=5):
+        with self.lock:
+            if not self.faces:
+                return []
+            scores, ids = self.index.search(np.asarray(vector, dtype=np.float32).reshape(1, -1), k)
+            return [
+                (int(face_id), self.faces[int(face_id)], float(score))
+                for score, face_id in zip(scores[0], ids[0]) if face_id != -1
+            ]
+
+    # Saves unsaved enrolments, if any
+    def flush(self):
+        with self.lock:
+            if self.unsaved:
+                self.save()
+
+    def _flush_periodically(self):
+        while not self.stop_event.wait(self.save_interval):
+            try:
+                self.flush()
+            except Exception:
+                logger.exception("Could not save the face index, retrying in %gs", self.save_interval)
+
+    # Stops the background saves and writes anything still pending
+    def close(self):
+        self.stop_event.set()
+        self.flush()
+
+    def save(self):
+        os.makedirs(self.index_dir, exist_ok=True)
+        with self.lock:
+            index_path = os.path.join(self.index_dir, INDEX_FILE)
+            faiss.write_index(self.index, index_path + ".tmp")
+            os.replace(index_path + ".tmp", index_path)
+            meta_path = os.path.join(self.index_dir, META_FILE)
+            with open(meta_path + ".tmp", "w") as f:
+                json.dump({"faces": self.faces, "next_id": self.next_id}, f)
+            os.replace(meta_path + ".tmp", meta_path)
+            self.unsaved = 0
@@ -0,0 +1,107 @@
+import json
+
+# Compaction of Rekognition results for the Titan summary prompt.
+#
+# detect_faces with Attributes=['ALL'] returns landmarks, pose, quality and a dozen
+# attributes with confidences for every face, over 1k tokens each once indented. The
+# summary only talks about who is in the picture, so each face is reduced to confidence,
+# gender, age range, its prominent emotions and the attributes that are present, floats
+# are rounded, and a group-level aggregate is added. When that is still over the token
+# budget, faces are listed largest first and the rest are covered by the aggregate only.
+
+EMOTION_MIN_CONFIDENCE = 50.0  # emotions below this are dropped (the top one is always kept)
+ATTRIBUTE_MIN_CONFIDENCE = 80.0
+ATTRIBUTES = ("Smile", "Eyeglasses", "Sunglasses", "Beard", "Mustache", "MouthOpen")
+CHARS_PER_TOKEN = 4  # rough ratio for English and JSON with Titan's tokenizer
+
+
+def estimate_tokens(text):
+    return (len(text) + CHARS_PER_TOKEN - 1) // CHARS_PER_TOKEN
+
+
+def to_json(data):
+    return json.dumps(data, separators=(",", ":"))
+
+
+def _box(bounding_box):
+    return [round(bounding_box.get(key, 0.0), 2) for key in ("Left", "Top", "Width", "Height")]
+
+
+def _box_area(face):
+    box = face.get("BoundingBox", {})
+    return box.get("Width", 0.0) * box.get("Height", 0.0)
+
+
+def compact_face(face):
+    emotions = sorted(face.get("Emotions", []), key=lambda emotion: emotion["Confidence"], reverse=True)
+    compact = {"confidence": round(face.get("Confidence", 0.0), 1)}
+    if "Gender" in face:
+        compact["gender"] = face["Gender"]["Value"]
+    if "AgeRange" in face:
+        compact["age"] = [face["AgeRange"]["Low"], face["AgeRange"]["High"]]
+    if emotions:
+        compact["emotions"] = [
+            emotion["Type"] for i, emotion in enumerate(emotions)
+            if i == 0 or emotion["Confidence"] >= EMOTION_MIN_CONFIDENCE
+        ]
+    attributes = [
+        name for name in ATTRIBUTES
+        if face.get(name, {}).get("Value") and face[name].get("Confidence", 0.0) >= ATTRIBUTE_MIN_CONFIDENCE
+    ]
+    eyes = face.get("EyesOpen", {})
+    if eyes.get("Value") is False and eyes.get("Confidence", 0.0) >= ATTRIBUTE_MIN_CONFIDENCE:
+        attributes.append("EyesClosed")
+    if attributes:
+        compact["attributes"] = attributes
+    if "BoundingBox" in face:
+        compact["box"] = _box(face["BoundingBox"])
+    return compact
+
+
+def compact_match(match):
+    face = match.get("Face", {})
+    return {"similarity": round(match.get("Similarity", 0.0), 1), "box": _box(face.get("BoundingBox", {}))}
+
+
+# Group-level view of all faces: counts by gender and dominant emotion, overall age span
+def aggregate_faces(face_details):
+    compact = [compact_face(face) for face in face_details]
+    genders, emotions = {}, {}
+    for face in compact:
+        if "gender" in face:
+            genders[face["gender"]] = genders.get(face["gender"], 0) + 1
+        if face.get("emotions"):
+            emotions[face["emotions"][0]] = emotions.get(face["emotions"][0], 0) + 1
+    aggregate = {"faces": len(compact), "genders": genders, "dominant_emotions": emotions}
+    ages = [face["age"] for face in compact if "age" in face]
+    if ages:
+        aggregate["age_span"] = [min(low for low, _ in ages), max(high for _, high in ages)]
+    return aggregate
+
+
+# Returns (source text, target text, stats) for the summary prompt, together within
+# token_budget estimated tokens where the data allows it. stats holds the estimated
+# tokens of the full indented JSON and of the compacted text, and how many faces were
+# listed individually.
+def compact_results(face_details, face_matches, token_budget=600):
+    full_tokens = estimate_tokens(json.dumps(face_details, indent=2) + json.dumps(face_matches, indent=2))
+    faces = sorted(face_details, key=_box_area, reverse=True)  # largest, i.e. most prominent, first
+    matches = sorted(face_matches, key=lambda match: match.get("Similarity", 0.0), reverse=True)
+    aggregate = aggregate_faces(face_details)
+
+    listed = len(faces)
+    while True:
+        source = {"faces": [compact_face(face) for face in faces[:listed]]}
+        if len(faces) > 1 or listed < len(faces):
+            source = {"group": aggregate, **source}
+        if listed < len(faces):
+            source["not_listed"] = len(faces) - listed
+        source_text = to_json(source)
+        target_text = to_json({"matches": [compact_match(match) for match in matches]})
+        compact_tokens = estimate_tokens(source_text + target_text)
+        if compact_tokens <= token_budget or listed == 0:
+            break
+        listed //= 2
+
+    stats = {"full_tokens": full_tokens, "compact_tokens": compact_tokens, "listed_faces": listed}
+    return source_text, target_text, stats
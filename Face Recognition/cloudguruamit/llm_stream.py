@@ -0,0 +1,76 @@
+import json
+import time
+
+# Token streaming from Bedrock with invoke_model_with_response_stream.
+#
+# Each generator yields text as soon as its chunk arrives, so the page can render the
+# answer incrementally, and fills a StreamStats with time-to-first-token and total
+# latency once the stream is consumed. Point the bedrock-runtime client at
+# stub_server.py (BEDROCK_ENDPOINT_URL) to run the same code offline.
+
+
+class StreamStats:
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.ttft_ms = None  # time to the first non-empty text chunk
+        self.total_ms = None
+        self.chunks = 0
+        self.output_tokens = None  # as reported by the model, when it does
+
+    def record_chunk(self):
+        self.chunks += 1
+        if self.ttft_ms is None:
+            self.ttft_ms = (time.perf_counter() - self.started) * 1000
+
+    def finish(self):
+        self.total_ms = (time.perf_counter() - self.started) * 1000
+
+    def describe(self):
+        if self.total_ms is None:
+            return "Streaming..."
+        ttft = f"{self.ttft_ms:.0f} ms" if self.ttft_ms is not None else "n/a"
+        return f"Time to first token: {ttft} | Total: {self.total_ms:.0f} ms | {self.chunks} chunks"
+
+
+def _events(client, model_id, body):
+    response = client.invoke_model_with_response_stream(
+        body=json.dumps(body), modelId=model_id, accept="application/json", contentType="application/json"
+    )
+    for event in response["body"]:
+        if "chunk" in event:
+            yield json.loads(event["chunk"]["bytes"])
+        else:
+            # Errors arrive in-band as modeled exceptions, e.g. throttlingException
+            name, detail = next(iter(event.items()))
+            raise RuntimeError(f"{name}: {detail.get('message', detail)}")
+
+
+# Yields the text of an Anthropic Messages API response as it streams
+def stream_claude(client, model_id, body, stats=None):
+    stats = stats or StreamStats()
+    try:
+        for chunk in _events(client, model_id, body):
+            if chunk.get("type") == "content_block_delta":
+                text = chunk.get("delta", {}).get("text", "")
+                if text:
+                    stats.record_chunk()
+                    yield text
+            elif chunk.get("type") == "message_delta":
+                stats.output_tokens = chunk.get("usage", {}).get("output_tokens")
+    finally:
+        stats.finish()
+
+
+# Yields the text of an Amazon Titan Text response as it streams
+def stream_titan(client, model_id, body, stats=None):
+    stats = stats or StreamStats()
+    try:
+        for chunk in _events(client, model_id, body):
+            text = chunk.get("outputText", "")
+            if text:
+                stats.record_chunk()
+                yield text
+            if chunk.get("totalOutputTextTokenCount") is not None:
+                stats.output_tokens = chunk["totalOutputTextTokenCount"]
+    finally:
+        stats.finish()
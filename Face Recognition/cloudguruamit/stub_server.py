@@ -0,0 +1,131 @@
+import re
+import json
+import time
+import base64
+import struct
+import argparse
+import binascii
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# Local stand-in for the bedrock-runtime endpoint, for trying the streaming UI offline.
+#
+# It answers InvokeModel and InvokeModelWithResponseStream for Anthropic Claude and
+# Amazon Titan Text model ids with a canned reply, streamed word by word as AWS
+# event-stream frames, so boto3 parses it exactly like the real service:
+#
+#   python stub_server.py --port 8089 --delay 0.05
+#   BEDROCK_ENDPOINT_URL=http://localhost:8089 streamlit run application.py
+
+REPLY = (
+    "This is a stubbed response from the local Bedrock endpoint. The image shows one face of an adult "
+    "with a neutral expression, looking towards the camera in even lighting."
+)
+PATH = re.compile(r"^/model/(?P<model_id>[^/]+)/(?P<action>invoke|invoke-with-response-stream)$")
+
+
+def _header(name, value):
+    name, value = name.encode("utf-8"), value.encode("utf-8")
+    return struct.pack(">B", len(name)) + name + struct.pack(">BH", 7, len(value)) + value  # 7 = string
+
+
+# Encodes one message of the application/vnd.amazon.eventstream framing:
+# prelude (total length, headers length, prelude CRC), headers, payload, message CRC
+def encode_event(payload, event_type="chunk", message_type="event"):
+    headers = (
+        _header(":event-type", event_type)
+        + _header(":content-type", "application/json")
+        + _header(":message-type", message_type)
+    )
+    total_length = 12 + len(headers) + len(payload) + 4
+    prelude = struct.pack(">II", total_length, len(headers))
+    prelude += struct.pack(">I", binascii.crc32(prelude) & 0xFFFFFFFF)
+    message = prelude + headers + payload
+    return message + struct.pack(">I", binascii.crc32(message) & 0xFFFFFFFF)
+
+
+def encode_chunk(chunk):
+    payload = json.dumps({"bytes": base64.b64encode(json.dumps(chunk).encode("utf-8")).decode("ascii")})
+    return encode_event(payload.encode("utf-8"))
+
+
+def claude_chunks(words):
+    yield {"type": "message_start", "message": {"role": "assistant", "content": [], "usage": {"input_tokens": 0}}}
+    yield {"type": "content_block_start", "index": 0, "content_block": {"type": "text", "text": ""}}
+    for word in words:
+        yield {"type": "content_block_delta", "index": 0, "delta": {"type": "text_delta", "text": word}}
+    yield {"type": "content_block_stop", "index": 0}
+    yield {"type": "message_delta", "delta": {"stop_reason": "end_turn"}, "usage": {"output_tokens": len(words)}}
+    yield {"type": "message_stop"}
+
+
+def titan_chunks(words):
+    for i, word in enumerate(words):
+        last = i == len(words) - 1
+        yield {
+            "outputText": word, "index": 0,
+            "totalOutputTextTokenCount": len(words) if last else None,
+            "completionReason": "FINISH" if last else None,
+        }
+
+
+def complete_body(model_id, text):
+    if model_id.startswith("anthropic."):
+        return {"type": "message", "role": "assistant", "content": [{"type": "text", "text": text}],
+                "stop_reason": "end_turn"}
+    return {"results": [{"outputText": text, "completionReason": "FINISH"}]}
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    delay = 0.05  # seconds between streamed words
+    first_token_delay = 0.3
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        match = PATH.match(self.path.split("?")[0])
+        if match is None:
+            self.send_error(404)
+            return
+        model_id = match.group("model_id").replace("%3A", ":")
+        words = [word + " " for word in REPLY.split()]
+
+        if match.group("action") == "invoke":
+            body = json.dumps(complete_body(model_id, REPLY)).encode("utf-8")
+            self.send_response(200)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+            return
+
+        chunks = claude_chunks(words) if model_id.startswith("anthropic.") else titan_chunks(words)
+        self.send_response(200)
+        self.send_header("Content-Type", "application/vnd.amazon.eventstream")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+        time.sleep(self.first_token_delay)
+        for chunk in chunks:
+            frame = encode_chunk(chunk)
+            self.wfile.write(f"{len(frame):X}\r\n".encode("ascii") + frame + b"\r\n")
+            self.wfile.flush()
+            time.sleep(self.delay)
+        self.wfile.write(b"0\r\n\r\n")
+
+    def log_message(self, format, *args):
+        pass
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Serve canned Bedrock responses locally")
+    parser.add_argument("--port", type=int, default=8089)
+    parser.add_argument("--delay", type=float, default=0.05, help="seconds between streamed words")
+    parser.add_argument("--first-token-delay", type=float, default=0.3)
+    args = parser.parse_args()
+    StubHandler.delay = args.delay
+    StubHandler.first_token_delay = args.first_token_delay
+    server = ThreadingHTTPServer(("127.0.0.1", args.port), StubHandler)
+    print(f"Stub Bedrock endpoint on http://127.0.0.1:{args.port}")
+    server.serve_forever()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,111 @@
+import time
+import argparse
+import numpy as np
+from embedding_cache import EmbeddingCache
+from image_index import create_faiss_index
+from image_preprocess import EMBED_MAX_SIDE, embedding_cache_key
+
+# Recall-vs-latency benchmark of the approximate index types against the exact flat index.
+#
+# Uses the vectors already in the embedding cache (no Bedrock calls), or a synthetic
+# clustered collection with --synthetic N. Queries are perturbed copies of indexed
+# vectors, which is close to what "find similar images" sends.
+#
+#   python benchmark_index.py
+#   python benchmark_index.py --synthetic 200000 --k 4 --nprobe 1 4 16 64 --ef-search 16 32 64 128
+
+
+def load_vectors(args):
+    if args.synthetic:
+        rng = np.random.default_rng(0)
+        centers = rng.normal(size=(max(1, args.synthetic // 100), args.dim)).astype(np.float32)
+        labels = rng.integers(0, len(centers), size=args.synthetic)
+        vectors = centers[labels] + 0.3 * rng.normal(size=(args.synthetic, args.dim)).astype(np.float32)
+    else:
+        vectors = np.array(EmbeddingCache(args.cache_dir, embedding_cache_key(args.model_id, args.max_side)).vectors())
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    return np.ascontiguousarray(vectors / np.maximum(norms, 1e-12), dtype=np.float32)
+
+
+def make_queries(vectors, count, noise):
+    rng = np.random.default_rng(1)
+    picked = vectors[rng.integers(0, len(vectors), size=count)]
+    queries = picked + noise * rng.normal(size=picked.shape).astype(np.float32)
+    return np.ascontiguousarray(queries, dtype=np.float32)
+
+
+def recall_at_k(found, truth):
+    hits = sum(len(set(f) & set(t)) for f, t in zip(found, truth))
+    return hits / truth.size
+
+
+# Runs queries one at a time, as the app does, and returns (ids, p50 ms, p95 ms)
+def timed_search(index, queries, k):
+    latencies = []
+    found = []
+    for query in queries:
+        start = time.perf_counter()
+        _, ids = index.search(query[None, :], k)
+        latencies.append((time.perf_counter() - start) * 1000)
+        found.append(ids[0])
+    return np.array(found), np.percentile(latencies, 50), np.percentile(latencies, 95)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare approximate image index types against exact search")
+    parser.add_argument("--cache-dir", default="./.embedding_cache")
+    parser.add_argument("--model-id", default="amazon.titan-embed-image-v1")
+    parser.add_argument("--max-side", type=int, default=EMBED_MAX_SIDE, help="EMBED_MAX_SIDE the vectors were cached with")
+    parser.add_argument("--synthetic", type=int, default=0, help="benchmark N random vectors instead of the cache")
+    parser.add_argument("--dim", type=int, default=1024)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--noise", type=float, default=0.05)
+    parser.add_argument("--k", type=int, default=4)
+    parser.add_argument("--nlist", type=int, default=0)
+    parser.add_argument("--nprobe", type=int, nargs="+", default=[1, 4, 16, 64])
+    parser.add_argument("--hnsw-m", type=int, default=32)
+    parser.add_argument("--ef-construction", type=int, default=200)
+    parser.add_argument("--ef-search", type=int, nargs="+", default=[16, 32, 64, 128])
+    args = parser.parse_args()
+
+    vectors = load_vectors(args)
+    if len(vectors) == 0:
+        print("No vectors found. Index the images first or pass --synthetic N.")
+        return
+    queries = make_queries(vectors, args.queries, args.noise)
+    k = min(args.k, len(vectors))
+    dim = vectors.shape[1]
+    print(f"{len(vectors)} vectors, dim {dim}, {len(queries)} queries, k={k}\n")
+    print(f"{'index':<24}{'build s':>10}{'recall@k':>10}{'p50 ms':>10}{'p95 ms':>10}")
+
+    start = time.perf_counter()
+    flat = create_faiss_index(dim, "flat")
+    flat.add(vectors)
+    build_seconds = time.perf_counter() - start
+    truth, p50, p95 = timed_search(flat, queries, k)
+    print(f"{'flat (exact)':<24}{build_seconds:>10.2f}{1.0:>10.3f}{p50:>10.3f}{p95:>10.3f}")
+
+    start = time.perf_counter()
+    ivf = create_faiss_index(dim, "ivf", nlist=args.nlist or None, num_vectors=len(vectors))
+    ivf.train(vectors)
+    ivf.add(vectors)
+    build_seconds = time.perf_counter() - start
+    for nprobe in args.nprobe:
+        ivf.nprobe = nprobe
+        found, p50, p95 = timed_search(ivf, queries, k)
+        label = f"ivf{ivf.nlist} nprobe={nprobe}"
+        print(f"{label:<24}{build_seconds:>10.2f}{recall_at_k(found, truth):>10.3f}{p50:>10.3f}{p95:>10.3f}")
+
+    start = time.perf_counter()
+    hnsw = create_faiss_index(dim, "hnsw", hnsw_m=args.hnsw_m, ef_construction=args.ef_construction)
+    hnsw.add(vectors)
+    build_seconds = time.perf_counter() - start
+    for ef_search in args.ef_search:
+        hnsw.hnsw.efSearch = ef_search
+        found, p50, p95 = timed_search(hnsw, queries, k)
+        label = f"hnsw{args.hnsw_m} ef={ef_search}"
+        print(f"{label:<24}{build_seconds:>10.2f}{recall_at_k(found, truth):>10.3f}{p50:>10.3f}{p95:>10.3f}")
+
+
+if __name__ == "__main__":
+    main()
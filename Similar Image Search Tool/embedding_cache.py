@@ -0,0 +1,149 @@
+import os
+import json
+import hashlib
+import numpy as np
+
+# Persistent, content-addressed store of image embeddings.
+#
+# Vectors live in a flat float32 file that is memory-mapped as a (capacity, dim)
+# matrix, and a JSON manifest maps each content hash to its row. Entries are keyed
+# by the SHA-256 of the image bytes, and each model id gets its own directory, so a
+# renamed file is never re-embedded and switching models never mixes vectors.
+
+MANIFEST_NAME = "manifest.json"
+VECTORS_NAME = "vectors.f32"
+
+
+def hash_file(file_path, chunk_size=1 << 20):
+    digest = hashlib.sha256()
+    with open(file_path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def _model_dir_name(model_id):
+    return "".join(c if c.isalnum() or c in "-_." else "_" for c in model_id)
+
+
+class EmbeddingCache:
+    def __init__(self, cache_dir, model_id):
+        self.model_id = model_id
+        self.dir = os.path.join(cache_dir, _model_dir_name(model_id))
+        self.manifest_path = os.path.join(self.dir, MANIFEST_NAME)
+        self.vectors_path = os.path.join(self.dir, VECTORS_NAME)
+        os.makedirs(self.dir, exist_ok=True)
+
+        self.dim = None
+        self.count = 0
+        self.rows = {}    # content hash -> row in the vector matrix
+        self.files = {}   # file path -> {"hash", "size", "mtime_ns"}
+        self._matrix = None
+        self._load()
+
+    def _load(self):
+        if not os.path.exists(self.manifest_path):
+            return
+        with open(self.manifest_path, "r") as f:
+            manifest = json.load(f)
+        if manifest.get("model_id") != self.model_id:
+            return
+        self.dim = manifest["dim"]
+        self.count = manifest["count"]
+        self.rows = manifest["rows"]
+        self.files = manifest["files"]
+        if self.dim and os.path.exists(self.vectors_path):
+            self._open_matrix()
+
+    def _capacity(self):
+        return os.path.getsize(self.vectors_path) // (4 * self.dim)
+
+    def _open_matrix(self):
+        capacity = self._capacity()
+        if capacity == 0:
+            self._matrix = None
+            return
+        self._matrix = np.memmap(self.vectors_path, dtype=np.float32, mode="r+", shape=(capacity, self.dim))
+
+    def _ensure_capacity(self, needed):
+        if not os.path.exists(self.vectors_path):
+            open(self.vectors_path, "wb").close()
+        capacity = self._capacity()
+        if needed <= capacity:
+            return
+        new_capacity = max(needed, capacity * 2, 1024)
+        if self._matrix is not None:
+            self._matrix.flush()
+            self._matrix = None
+        with open(self.vectors_path, "r+b") as f:
+            f.truncate(new_capacity * self.dim * 4)
+        self._open_matrix()
+
+    # Returns the cached hash for a file if its size and mtime are unchanged,
+    # otherwise hashes the contents again
+    def file_hash(self, file_path):
+        stat = os.stat(file_path)
+        record = self.files.get(file_path)
+        if record and record["size"] == stat.st_size and record["mtime_ns"] == stat.st_mtime_ns:
+            return record["hash"]
+        content_hash = hash_file(file_path)
+        self.files[file_path] = {"hash": content_hash, "size": stat.st_size, "mtime_ns": stat.st_mtime_ns}
+        return content_hash
+
+    def get(self, content_hash):
+        row = self.rows.get(content_hash)
+        if row is None or self._matrix is None:
+            return None
+        return self._matrix[row].tolist()
+
+    def put(self, content_hash, vector):
+        vector = np.asarray(vector, dtype=np.float32)
+        if self.dim is None:
+            self.dim = int(vector.shape[0])
+        elif vector.shape[0] != self.dim:
+            raise ValueError(f"Expected a {self.dim}-dimensional vector, got {vector.shape[0]}")
+
+        row = self.rows.get(content_hash)
+        if row is None:
+            row = self.count
+            self._ensure_capacity(row + 1)
+            self.rows[content_hash] = row
+            self.count += 1
+        self._matrix[row] = vector
+
+    # Drops entries for files that no longer exist, and vectors no live file points at
+    def retain(self, file_paths):
+        file_paths = set(file_paths)
+        self.files = {path: record for path, record in self.files.items() if path in file_paths}
+        live_hashes = {record["hash"] for record in self.files.values()}
+        stale = [h for h in self.rows if h not in live_hashes]
+        if not stale:
+            return 0
+
+        kept = sorted((row, h) for h, row in self.rows.items() if h in live_hashes)
+        if kept and self._matrix is not None:
+            compacted = np.array([self._matrix[row] for row, _ in kept], dtype=np.float32)
+            self._matrix[:len(kept)] = compacted
+        self.rows = {h: new_row for new_row, (_, h) in enumerate(kept)}
+        self.count = len(kept)
+        return len(stale)
+
+    def vectors(self):
+        if self._matrix is None:
+            return np.zeros((0, self.dim or 0), dtype=np.float32)
+        return self._matrix[:self.count]
+
+    def save(self):
+        if self._matrix is not None:
+            self._matrix.flush()
+        manifest = {
+            "model_id": self.model_id,
+            "dim": self.dim,
+            "count": self.count,
+            "rows": self.rows,
+            "files": self.files,
+        }
+        tmp_path = self.manifest_path + ".tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(manifest, f)
+        os.replace(tmp_path, self.manifest_path)
@@ -0,0 +1,212 @@
+import os
+import json
+import hashlib
+import threading
+import faiss
+import numpy as np
+
+# On-disk FAISS index of image vectors, shared by every session of the app.
+#
+# "flat" is the exact L2 search the app has always used. "ivf" (inverted lists) and
+# "hnsw" (graph) trade a little recall for sub-linear query time on large collections;
+# run benchmark_index.py to pick their parameters for a given catalogue.
+#
+# Vectors are stored under stable ids so single images can be added, replaced and
+# removed in place: IVF indexes carry ids natively, flat and HNSW ones are wrapped in
+# IndexIDMap2. HNSW graphs cannot delete nodes, so removed HNSW ids are filtered out of
+# results and purged by an occasional compaction.
+
+INDEX_TYPES = ("flat", "ivf", "hnsw")
+INDEX_FILE = "index.faiss"
+META_FILE = "index.json"
+META_VERSION = 2
+COMPACT_RATIO = 0.2  # compact an HNSW index once this share of its entries are deleted
+# IO_FLAG_MMAP only maps the inverted lists of IVF indexes; IO_FLAG_MMAP_IFC (faiss 1.8+)
+# maps the whole file, so flat and HNSW indexes are shared through the page cache too
+MMAP_ALL = hasattr(faiss, "IO_FLAG_MMAP_IFC")
+MMAP_FLAG = faiss.IO_FLAG_MMAP_IFC if MMAP_ALL else faiss.IO_FLAG_MMAP
+
+
+# Identifies the exact set of (path, vector) pairs and index settings an index was built from
+def get_fingerprint(image_vectors, index_type, params):
+    digest = hashlib.sha256()
+    digest.update(json.dumps([index_type, params], sort_keys=True).encode("utf-8"))
+    for path, vector in image_vectors:
+        digest.update(path.encode("utf-8"))
+        digest.update(np.asarray(vector, dtype=np.float32).tobytes())
+    return digest.hexdigest()
+
+
+def create_faiss_index(dim, index_type="flat", nlist=None, hnsw_m=32, ef_construction=200, num_vectors=0):
+    if index_type == "flat":
+        return faiss.IndexFlatL2(dim)
+    if index_type == "ivf":
+        # The usual rule of thumb is ~sqrt(N) lists, with at least ~39 training points per list
+        if not nlist:
+            nlist = int(np.sqrt(num_vectors)) or 1
+        nlist = max(1, min(nlist, num_vectors // 39 or 1))
+        quantizer = faiss.IndexFlatL2(dim)
+        return faiss.IndexIVFFlat(quantizer, dim, nlist, faiss.METRIC_L2)
+    if index_type == "hnsw":
+        index = faiss.IndexHNSWFlat(dim, hnsw_m, faiss.METRIC_L2)
+        index.hnsw.efConstruction = ef_construction
+        return index
+    raise ValueError(f"Unknown index type '{index_type}', expected one of {INDEX_TYPES}")
+
+
+def _ids(*ids):
+    return np.array(ids, dtype=np.int64)
+
+
+class ImageIndex:
+    def __init__(self, index, id_to_path, index_type="flat", params=None, fingerprint=None,
+                 next_id=None, deleted=None, source_path=None):
+        self.index = index
+        self.id_to_path = id_to_path
+        self.path_to_id = {path: i for i, path in id_to_path.items()}
+        self.index_type = index_type
+        self.params = params or {}
+        self.fingerprint = fingerprint
+        self.next_id = next_id if next_id is not None else max(id_to_path, default=-1) + 1
+        self.deleted = set(deleted or ())  # HNSW ids that are still in the graph but removed
+        self.source_path = source_path  # memory-mapped from this file, read into memory on first write
+        self.lock = threading.RLock()
+
+    def __len__(self):
+        return len(self.id_to_path)
+
+    @property
+    def paths(self):
+        return list(self.path_to_id)
+
+    @classmethod
+    def build(cls, image_vectors, index_type="flat", nlist=None, hnsw_m=32, ef_construction=200):
+        paths = [item[0] for item in image_vectors]
+        vectors = np.ascontiguousarray([item[1] for item in image_vectors], dtype=np.float32)
+
+        base = create_faiss_index(
+            vectors.shape[1], index_type,
+            nlist=nlist, hnsw_m=hnsw_m, ef_construction=ef_construction, num_vectors=len(vectors)
+        )
+        if not base.is_trained:
+            base.train(vectors)
+        index = base if index_type == "ivf" else faiss.IndexIDMap2(base)
+        index.add_with_ids(vectors, np.arange(len(vectors), dtype=np.int64))
+
+        params = {"nlist": nlist, "hnsw_m": hnsw_m, "ef_construction": ef_construction}
+        return cls(index, dict(enumerate(paths)), index_type, params, get_fingerprint(image_vectors, index_type, params))
+
+    def save(self, directory):
+        with self.lock:
+            os.makedirs(directory, exist_ok=True)
+            faiss.write_index(self.index, os.path.join(directory, INDEX_FILE + ".tmp"))
+            meta = {
+                "version": META_VERSION,
+                "index_type": self.index_type,
+                "params": self.params,
+                "fingerprint": self.fingerprint,
+                "next_id": self.next_id,
+                "deleted": sorted(self.deleted),
+                "paths": self.id_to_path,
+            }
+        with open(os.path.join(directory, META_FILE + ".tmp"), "w") as f:
+            json.dump(meta, f)
+        os.replace(os.path.join(directory, INDEX_FILE + ".tmp"), os.path.join(directory, INDEX_FILE))
+        os.replace(os.path.join(directory, META_FILE + ".tmp"), os.path.join(directory, META_FILE))
+
+    # Loads a saved index, memory-mapping it where faiss can so the pages are shared
+    # through the OS page cache. Without IO_FLAG_MMAP_IFC only IVF indexes are mapped;
+    # flat and HNSW ones are read into memory.
+    @classmethod
+    def load(cls, directory, mmap=True):
+        index_path = os.path.join(directory, INDEX_FILE)
+        meta_path = os.path.join(directory, META_FILE)
+        if not (os.path.exists(index_path) and os.path.exists(meta_path)):
+            return None
+
+        with open(meta_path, "r") as f:
+            meta = json.load(f)
+        if meta.get("version") != META_VERSION:
+            return None
+        mapped = mmap and (MMAP_ALL or meta["index_type"] == "ivf")
+        index = faiss.read_index(index_path, MMAP_FLAG | faiss.IO_FLAG_READ_ONLY if mapped else 0)
+        id_to_path = {int(i): path for i, path in meta["paths"].items()}
+        return cls(index, id_to_path, meta["index_type"], meta["params"], meta["fingerprint"],
+                   meta["next_id"], meta["deleted"], source_path=index_path if mapped else None)
+
+    def _base_index(self):
+        if self.index_type == "ivf":
+            return self.index
+        return faiss.downcast_index(self.index.index)
+
+    def set_search_params(self, nprobe=None, ef_search=None):
+        base = self._base_index()
+        if nprobe and self.index_type == "ivf":
+            base.nprobe = nprobe
+        if ef_search and self.index_type == "hnsw":
+            base.hnsw.efSearch = ef_search
+
+    # Returns the paths of the k nearest images, closest first
+    def search(self, vector, k=4):
+        query = np.asarray([vector], dtype=np.float32)
+        with self.lock:
+            if not self.id_to_path:
+                return []
+            fetch = min(k + len(self.deleted), self.index.ntotal)
+            _, ids = self.index.search(query, fetch)
+            paths = [self.id_to_path[i] for i in ids[0] if i in self.id_to_path]
+        return paths[:k]
+
+    def _make_writable(self):
+        if self.source_path:
+            nprobe = getattr(self._base_index(), "nprobe", None)
+            ef_search = self._base_index().hnsw.efSearch if self.index_type == "hnsw" else None
+            self.index = faiss.read_index(self.source_path)
+            self.source_path = None
+            self.set_search_params(nprobe=nprobe, ef_search=ef_search)
+
+    def _remove_id(self, i):
+        if self.index_type == "hnsw":
+            self.deleted.add(i)
+        else:
+            self.index.remove_ids(_ids(i))
+
+    # Adds an image, or replaces the vector of one already indexed
+    def upsert(self, path, vector):
+        with self.lock:
+            self._make_writable()
+            old_id = self.path_to_id.pop(path, None)
+            if old_id is not None:
+                del self.id_to_path[old_id]
+                self._remove_id(old_id)
+            new_id = self.next_id
+            self.next_id += 1
+            self.index.add_with_ids(np.asarray([vector], dtype=np.float32), _ids(new_id))
+            self.id_to_path[new_id] = path
+            self.path_to_id[path] = new_id
+            self._maybe_compact()
+
+    def remove(self, path):
+        with self.lock:
+            old_id = self.path_to_id.pop(path, None)
+            if old_id is None:
+                return
+            self._make_writable()
+            del self.id_to_path[old_id]
+            self._remove_id(old_id)
+            self._maybe_compact()
+
+    # Rebuilds an HNSW graph without its deleted nodes once they make up a large share of it
+    def _maybe_compact(self):
+        if not self.deleted or len(self.deleted) < COMPACT_RATIO * self.index.ntotal:
+            return
+        live_ids = np.array(sorted(self.id_to_path), dtype=np.int64)
+        vectors = np.vstack([self.index.reconstruct(int(i)) for i in live_ids]) if len(live_ids) else None
+        base = create_faiss_index(self.index.d, "hnsw", **{k: v for k, v in self.params.items() if k != "nlist"})
+        ef_search = self._base_index().hnsw.efSearch
+        index = faiss.IndexIDMap2(base)
+        if vectors is not None:
+            index.add_with_ids(vectors, live_ids)
+        self.index = index
+        self.deleted.clear()
+        self.set_search_params(ef_search=ef_search)
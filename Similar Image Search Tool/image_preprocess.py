@@ -0,0 +1,91 @@
+import os
+import hashlib
+import threading
+from io import BytesIO
+from PIL import Image, ImageOps
+
+# Image preprocessing for embedding and result rendering.
+#
+# Titan multimodal embeddings gain nothing from multi-megapixel input, so images are
+# downsized before being base64-encoded and uploaded. Results are shown at width=250,
+# so search hits are served from a cache of small JPEG thumbnails instead of originals.
+
+EMBED_MAX_SIDE = int(os.getenv("EMBED_MAX_SIDE", "512"))  # longest side sent to the embedding model
+THUMBNAIL_SIDE = 256
+JPEG_QUALITY = 90
+
+
+# Namespace of cached vectors: they depend on the preprocessing as well as on the model
+def embedding_cache_key(model_id, max_side=EMBED_MAX_SIDE):
+    return f"{model_id}@{max_side}px"
+
+
+# Decodes an image at roughly the requested size. For JPEGs, draft() lets the decoder
+# skip most of the work by scaling down during decoding.
+def open_downscaled(source, max_side):
+    image = Image.open(source)
+    image.draft("RGB", (max_side, max_side))
+    image = ImageOps.exif_transpose(image)
+    if image.mode not in ("RGB", "L"):
+        image = image.convert("RGB")
+    image.thumbnail((max_side, max_side), Image.LANCZOS)
+    return image
+
+
+def encode_jpeg(image, quality=JPEG_QUALITY):
+    buffer = BytesIO()
+    image.save(buffer, format="JPEG", quality=quality)
+    return buffer.getvalue()
+
+
+def _fits(image_bytes, max_side):
+    with Image.open(BytesIO(image_bytes)) as image:  # reads the header only
+        return max(image.size) <= max_side and image.format in ("JPEG", "PNG")
+
+
+# Returns image bytes suitable for the embedding model, downsized when larger than max_side
+def prepare_for_embedding(image_bytes, max_side=EMBED_MAX_SIDE):
+    if _fits(image_bytes, max_side):
+        return image_bytes  # already small enough, send as-is
+    return encode_jpeg(open_downscaled(BytesIO(image_bytes), max_side))
+
+
+# Returns (embedding bytes, thumbnail bytes) for a file with a single decode of the original
+def prepare_file(file_path, max_side=EMBED_MAX_SIDE, thumbnail_side=THUMBNAIL_SIDE):
+    with open(file_path, "rb") as f:
+        image_bytes = f.read()
+
+    if _fits(image_bytes, max_side):
+        return image_bytes, encode_jpeg(open_downscaled(BytesIO(image_bytes), thumbnail_side))
+
+    resized = open_downscaled(BytesIO(image_bytes), max_side)
+    thumbnail = resized.copy()
+    thumbnail.thumbnail((thumbnail_side, thumbnail_side), Image.LANCZOS)
+    return encode_jpeg(resized), encode_jpeg(thumbnail)
+
+
+# On-disk cache of result thumbnails, keyed by the path, size and mtime of the original
+class ThumbnailStore:
+    def __init__(self, directory, side=THUMBNAIL_SIDE):
+        self.directory = directory
+        self.side = side
+        os.makedirs(directory, exist_ok=True)
+
+    def _thumbnail_path(self, file_path):
+        stat = os.stat(file_path)
+        key = f"{os.path.abspath(file_path)}:{stat.st_size}:{stat.st_mtime_ns}:{self.side}"
+        return os.path.join(self.directory, hashlib.sha1(key.encode("utf-8")).hexdigest() + ".jpg")
+
+    def put(self, file_path, thumbnail_bytes):
+        path = self._thumbnail_path(file_path)
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(thumbnail_bytes)
+        os.replace(tmp_path, path)
+
+    def get(self, file_path):
+        path = self._thumbnail_path(file_path)
+        if not os.path.exists(path):
+            self.put(file_path, encode_jpeg(open_downscaled(file_path, self.side)))
+        with open(path, "rb") as f:
+            return f.read()
@@ -0,0 +1,119 @@
+import os
+import time
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from image_index import get_fingerprint
+
+# Keeps a live ImageIndex in step with an image directory.
+#
+# A background thread rescans the directory every `interval` seconds. Files are
+# compared by size and mtime first and only re-hashed when those change, so an idle
+# scan costs one stat() per file. Added and modified images are embedded outside the
+# index lock and applied one by one, so searches keep being served during an update.
+
+logger = logging.getLogger(__name__)
+
+
+class IndexWatcher:
+    def __init__(self, index, directory, cache, embed_file, index_dir=None, interval=30.0, concurrency=4):
+        self.index = index
+        self.directory = directory
+        self.cache = cache
+        self.embed_file = embed_file  # file path -> vector
+        self.index_dir = index_dir
+        self.interval = interval
+        self.concurrency = concurrency
+        # Content hash of every indexed file as of the last applied scan
+        self.known = {
+            path: self.cache.files.get(path, {}).get("hash")
+            for path in index.path_to_id
+        }
+        self.last_scan = None
+        self._stop = threading.Event()
+        self._thread = None
+
+    def _list_files(self):
+        if not os.path.isdir(self.directory):
+            return []
+        file_paths = [os.path.join(self.directory, file) for file in sorted(os.listdir(self.directory))]
+        return [file_path for file_path in file_paths if os.path.isfile(file_path)]
+
+    # Runs one scan and applies the changes; returns counts of added, modified and removed files
+    def scan(self):
+        current = {}
+        for file_path in self._list_files():
+            try:
+                current[file_path] = self.cache.file_hash(file_path)
+            except OSError:
+                continue  # removed while scanning, picked up next time
+
+        added = [path for path in current if path not in self.known]
+        modified = [path for path in current if path in self.known and self.known[path] != current[path]]
+        removed = [path for path in self.known if path not in current]
+
+        for path in removed:
+            self.index.remove(path)
+            del self.known[path]
+
+        changed = added + modified
+        with ThreadPoolExecutor(max_workers=max(1, self.concurrency)) as executor:
+            futures = {}
+            for path in changed:
+                vector = self.cache.get(current[path])
+                if vector is None:
+                    futures[executor.submit(self.embed_file, path)] = path
+                else:
+                    self._apply(path, current[path], vector)
+            for future in as_completed(futures):
+                path = futures[future]
+                try:
+                    vector = future.result()
+                except Exception:
+                    logger.exception("Failed to embed %s, will retry on the next scan", path)
+                    continue
+                self.cache.put(current[path], vector)
+                self._apply(path, current[path], vector)
+
+        if changed or removed:
+            self.cache.retain(current)
+            self.cache.save()
+            self._save_index()
+
+        self.last_scan = time.time()
+        return {"added": len(added), "modified": len(modified), "removed": len(removed)}
+
+    def _apply(self, path, content_hash, vector):
+        self.index.upsert(path, vector)
+        self.known[path] = content_hash
+
+    # Saves the index under the fingerprint a fresh build of the same files would get,
+    # so the next process start loads it instead of rebuilding
+    def _save_index(self):
+        if not self.index_dir:
+            return
+        image_vectors = [(path, self.cache.get(self.known[path])) for path in sorted(self.known)]
+        image_vectors = [item for item in image_vectors if item[1] is not None]
+        self.index.fingerprint = get_fingerprint(image_vectors, self.index.index_type, self.index.params)
+        self.index.save(self.index_dir)
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            try:
+                changes = self.scan()
+                if any(changes.values()):
+                    logger.info("Image index updated: %s", changes)
+            except Exception:
+                logger.exception("Image directory scan failed")
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name="image-index-watcher", daemon=True)
+            self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
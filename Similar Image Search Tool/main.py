@@ -1,20 +1,53 @@
 import os
-import boto3
+import sys
 import json
 import base64
 from io import BytesIO
+from concurrent.futures import ThreadPoolExecutor, as_completed
 import streamlit as st
-from langchain_community.vectorstores import FAISS
-# Calls Bedrock to get a vector from either an image, text, or both
+from embedding_cache import EmbeddingCache
+from image_index import ImageIndex, INDEX_TYPES, get_fingerprint
+from image_preprocess import ThumbnailStore, embedding_cache_key, prepare_file, prepare_for_embedding
+from index_watcher import IndexWatcher
 
-def get_multimodal_vector(input_image_base64=None, input_text=None):
-    session = boto3.Session(
-        aws_access_key_id='xxx',
-        aws_secret_access_key='xxx',
-        region_name='us-east-1'
-    )
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from aws_common.runtime import MAX_POOL_CONNECTIONS, call_stats, get_bedrock_runtime
+
+os.environ["AWS_ACCESS_KEY_ID"] = "xxx"
+os.environ["AWS_SECRET_ACCESS_KEY"] = "xxx"
+os.environ["AWS_DEFAULT_REGION"] = "us-east-1"
+
+EMBEDDING_MODEL_ID = "amazon.titan-embed-image-v1"
+EMBEDDING_CACHE_DIR = "./.embedding_cache"
+EMBEDDING_CACHE_KEY = embedding_cache_key(EMBEDDING_MODEL_ID)
+THUMBNAIL_DIR = "./.thumbnails"
+EMBEDDING_CONCURRENCY = int(os.getenv("EMBEDDING_CONCURRENCY", "8"))  # parallel Bedrock requests while indexing, at most AWS_MAX_CONCURRENCY
+
+# Vector index settings; "ivf" or "hnsw" trade a little recall for speed on large collections
+INDEX_DIR = "./.image_index"
+INDEX_TYPE = os.getenv("IMAGE_INDEX_TYPE", "flat")
+INDEX_PARAMS = {
+    "nlist": int(os.getenv("IMAGE_INDEX_NLIST", "0")) or None,  # IVF lists, defaults to ~sqrt(N)
+    "hnsw_m": int(os.getenv("IMAGE_INDEX_HNSW_M", "32")),
+    "ef_construction": int(os.getenv("IMAGE_INDEX_EF_CONSTRUCTION", "200")),
+}
+INDEX_NPROBE = int(os.getenv("IMAGE_INDEX_NPROBE", "16"))  # IVF lists scanned per query
+INDEX_EF_SEARCH = int(os.getenv("IMAGE_INDEX_EF_SEARCH", "64"))  # HNSW candidate list size per query
+IMAGES_DIR = "./images"
+WATCH_INTERVAL = float(os.getenv("IMAGE_WATCH_INTERVAL", "30"))  # seconds between rescans of IMAGES_DIR, 0 disables
+
+# The shared Bedrock client of the aws_common runtime, used by every session and indexing
+# worker. The pool is sized so each worker keeps its own connection; adaptive retries
+# back off client-side once Bedrock throttles.
+@st.cache_resource
+def get_bedrock_client():
+    return get_bedrock_runtime(max_pool_connections=max(MAX_POOL_CONNECTIONS, EMBEDDING_CONCURRENCY))
+
+# Calls Bedrock to get a vector from either an image, text, or both
 
-    bedrock = session.client(service_name='bedrock-runtime')
+def get_multimodal_vector(input_image_base64=None, input_text=None, bedrock=None):
+    if bedrock is None:
+        bedrock = get_bedrock_client()
 
     request_body = {}
 
@@ -28,7 +61,7 @@ def get_multimodal_vector(input_image_base64=None, input_text=None):
 
     response = bedrock.invoke_model(
         body=body,
-        modelId="amazon.titan-embed-image-v1",
+        modelId=EMBEDDING_MODEL_ID,
         accept="application/json",
         contentType="application/json"
     )
@@ -37,69 +70,145 @@ def get_multimodal_vector(input_image_base64=None, input_text=None):
     embedding = response_body.get("embedding")
 
     return embedding
-# Creates a vector from a file
-def get_vector_from_file(file_path):
-    with open(file_path, "rb") as image_file:
-        input_image_base64 = base64.b64encode(image_file.read()).decode('utf8')
+# Creates a vector from a file, storing its thumbnail while the image is already decoded
+def get_vector_from_file(file_path, bedrock=None, thumbnails=None):
+    embed_bytes, thumbnail_bytes = prepare_file(file_path)
+    if thumbnails is not None:
+        thumbnails.put(file_path, thumbnail_bytes)
+
+    input_image_base64 = base64.b64encode(embed_bytes).decode('utf8')
    
-    vector = get_multimodal_vector(input_image_base64=input_image_base64)
+    vector = get_multimodal_vector(input_image_base64=input_image_base64, bedrock=bedrock)
    
     return vector
 
 
-# Creates a list of (path, vector) tuples from a directory
-def get_image_vectors_from_directory(path):
+# Creates a list of (path, vector) tuples from a directory, embedding only new or changed files.
+# Cache misses are embedded by a bounded pool of workers sharing one client; progress_callback,
+# if given, is called from the calling thread as (done, total) after each file.
+def get_image_vectors_from_directory(path, concurrency=EMBEDDING_CONCURRENCY, progress_callback=None):
     items = []
    
     if not os.path.exists(path):
         st.error(f"Directory '{path}' does not exist.")
         return items
-   
-    for file in os.listdir(path):
-        file_path = os.path.join(path, file)
-        vector = get_vector_from_file(file_path)
-        items.append((file_path, vector))
+
+    cache = EmbeddingCache(EMBEDDING_CACHE_DIR, EMBEDDING_CACHE_KEY)
+    file_paths = [os.path.join(path, file) for file in sorted(os.listdir(path))]
+    file_paths = [file_path for file_path in file_paths if os.path.isfile(file_path)]
+
+    vectors = {}
+    misses = {}  # content hash -> first file with that content
+    for file_path in file_paths:
+        content_hash = cache.file_hash(file_path)
+        vector = cache.get(content_hash)
+        if vector is None:
+            misses.setdefault(content_hash, file_path)
+        else:
+            vectors[content_hash] = vector
+
+    total = len(misses)
+    if progress_callback:
+        progress_callback(0, total)
+
+    if misses:
+        bedrock = get_bedrock_client()
+        thumbnails = ThumbnailStore(THUMBNAIL_DIR)
+        try:
+            with ThreadPoolExecutor(max_workers=max(1, concurrency)) as executor:
+                futures = {
+                    executor.submit(get_vector_from_file, file_path, bedrock, thumbnails): content_hash
+                    for content_hash, file_path in misses.items()
+                }
+                for done, future in enumerate(as_completed(futures), start=1):
+                    content_hash = futures[future]
+                    vector = future.result()
+                    cache.put(content_hash, vector)  # the cache is only touched from this thread
+                    vectors[content_hash] = vector
+                    if progress_callback:
+                        progress_callback(done, total)
+        finally:
+            cache.save()  # keep whatever was embedded if a request fails part way
+
+    for file_path in file_paths:
+        items.append((file_path, vectors[cache.files[file_path]["hash"]]))
+
+    cache.retain(file_paths)  # drop entries for deleted files
+    cache.save()
    
     return items
 
 
-# Creates and returns an in-memory vector store to be used in the application
-def get_index():
-    image_vectors = get_image_vectors_from_directory("./images")  # Use absolute path
+# Creates and returns the vector store used by the application. The index is saved to
+# disk and reloaded (memory-mapped) as long as the images and index settings are unchanged.
+def get_index(index_type=INDEX_TYPE):
+    if index_type not in INDEX_TYPES:
+        st.error(f"Unknown index type '{index_type}', expected one of {', '.join(INDEX_TYPES)}.")
+        return None
+
+    progress_bar = st.progress(0.0, text="Embedding images...")
+
+    def show_progress(done, total):
+        progress_bar.progress(done / total if total else 1.0, text=f"Embedded {done} of {total} new images")
+
+    image_vectors = get_image_vectors_from_directory(IMAGES_DIR, progress_callback=show_progress)  # Use absolute path
+    progress_bar.empty()
    
     if not image_vectors:
         st.error("No vectors were created. Please check the 'images' directory.")
         return None
-   
-    text_embeddings = [("", item[1]) for item in image_vectors]
-    metadatas = [{"image_path": item[0]} for item in image_vectors]
-   
-    index = FAISS.from_embeddings(
-        text_embeddings=text_embeddings,
-        embedding=None,
-        metadatas=metadatas
-    )
+
+    fingerprint = get_fingerprint(image_vectors, index_type, INDEX_PARAMS)
+    index = ImageIndex.load(INDEX_DIR)
+
+    if index is None or index.fingerprint != fingerprint:
+        index = ImageIndex.build(image_vectors, index_type, **INDEX_PARAMS)
+        index.save(INDEX_DIR)
+
+    index.set_search_params(nprobe=INDEX_NPROBE, ef_search=INDEX_EF_SEARCH)
    
     return index
-# Get a base64-encoded string from file bytes
+
+
+# Builds or loads the index once per process; every browser session shares the same copy.
+# A background watcher then applies added, modified and removed images to it in place.
+@st.cache_resource(show_spinner=False)
+def get_shared_index(index_type=INDEX_TYPE):
+    index = get_index(index_type)
+
+    if index is not None and WATCH_INTERVAL > 0:
+        bedrock = get_bedrock_client()
+        thumbnails = ThumbnailStore(THUMBNAIL_DIR)
+        IndexWatcher(
+            index,
+            IMAGES_DIR,
+            EmbeddingCache(EMBEDDING_CACHE_DIR, EMBEDDING_CACHE_KEY),
+            embed_file=lambda file_path: get_vector_from_file(file_path, bedrock, thumbnails),
+            index_dir=INDEX_DIR,
+            interval=WATCH_INTERVAL,
+            concurrency=EMBEDDING_CONCURRENCY
+        ).start()
+
+    return index
+
+
+# Get a base64-encoded string from file bytes, downsized for the embedding model
 def get_base64_from_bytes(image_bytes):
-    image_io = BytesIO(image_bytes)
-    image_base64 = base64.b64encode(image_io.getvalue()).decode("utf-8")
+    image_base64 = base64.b64encode(prepare_for_embedding(image_bytes)).decode("utf-8")
     return image_base64
 
 
-# Get a list of images based on the provided search term and/or search image
-def get_similarity_search_results(index, search_term=None, search_image=None):
+# Get a list of result thumbnails based on the provided search term and/or search image
+def get_similarity_search_results(index, search_term=None, search_image=None, k=4):
     search_image_base64 = get_base64_from_bytes(search_image) if search_image else None
     search_vector = get_multimodal_vector(input_text=search_term, input_image_base64=search_image_base64)
    
-    results = index.similarity_search_by_vector(embedding=search_vector)
+    results = index.search(search_vector, k=k)
     results_images = []
+    thumbnails = ThumbnailStore(THUMBNAIL_DIR)
 
-    for res in results:  # Load images into list
-        with open(res.metadata['image_path'], "rb") as f:
-            img = BytesIO(f.read())
-            results_images.append(img)
+    for image_path in results:  # Load thumbnails into list
+        results_images.append(BytesIO(thumbnails.get(image_path)))
    
     return results_images
 # Streamlit application
@@ -121,9 +230,14 @@ footer {visibility: hidden;}
 
 st.title("Image Search Web App")  # page title
 
+with st.sidebar.expander("AWS calls"):
+    st.table(call_stats())
+
 if 'vector_index' not in st.session_state:  # see if the vector index hasn't been created yet
     with st.spinner("Indexing images..."):  # show a spinner while the code in this with block runs
-        st.session_state.vector_index = get_index()  # retrieve the index through the supporting library and store in the app's session cache
+        st.session_state.vector_index = get_shared_index()  # retrieve the process-wide index and store it in the app's session cache
+        if st.session_state.vector_index is None:
+            get_shared_index.clear()  # don't keep a failed build for other sessions
 
 search_images_tab, find_similar_images_tab = st.tabs(["Image search", "Find similar images"])
 with search_images_tab:
@@ -0,0 +1,2 @@
+# Helpers shared by the apps in this repository. Each app adds the repository root to
+# sys.path before importing from here.
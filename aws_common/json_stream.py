@@ -0,0 +1,100 @@
+import re
+import json
+from json import JSONDecoder
+
+# Streaming readers for JSON Lines files and JSON array files.
+#
+# Records are yielded one at a time with the byte offset just past each of them, so
+# memory stays flat for files of any size and a reader can resume from a saved offset.
+
+READ_CHUNK = 1 << 20
+NUMBER_TAIL = re.compile(r"[0-9.eE+-]*\Z")  # what a number cut off by the chunk may still continue with
+
+
+# Yields (record, end_offset) for every complete record after start_offset. end_offset
+# is the byte position just past the record, so reading can resume from it later.
+# A JSON Lines file without a final newline is treated as still being written unless
+# complete is set, in which case its last line is read as well.
+def iter_json_records(path, start_offset=0, complete=False):
+    with open(path, "rb") as f:
+        head = f.read(64)
+        bracket = len(head) - len(head.lstrip())  # offset of the opening "[" of an array file
+        is_array = head[bracket:bracket + 1] == b"["
+        f.seek(start_offset)
+        if is_array:
+            yield from _iter_array(f, start_offset, opened=start_offset > bracket)
+        else:
+            yield from _iter_lines(f, start_offset, complete)
+
+
+def _iter_lines(f, offset, complete=False):
+    for line in f:
+        if not line.endswith(b"\n") and not complete:
+            return  # partial line still being written, picked up on the next read
+        offset += len(line)
+        line = line.strip()
+        if line:
+            yield json.loads(line), offset
+
+
+# Decodes a buffer that may end part way through a multi-byte character
+def _decode_complete(buffer):
+    try:
+        return buffer.decode("utf-8")
+    except UnicodeDecodeError as e:
+        if e.start < len(buffer) - 3:
+            raise
+        return buffer[:e.start].decode("utf-8")
+
+
+# True when a decode error can be explained by the text stopping early: a string still
+# open, or an error at (or a few characters before, inside a literal such as "fals") the
+# end of the buffer. Anything else is malformed input.
+def _is_cut_off(error, text):
+    return error.msg.startswith("Unterminated string") or len(text) - error.pos <= 8
+
+
+# Yields the elements of the top-level array; opened is set when resuming after its "[".
+# Nested arrays are elements like any other and are left to raw_decode.
+def _iter_array(f, offset, opened=False):
+    decoder = JSONDecoder()
+    buffer = b""
+    while True:
+        chunk = f.read(READ_CHUNK)
+        more = bool(chunk)  # more data may still complete a cut-off element
+        buffer += chunk
+        text = _decode_complete(buffer)
+        position = 0
+        consumed = 0  # bytes of buffer up to position
+        while True:
+            # Skip the (ASCII) separators between array elements
+            start = position
+            while position < len(text) and text[position] in " \t\r\n,":
+                position += 1
+            consumed += position - start
+            if position >= len(text):
+                break
+            if not opened:
+                if text[position] != "[":
+                    raise json.JSONDecodeError("Expecting '['", text, position)
+                opened = True
+                position += 1
+                consumed += 1
+                continue
+            if text[position] == "]":
+                return
+            try:
+                record, end = decoder.raw_decode(text, position)
+            except json.JSONDecodeError as error:
+                if more and _is_cut_off(error, text):
+                    break  # element cut off at the end of the chunk
+                raise
+            if more and NUMBER_TAIL.match(text, end):
+                break  # a number like 12 or 1e may continue in the next chunk
+            consumed += len(text[position:end].encode("utf-8"))
+            position = end
+            yield record, offset + consumed
+        offset += consumed
+        buffer = buffer[consumed:]
+        if not more:
+            raise json.JSONDecodeError("Unterminated array", text, position)
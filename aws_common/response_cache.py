@@ -0,0 +1,100 @@
+import json
+import time
+import sqlite3
+import hashlib
+import threading
+import unicodedata
+from collections import OrderedDict
+
+# LLM response cache keyed by model id, model parameters and normalized input.
+#
+# Entries live in an in-process LRU with a TTL, optionally backed by a SQLite file so
+# they survive restarts and are shared by processes on the same host. A repeated input
+# is answered from memory without a Bedrock round-trip.
+
+
+# Collapses whitespace and case so trivially different inputs share an entry
+def normalize_text(text, casefold=True):
+    text = unicodedata.normalize("NFC", str(text))
+    text = " ".join(text.split())
+    return text.casefold() if casefold else text
+
+
+def make_key(model_id, params, text, casefold=True):
+    payload = json.dumps([model_id, params, normalize_text(text, casefold)], sort_keys=True, default=str)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class ResponseCache:
+    def __init__(self, max_entries=1024, ttl_seconds=3600, path=None):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.entries = OrderedDict()  # key -> (expires_at, value)
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.db = None
+        if path:
+            self.db = sqlite3.connect(path, check_same_thread=False)
+            self.db.execute("CREATE TABLE IF NOT EXISTS responses (key TEXT PRIMARY KEY, value TEXT, expires_at REAL)")
+            self.db.commit()
+
+    def get(self, key):
+        now = time.time()
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is not None and entry[0] > now:
+                self.entries.move_to_end(key)
+                self.hits += 1
+                return entry[1]
+            if entry is not None:
+                del self.entries[key]
+
+            if self.db is not None:
+                row = self.db.execute(
+                    "SELECT value, expires_at FROM responses WHERE key = ? AND expires_at > ?", (key, now)
+                ).fetchone()
+                if row is not None:
+                    value = json.loads(row[0])
+                    self._remember(key, value, row[1])
+                    self.hits += 1
+                    return value
+
+            self.misses += 1
+            return None
+
+    def put(self, key, value):
+        expires_at = time.time() + self.ttl_seconds
+        with self.lock:
+            self._remember(key, value, expires_at)
+            if self.db is not None:
+                self.db.execute(
+                    "INSERT OR REPLACE INTO responses (key, value, expires_at) VALUES (?, ?, ?)",
+                    (key, json.dumps(value), expires_at)
+                )
+                self.db.execute("DELETE FROM responses WHERE expires_at <= ?", (time.time(),))
+                self.db.commit()
+
+    def _remember(self, key, value, expires_at):
+        self.entries[key] = (expires_at, value)
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.max_entries:
+            self.entries.popitem(last=False)
+
+    # Returns the cached response for (model_id, params, text), calling fn() on a miss
+    def get_or_call(self, model_id, params, text, fn):
+        key = make_key(model_id, params, text)
+        value = self.get(key)
+        if value is None:
+            value = fn()
+            self.put(key, value)
+        return value
+
+    def stats(self):
+        total = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / total if total else 0.0,
+            "entries": len(self.entries),
+        }
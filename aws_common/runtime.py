@@ -0,0 +1,200 @@
+import os
+import time
+import threading
+from collections import deque
+import boto3
+from botocore.config import Config
+from botocore.exceptions import ClientError
+
+# Process-wide AWS clients shared by every app.
+#
+# One boto3 client per service and configuration, created on first use and shared by all
+# sessions and worker threads (boto3 clients are thread-safe), with a connection pool,
+# timeouts and botocore's adaptive retry mode: exponential backoff with full jitter plus a
+# client-side token bucket that slows every caller down once the service throttles.
+#
+# get_bedrock_runtime() and get_rekognition() return the client wrapped in a
+# MeteredClient, which caps the number of concurrent calls per Bedrock model (or per
+# Rekognition operation) and records latency, errors and throttles per call; call_stats()
+# reports them. Everything is tuned through environment variables:
+#
+#   AWS_MAX_POOL_CONNECTIONS  connections per client (50)
+#   AWS_MAX_ATTEMPTS          retries per call after the first attempt (8)
+#   AWS_RETRY_MODE            adaptive, standard or legacy (adaptive)
+#   AWS_CONNECT_TIMEOUT       seconds (5)
+#   AWS_READ_TIMEOUT          seconds (120)
+#   AWS_MAX_CONCURRENCY       concurrent calls per model or operation (16)
+#   BEDROCK_ENDPOINT_URL      alternative bedrock-runtime endpoint, e.g. a local stub
+
+MAX_POOL_CONNECTIONS = int(os.getenv("AWS_MAX_POOL_CONNECTIONS", "50"))
+MAX_ATTEMPTS = int(os.getenv("AWS_MAX_ATTEMPTS", "8"))
+RETRY_MODE = os.getenv("AWS_RETRY_MODE", "adaptive")
+CONNECT_TIMEOUT = float(os.getenv("AWS_CONNECT_TIMEOUT", "5"))
+READ_TIMEOUT = float(os.getenv("AWS_READ_TIMEOUT", "120"))
+MAX_CONCURRENCY = int(os.getenv("AWS_MAX_CONCURRENCY", "16"))
+BEDROCK_ENDPOINT_URL = os.getenv("BEDROCK_ENDPOINT_URL")
+# Errors that mean "slow down", including Bedrock running out of capacity for a model
+THROTTLE_CODES = {
+    "ThrottlingException", "ThrottledException", "TooManyRequestsException",
+    "ProvisionedThroughputExceededException", "RequestLimitExceeded",
+    "ServiceUnavailableException", "ModelNotReadyException",
+}
+LATENCY_WINDOW = 1024  # recent latencies kept per key for percentiles
+
+_clients = {}
+_clients_lock = threading.Lock()
+_semaphores = {}
+_limits = {}
+_semaphores_lock = threading.Lock()
+_current = threading.local()  # key of the metered call running on this thread
+
+
+def default_region():
+    return os.getenv("AWS_DEFAULT_REGION") or os.getenv("AWS_REGION") or "us-east-1"
+
+
+class CallStats:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.calls = 0
+        self.errors = 0
+        self.throttles = 0  # throttled attempts, whether retried or not
+        self.total_ms = 0.0
+        self.latencies = deque(maxlen=LATENCY_WINDOW)
+
+    def record(self, latency_ms, error=False):
+        with self.lock:
+            self.calls += 1
+            self.errors += error
+            self.total_ms += latency_ms
+            self.latencies.append(latency_ms)
+
+    def record_throttle(self):
+        with self.lock:
+            self.throttles += 1
+
+    def snapshot(self):
+        with self.lock:
+            latencies = sorted(self.latencies)
+            calls, errors, throttles, total_ms = self.calls, self.errors, self.throttles, self.total_ms
+
+        def percentile(share):
+            return round(latencies[min(len(latencies) - 1, int(share * len(latencies)))], 1) if latencies else None
+
+        return {
+            "calls": calls, "errors": errors, "throttles": throttles,
+            "mean_ms": round(total_ms / calls, 1) if calls else None,
+            "p50_ms": percentile(0.5), "p95_ms": percentile(0.95),
+        }
+
+
+_stats = {}
+_stats_lock = threading.Lock()
+
+
+def _stats_for(key):
+    with _stats_lock:
+        if key not in _stats:
+            _stats[key] = CallStats()
+        return _stats[key]
+
+
+# Per-key counters, e.g. [{"key": "bedrock-runtime:amazon.titan-embed-image-v1", "calls": 12, ...}]
+def call_stats():
+    with _stats_lock:
+        items = sorted(_stats.items())
+    return [dict(key=key, **stats.snapshot()) for key, stats in items]
+
+
+# Overrides the concurrency cap of one model id (or "service:Operation" key) before its first call
+def set_max_concurrency(key, limit):
+    with _semaphores_lock:
+        _limits[key] = limit
+        _semaphores.pop(key, None)
+
+
+def _semaphore(key):
+    with _semaphores_lock:
+        if key not in _semaphores:
+            _semaphores[key] = threading.BoundedSemaphore(_limits.get(key, MAX_CONCURRENCY))
+        return _semaphores[key]
+
+
+def is_throttle(error):
+    return isinstance(error, ClientError) and error.response.get("Error", {}).get("Code") in THROTTLE_CODES
+
+
+# botocore emits needs-retry after every attempt; a throttled attempt is counted against
+# the metered call running on this thread, or against the operation otherwise
+def _on_needs_retry(response=None, event_name="", **kwargs):
+    if response is None:
+        return None
+    code = response[1].get("Error", {}).get("Code")
+    if code in THROTTLE_CODES:
+        service, _, operation = event_name.split(".", 1)[-1].partition(".")
+        _stats_for(getattr(_current, "key", None) or f"{service}:{operation}").record_throttle()
+    return None
+
+
+# Returns the shared boto3 client for a service and configuration
+def get_client(service, region=None, endpoint_url=None, max_pool_connections=None, max_attempts=None,
+               retry_mode=None):
+    region = region or default_region()
+    max_pool_connections = max_pool_connections or MAX_POOL_CONNECTIONS
+    max_attempts = MAX_ATTEMPTS if max_attempts is None else max_attempts
+    retry_mode = retry_mode or RETRY_MODE
+    key = (service, region, endpoint_url, max_pool_connections, max_attempts, retry_mode)
+    with _clients_lock:
+        if key not in _clients:
+            config = Config(
+                max_pool_connections=max_pool_connections,
+                connect_timeout=CONNECT_TIMEOUT,
+                read_timeout=READ_TIMEOUT,
+                retries={"max_attempts": max_attempts, "mode": retry_mode},
+            )
+            client = boto3.client(service, region_name=region, endpoint_url=endpoint_url, config=config)
+            client.meta.events.register("needs-retry", _on_needs_retry)
+            _clients[key] = client
+        return _clients[key]
+
+
+class MeteredClient:
+    """Wraps a boto3 client: each API call waits for a slot of its model (modelId) or
+    operation and is timed. Streaming calls are timed to the start of the stream. Anything
+    else is passed through, so the wrapper can be handed to LangChain as client=."""
+
+    def __init__(self, client):
+        self.client = client
+        self.service = client.meta.service_model.service_name
+
+    def __getattr__(self, name):
+        attribute = getattr(self.client, name)
+        if name not in self.client.meta.method_to_api_mapping:
+            return attribute
+        operation = self.client.meta.method_to_api_mapping[name]
+
+        def call(*args, **kwargs):
+            key = f"{self.service}:{kwargs.get('modelId') or operation}"
+            stats = _stats_for(key)
+            with _semaphore(kwargs.get("modelId") or f"{self.service}:{operation}"):
+                _current.key = key
+                start = time.perf_counter()
+                try:
+                    result = attribute(*args, **kwargs)
+                except Exception as e:
+                    stats.record((time.perf_counter() - start) * 1000, error=True)
+                    raise e
+                finally:
+                    _current.key = None
+            stats.record((time.perf_counter() - start) * 1000)
+            return result
+
+        return call
+
+
+def get_bedrock_runtime(region=None, endpoint_url=None, **config):
+    return MeteredClient(get_client("bedrock-runtime", region, endpoint_url or BEDROCK_ENDPOINT_URL, **config))
+
+
+def get_rekognition(region=None, **config):
+    return MeteredClient(get_client("rekognition", region, **config))
@@ -0,0 +1,97 @@
+import threading
+from collections import OrderedDict
+import numpy as np
+import faiss
+from aws_common.response_cache import normalize_text
+
+# Semantic cache of LLM responses for near-duplicate inputs.
+#
+# Every answered input is embedded and added to a small exact inner-product FAISS index
+# of unit vectors. A new input whose nearest neighbour has a cosine similarity at or
+# above the threshold gets that neighbour's response back without an LLM call. The
+# oldest entries are evicted once max_entries is reached.
+
+
+class SemanticCache:
+    def __init__(self, embed, threshold=0.95, max_entries=10000):
+        self.embed = embed  # text -> list of floats, e.g. BedrockEmbeddings().embed_query
+        self.threshold = threshold
+        self.max_entries = max_entries
+        self.index = None  # created on the first put, once the dimension is known
+        self.entries = OrderedDict()  # id -> (text, response), oldest first
+        self.next_id = 0
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.hit_similarity = 0.0  # sum over hits, for the mean
+        self.last_similarity = None
+
+    # Turns an embedding into the normalized float32 row vector the index stores
+    @staticmethod
+    def to_vector(embedding):
+        vector = np.array(embedding, dtype=np.float32).reshape(1, -1)
+        faiss.normalize_L2(vector)
+        return vector
+
+    # Embeds text after the same whitespace and Unicode normalization as every lookup, so
+    # formatting-only differences land on the same vector; returns the raw embedding
+    def embed_normalized(self, text):
+        return self.embed(normalize_text(text, casefold=False))
+
+    def embed_text(self, text):
+        return self.to_vector(self.embed_normalized(text))
+
+    # Returns (response, similarity) for the closest cached input; response is None when
+    # nothing is similar enough. Pass vector to reuse an embedding computed elsewhere.
+    def lookup(self, text=None, vector=None):
+        if vector is None:
+            vector = self.embed_text(text)
+        with self.lock:
+            similarity, response = None, None
+            if self.index is not None and self.index.ntotal:
+                scores, ids = self.index.search(vector, 1)
+                similarity = float(scores[0][0])
+                if similarity >= self.threshold:
+                    response = self.entries[int(ids[0][0])][1]
+            self.last_similarity = similarity
+            if response is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+                self.hit_similarity += similarity
+            return response, similarity
+
+    def put(self, text, response, vector=None):
+        if vector is None:
+            vector = self.embed_text(text)
+        with self.lock:
+            if self.index is None:
+                self.index = faiss.IndexIDMap2(faiss.IndexFlatIP(vector.shape[1]))
+            entry_id = self.next_id
+            self.next_id += 1
+            self.index.add_with_ids(vector, np.array([entry_id], dtype=np.int64))
+            self.entries[entry_id] = (text, response)
+            if len(self.entries) > self.max_entries:
+                oldest, _ = self.entries.popitem(last=False)
+                self.index.remove_ids(np.array([oldest], dtype=np.int64))
+
+    # Returns (response, hit), calling fn() and caching its result on a miss
+    def get_or_call(self, text, fn):
+        vector = self.embed_text(text)
+        response, _ = self.lookup(vector=vector)
+        if response is not None:
+            return response, True
+        response = fn()
+        self.put(text, response, vector=vector)
+        return response, False
+
+    def stats(self):
+        total = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / total if total else 0.0,
+            "mean_hit_similarity": self.hit_similarity / self.hits if self.hits else None,
+            "last_similarity": self.last_similarity,
+            "entries": len(self.entries),
+        }